@@ -0,0 +1,39 @@
+"""scan rollups"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_scan_rollups"
+down_revision = "0002_masks"
+branch_labels = None
+depends_on = None
+
+
+def _create_rollup(table: str, bucket_type: sa.types.TypeEngine) -> None:
+    op.create_table(
+        table,
+        sa.Column("bucket", bucket_type, nullable=False),
+        sa.Column("code_id", sa.Uuid(), nullable=False),
+        sa.Column("device", sa.String(length=50), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=True),
+        sa.Column("customer_id", sa.Integer(), nullable=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("bucket", "code_id", "device"),
+    )
+    op.create_index(f"ix_{table}_product", table, ["product_id", "bucket"])
+    op.create_index(f"ix_{table}_customer", table, ["customer_id", "bucket"])
+
+
+def upgrade() -> None:
+    _create_rollup("scan_rollups_hourly", sa.DateTime(timezone=True))
+    _create_rollup("scan_rollups_daily", sa.Date())
+    # Backfill từ dữ liệu hiện có: chạy `python -m app.services.scan_rollup --since <ngày>` sau khi
+    # migrate (gom trong Python, không phụ thuộc hàm thời gian riêng của từng database).
+
+
+def downgrade() -> None:
+    for table in ("scan_rollups_daily", "scan_rollups_hourly"):
+        op.drop_index(f"ix_{table}_customer", table_name=table)
+        op.drop_index(f"ix_{table}_product", table_name=table)
+        op.drop_table(table)
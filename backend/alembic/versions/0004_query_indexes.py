@@ -0,0 +1,38 @@
+"""indexes for scan/qr access paths"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "0004_query_indexes"
+down_revision = "0003_scan_rollups"
+branch_labels = None
+depends_on = None
+
+# (tên, bảng, cột) - khớp với ``__table_args__``/``index=True`` của model
+INDEXES = (
+    ("ix_scan_events_code_id_ts", "scan_events", ["code_id", "ts", "id"]),
+    ("ix_scan_events_ts", "scan_events", ["ts", "id"]),
+    ("ix_reuse_history_code_id_ts", "reuse_history", ["code_id", "ts"]),
+    ("ix_qrcodes_active_created_at", "qrcodes", ["active", "created_at"]),
+    ("ix_qrcodes_created_at", "qrcodes", ["created_at"]),
+    ("ix_qrcodes_product_id", "qrcodes", ["product_id"]),
+    ("ix_qrcodes_customer_id", "qrcodes", ["customer_id"]),
+)
+
+
+def upgrade() -> None:
+    postgres = op.get_bind().dialect.name == "postgresql"
+    for name, table, columns in INDEXES:
+        if postgres:
+            # không khoá ghi bảng scan_events đang nhận lượt quét trong lúc tạo index
+            with op.get_context().autocommit_block():
+                op.create_index(
+                    name, table, columns, postgresql_concurrently=True, if_not_exists=True
+                )
+        else:
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
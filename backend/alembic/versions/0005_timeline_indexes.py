@@ -0,0 +1,50 @@
+"""indexes for the paginated per-QR timeline"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "0005_timeline_indexes"
+down_revision = "0004_query_indexes"
+branch_labels = None
+depends_on = None
+
+# (tên, bảng, cột) - khớp với ``__table_args__`` của model
+INDEXES = (
+    # keyset (ts, id) của timeline: thêm id để Postgres không phải sort lại trong cùng một ts
+    ("ix_reuse_history_code_id_ts_id", "reuse_history", ["code_id", "ts", "id"]),
+    ("ix_scan_rollups_hourly_code", "scan_rollups_hourly", ["code_id", "bucket"]),
+    ("ix_scan_rollups_daily_code", "scan_rollups_daily", ["code_id", "bucket"]),
+)
+# được thay bằng ix_reuse_history_code_id_ts_id
+REPLACED = ("ix_reuse_history_code_id_ts", "reuse_history", ["code_id", "ts"])
+
+
+def _create(name: str, table: str, columns: list[str], postgres: bool) -> None:
+    if postgres:
+        with op.get_context().autocommit_block():
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def _drop(name: str, table: str, postgres: bool) -> None:
+    if postgres:
+        with op.get_context().autocommit_block():
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index(name, table_name=table, if_exists=True)
+
+
+def upgrade() -> None:
+    postgres = op.get_bind().dialect.name == "postgresql"
+    for name, table, columns in INDEXES:
+        _create(name, table, columns, postgres)
+    # index mới đã sẵn sàng rồi mới bỏ index cũ
+    _drop(REPLACED[0], REPLACED[1], postgres)
+
+
+def downgrade() -> None:
+    postgres = op.get_bind().dialect.name == "postgresql"
+    _create(*REPLACED, postgres)
+    for name, table, _ in reversed(INDEXES):
+        _drop(name, table, postgres)
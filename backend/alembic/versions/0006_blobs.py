@@ -0,0 +1,26 @@
+"""content-addressed blob store"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_blobs"
+down_revision = "0005_timeline_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blobs",
+        sa.Column("path", sa.String(length=255), primary_key=True),
+        sa.Column("refcount", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_blobs_refcount_updated_at", "blobs", ["refcount", "updated_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_blobs_refcount_updated_at", table_name="blobs")
+    op.drop_table("blobs")
@@ -0,0 +1,60 @@
+"""qrcodes.id and code_id foreign keys as uuid"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007_uuid_columns"
+down_revision = "0006_blobs"
+branch_labels = None
+depends_on = None
+
+# (bảng, cột, tên FK mặc định của Postgres) - 0001 tạo các cột này dạng VARCHAR(36) trong khi model
+# map ``Uuid``: asyncpg gửi tham số ``$1::UUID`` và Postgres không so sánh varchar với uuid
+REFERENCES = (
+    ("scan_events", "code_id", "scan_events_code_id_fkey"),
+    ("reuse_history", "code_id", "reuse_history_code_id_fkey"),
+)
+
+
+def _postgres_alter(target: str) -> None:
+    for table, _, fkey in REFERENCES:
+        op.drop_constraint(fkey, table, type_="foreignkey")
+    for table, column in (("qrcodes", "id"), *((t, c) for t, c, _ in REFERENCES)):
+        cast = f"{column}::uuid" if target == "uuid" else f"{column}::text"
+        op.alter_column(
+            table,
+            column,
+            type_=sa.Uuid() if target == "uuid" else sa.String(length=36),
+            postgresql_using=cast,
+        )
+    for table, column, fkey in REFERENCES:
+        op.create_foreign_key(fkey, table, "qrcodes", [column], ["id"])
+
+
+def _sqlite_rewrite(strip_dashes: bool) -> None:
+    # SQLite không có kiểu uuid: ``Uuid`` lưu 32 ký tự hex không gạch ngang
+    for table, column in (("qrcodes", "id"), *((t, c) for t, c, _ in REFERENCES)):
+        if strip_dashes:
+            value = f"lower(replace({column}, '-', ''))"
+        else:
+            value = (
+                f"substr({column}, 1, 8) || '-' || substr({column}, 9, 4) || '-' || "
+                f"substr({column}, 13, 4) || '-' || substr({column}, 17, 4) || '-' || "
+                f"substr({column}, 21)"
+            )
+        op.execute(f"UPDATE {table} SET {column} = {value} WHERE {column} IS NOT NULL")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        _postgres_alter("uuid")
+    else:
+        _sqlite_rewrite(strip_dashes=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        _postgres_alter("varchar")
+    else:
+        _sqlite_rewrite(strip_dashes=False)
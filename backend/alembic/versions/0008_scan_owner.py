@@ -0,0 +1,58 @@
+"""scan owner at scan time, owner in rollup primary key"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008_scan_owner"
+down_revision = "0007_uuid_columns"
+branch_labels = None
+depends_on = None
+
+ROLLUPS = ("scan_rollups_hourly", "scan_rollups_daily")
+KEY = ("bucket", "code_id", "device")
+OWNER_COLUMNS = ("product_id", "customer_id")
+
+
+def _drop_primary_key(batch, table: str) -> None:
+    # SQLite: khoá chính không có tên, ``create_primary_key`` trong batch tự thay khoá cũ
+    if op.get_bind().dialect.name == "postgresql":
+        batch.drop_constraint(f"{table}_pkey", type_="primary")
+
+
+def upgrade() -> None:
+    for column in OWNER_COLUMNS:
+        op.add_column("scan_events", sa.Column(column, sa.Integer(), nullable=True))
+        # lịch sử trước migration không biết chủ sở hữu lúc quét: lấy chủ sở hữu hiện tại
+        op.execute(
+            f"UPDATE scan_events SET {column} = "
+            f"(SELECT qrcodes.{column} FROM qrcodes WHERE qrcodes.id = scan_events.code_id)"
+        )
+    for table in ROLLUPS:
+        for column in OWNER_COLUMNS:
+            op.execute(f"UPDATE {table} SET {column} = 0 WHERE {column} IS NULL")
+        # SQLite không ALTER được PRIMARY KEY: batch dựng lại bảng (khoá mới thay khoá cũ); Postgres
+        # đổi tại chỗ
+        with op.batch_alter_table(table) as batch:
+            _drop_primary_key(batch, table)
+            for column in OWNER_COLUMNS:
+                batch.alter_column(
+                    column, existing_type=sa.Integer(), nullable=False, server_default="0"
+                )
+            batch.create_primary_key(f"{table}_pkey", [*KEY, *OWNER_COLUMNS])
+
+
+def downgrade() -> None:
+    for table in ROLLUPS:
+        # rollup là dữ liệu dẫn xuất và các dòng chỉ khác chủ sở hữu sẽ trùng khoá cũ: xoá rồi chạy
+        # lại `python -m app.services.scan_rollup --since <ngày>` sau khi downgrade
+        op.execute(f"DELETE FROM {table}")
+        with op.batch_alter_table(table) as batch:
+            _drop_primary_key(batch, table)
+            for column in OWNER_COLUMNS:
+                batch.alter_column(
+                    column, existing_type=sa.Integer(), nullable=True, server_default=None
+                )
+            batch.create_primary_key(f"{table}_pkey", list(KEY))
+    for column in OWNER_COLUMNS:
+        op.drop_column("scan_events", column)
@@ -1,38 +1,49 @@
 from __future__ import annotations
 
+from collections.abc import AsyncIterator
 from datetime import datetime
 from typing import Annotated
 
 from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.concurrency import run_in_threadpool
 
 from app.core.config import settings
 from app.core.security import verify_password
-from app.db.session import get_db
+from app.db.session import AsyncSessionLocal
 from app.models.user import User
 
 security = HTTPBearer(auto_error=False)
 
 
-async def get_db_session() -> Session:
-    for db in get_db():
-        return db
+def get_session_factory() -> async_sessionmaker[AsyncSession]:
+    """Factory tạo ``AsyncSession``; route stream dữ liệu dùng trực tiếp để tự quản lý session."""
+    return AsyncSessionLocal
 
 
-def authenticate_user(db: Session, email: str, password: str) -> User | None:
-    user = db.query(User).filter(User.email == email).first()
+async def get_db_session(
+    session_factory: async_sessionmaker[AsyncSession] = Depends(get_session_factory),
+) -> AsyncIterator[AsyncSession]:
+    async with session_factory() as db:
+        yield db
+
+
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> User | None:
+    user = (await db.execute(select(User).where(User.email == email))).scalar_one_or_none()
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    # bcrypt tốn CPU cố ý: chạy trên threadpool để không chặn event loop
+    if not await run_in_threadpool(verify_password, password, user.password_hash):
         return None
     return user
 
 
 async def get_current_user(
     credentials: Annotated[HTTPAuthorizationCredentials | None, Security(security)],
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_db_session),
 ) -> User:
     if credentials is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing credentials")
@@ -47,7 +58,7 @@ async def get_current_user(
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
     except JWTError as exc:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token decode error") from exc
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    user = await db.get(User, int(user_id))
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     return user
@@ -1,3 +1,3 @@
-from . import analytics, auth, customers, products, qrcodes, scans
+from . import analytics, auth, customers, masks, products, qrcodes, scans
 
-__all__ = ["analytics", "auth", "customers", "products", "qrcodes", "scans"]
+__all__ = ["analytics", "auth", "customers", "masks", "products", "qrcodes", "scans"]
@@ -1,99 +1,120 @@
 from __future__ import annotations
 
 import uuid
+from datetime import UTC, datetime, timedelta
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user, get_db_session
 from app.models.product import Product
 from app.models.qrcode import QrCode
-from app.models.reuse_history import ReuseHistory
-from app.models.scan_event import ScanEvent
+from app.models.scan_rollup import ScanRollupDaily
 from app.schemas.analytics import (
     AnalyticsSummaryResponse,
     QrAnalyticsResponse,
-    QrTimelineEntry,
     SummaryStats,
 )
+from app.services.qr_timeline import (
+    BucketUnit,
+    GroupBy,
+    SortOrder,
+    TimelineCursor,
+    bucket_window,
+    scan_total,
+    timeline_buckets,
+    timeline_page,
+)
 
 router = APIRouter()
 
 
+SUMMARY_DAYS = 30
+
+
 @router.get("/summary", response_model=AnalyticsSummaryResponse)
-async def analytics_summary(db: Session = Depends(get_db_session), user=Depends(get_current_user)):
-    total_scans = db.query(func.count(ScanEvent.id)).scalar() or 0
-    scans_today = (
-        db.query(func.count(ScanEvent.id))
-        .filter(func.date(ScanEvent.ts) == func.current_date())
-        .scalar()
-        or 0
+async def analytics_summary(
+    product_id: int | None = None,
+    customer_id: int | None = None,
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
+):
+    """Tổng quan lượt quét, đọc từ rollup ngày (không quét bảng ``scan_events``)."""
+    rollup_filters = []
+    qr_filters = []
+    if product_id is not None:
+        rollup_filters.append(ScanRollupDaily.product_id == product_id)
+        qr_filters.append(QrCode.product_id == product_id)
+    if customer_id is not None:
+        rollup_filters.append(ScanRollupDaily.customer_id == customer_id)
+        qr_filters.append(QrCode.customer_id == customer_id)
+    scan_count = func.coalesce(func.sum(ScanRollupDaily.count), 0)
+    today = datetime.now(UTC).date()
+
+    total_scans = await db.scalar(select(scan_count).where(*rollup_filters))
+    scans_by_day = await db.execute(
+        select(ScanRollupDaily.bucket, scan_count)
+        .where(*rollup_filters, ScanRollupDaily.bucket > today - timedelta(days=SUMMARY_DAYS))
+        .group_by(ScanRollupDaily.bucket)
+        .order_by(ScanRollupDaily.bucket)
     )
-    active_qr = db.query(func.count(QrCode.id)).filter(QrCode.active.is_(True)).scalar() or 0
-    reuse_cycles = db.query(func.coalesce(func.sum(QrCode.reuse_cycle), 0)).scalar() or 0
-    scans_by_day = (
-        db.query(func.date_trunc("day", ScanEvent.ts).label("day"), func.count(ScanEvent.id))
-        .group_by("day")
-        .order_by("day")
-        .limit(30)
-        .all()
+    daily = [{"day": day, "count": count} for day, count in scans_by_day]
+    scans_today = daily[-1]["count"] if daily and daily[-1]["day"] == today else 0
+    active_qr = await db.scalar(
+        select(func.count(QrCode.id)).where(*qr_filters, QrCode.active.is_(True))
+    )
+    reuse_cycles = await db.scalar(
+        select(func.coalesce(func.sum(QrCode.reuse_cycle), 0)).where(*qr_filters)
     )
     return AnalyticsSummaryResponse(
         summary=SummaryStats(
-            total_scans=total_scans,
+            total_scans=total_scans or 0,
             scans_today=scans_today,
-            active_qr=active_qr,
-            reuse_cycles=reuse_cycles,
+            active_qr=active_qr or 0,
+            reuse_cycles=reuse_cycles or 0,
         ),
-        scans_by_day=[{"day": row.day.date(), "count": row[1]} for row in scans_by_day],
+        scans_by_day=daily,
     )
 
 
 @router.get("/qr/{code_id}", response_model=QrAnalyticsResponse)
-async def qr_analytics(code_id: uuid.UUID, db: Session = Depends(get_db_session), user=Depends(get_current_user)):
-    qrcode = db.query(QrCode).filter(QrCode.id == code_id).first()
+async def qr_analytics(
+    code_id: uuid.UUID,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    order: SortOrder = "asc",
+    bucket: BucketUnit | None = None,
+    group_by: GroupBy = "device",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
+):
+    """Timeline của một mã, từng trang ``limit`` sự kiện theo ``cursor``.
+
+    Có ``bucket`` (``hour``/``day``) thì trả về số lượt quét theo bucket và ``group_by`` trong cửa
+    sổ ``[start, end)`` thay cho danh sách sự kiện.
+    """
+    qrcode = await db.get(QrCode, code_id)
     if not qrcode:
         raise HTTPException(status_code=404, detail="QR not found")
     product_name = None
     if qrcode.product_id:
-        product = db.query(Product).filter(Product.id == qrcode.product_id).first()
+        product = await db.get(Product, qrcode.product_id)
         product_name = product.name if product else None
-    scan_events = (
-        db.query(ScanEvent)
-        .filter(ScanEvent.code_id == code_id)
-        .order_by(ScanEvent.ts.asc())
-        .all()
-    )
-    reuse_events = (
-        db.query(ReuseHistory)
-        .filter(ReuseHistory.code_id == code_id)
-        .order_by(ReuseHistory.ts.asc())
-        .all()
-    )
-    timeline: list[QrTimelineEntry] = []
-    for ev in scan_events:
-        timeline.append(
-            QrTimelineEntry(
-                ts=ev.ts,
-                event="scan",
-                reuse_cycle=ev.reuse_cycle_at_scan,
-                meta={"ip": ev.ip, "device": ev.device},
-            )
-        )
-    for ev in reuse_events:
-        timeline.append(
-            QrTimelineEntry(
-                ts=ev.ts,
-                event="reuse_start",
-                reuse_cycle=ev.cycle,
-                meta={"reason": ev.reason, "note": ev.note},
-            )
-        )
-    timeline.sort(key=lambda entry: entry.ts)
+    timeline, next_cursor, buckets = [], None, None
+    if bucket is not None:
+        window_start, window_end = bucket_window(bucket, start, end)
+        buckets = await timeline_buckets(db, code_id, bucket, group_by, window_start, window_end)
+    else:
+        timeline_cursor = TimelineCursor.decode(cursor) if cursor else None
+        timeline, next_cursor = await timeline_page(db, code_id, limit, timeline_cursor, order)
     return QrAnalyticsResponse(
         code_id=str(code_id),
         product_name=product_name,
-        total_scans=len(scan_events),
+        total_scans=await scan_total(db, code_id),
         timeline=timeline,
+        next_cursor=next_cursor,
+        buckets=buckets,
     )
@@ -1,18 +1,23 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import authenticate_user, get_db_session
 from app.core.security import create_access_token
 from app.schemas.auth import LoginRequest, TokenResponse
+from app.utils.rate_limit import rate_limiter
 
 router = APIRouter()
 
 
 @router.post("/login", response_model=TokenResponse)
-async def login(payload: LoginRequest, db: Session = Depends(get_db_session)) -> TokenResponse:
-    user = authenticate_user(db, payload.email, payload.password)
+async def login(
+    payload: LoginRequest, request: Request, db: AsyncSession = Depends(get_db_session)
+) -> TokenResponse:
+    client_ip = request.client.host if request.client else "unknown"
+    await rate_limiter.check("login", ip=client_ip, email=payload.email.lower())
+    user = await authenticate_user(db, payload.email, payload.password)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Sai thông tin đăng nhập")
     token = create_access_token(user.id)
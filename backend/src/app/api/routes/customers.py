@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user, get_db_session
 from app.models.customer import Customer
@@ -11,24 +12,33 @@ router = APIRouter()
 
 
 @router.get("/", response_model=list[CustomerOut])
-async def list_customers(db: Session = Depends(get_db_session), user=Depends(get_current_user)):
-    return db.query(Customer).order_by(Customer.created_at.desc()).all()
+async def list_customers(
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
+):
+    return (await db.scalars(select(Customer).order_by(Customer.created_at.desc()))).all()
 
 
 @router.post("/", response_model=CustomerOut, status_code=status.HTTP_201_CREATED)
 async def create_customer(
-    payload: CustomerCreate, db: Session = Depends(get_db_session), user=Depends(get_current_user)
+    payload: CustomerCreate,
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
 ):
     customer = Customer(**payload.dict())
     db.add(customer)
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await db.refresh(customer)
     return customer
 
 
 @router.get("/{customer_id}", response_model=CustomerOut)
-async def get_customer(customer_id: int, db: Session = Depends(get_db_session), user=Depends(get_current_user)):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+async def get_customer(
+    customer_id: int,
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
+):
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     return customer
@@ -38,25 +48,29 @@ async def get_customer(customer_id: int, db: Session = Depends(get_db_session),
 async def update_customer(
     customer_id: int,
     payload: CustomerUpdate,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_db_session),
     user=Depends(get_current_user),
 ):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(customer, field, value)
     db.add(customer)
-    db.commit()
-    db.refresh(customer)
+    await db.commit()
+    await db.refresh(customer)
     return customer
 
 
 @router.delete("/{customer_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_customer(customer_id: int, db: Session = Depends(get_db_session), user=Depends(get_current_user)):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
+async def delete_customer(
+    customer_id: int,
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
+):
+    customer = await db.get(Customer, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
-    db.delete(customer)
-    db.commit()
+    await db.delete(customer)
+    await db.commit()
     return None
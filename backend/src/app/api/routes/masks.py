@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, File, Form, UploadFile, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_current_user, get_db_session
+from app.models.mask import MaskAsset
+from app.schemas.mask import MaskOut
+from app.services.mask_library import build_mask_response, create_mask, delete_mask, get_mask
+
+router = APIRouter()
+
+
+@router.get("/", response_model=list[MaskOut])
+async def list_masks(db: AsyncSession = Depends(get_db_session), user=Depends(get_current_user)):
+    masks = (await db.scalars(select(MaskAsset).order_by(MaskAsset.created_at.desc()))).all()
+    return [await build_mask_response(mask) for mask in masks]
+
+
+@router.post("/", response_model=MaskOut, status_code=status.HTTP_201_CREATED)
+async def upload_mask(
+    name: str = Form(...),
+    threshold: int | None = Form(None, ge=1, le=255),
+    image: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
+):
+    data = await image.read()
+    mask = await create_mask(db, name=name, data=data, threshold=threshold)
+    return await build_mask_response(mask)
+
+
+@router.get("/{mask_id}", response_model=MaskOut)
+async def get_mask_detail(
+    mask_id: int,
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
+):
+    return await build_mask_response(await get_mask(db, mask_id))
+
+
+@router.delete("/{mask_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_mask(
+    mask_id: int,
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
+):
+    await delete_mask(db, mask_id)
+    return None
@@ -1,34 +1,42 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user, get_db_session
 from app.models.product import Product
 from app.schemas.product import ProductCreate, ProductOut, ProductUpdate
+from app.services.scan_lookup import scan_lookup
 
 router = APIRouter()
 
 
 @router.get("/", response_model=list[ProductOut])
-async def list_products(db: Session = Depends(get_db_session), user=Depends(get_current_user)):
-    return db.query(Product).order_by(Product.created_at.desc()).all()
+async def list_products(db: AsyncSession = Depends(get_db_session), user=Depends(get_current_user)):
+    return (await db.scalars(select(Product).order_by(Product.created_at.desc()))).all()
 
 
 @router.post("/", response_model=ProductOut, status_code=status.HTTP_201_CREATED)
 async def create_product(
-    payload: ProductCreate, db: Session = Depends(get_db_session), user=Depends(get_current_user)
+    payload: ProductCreate,
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
 ):
     product = Product(**payload.dict())
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    await db.commit()
+    await db.refresh(product)
     return product
 
 
 @router.get("/{product_id}", response_model=ProductOut)
-async def get_product(product_id: int, db: Session = Depends(get_db_session), user=Depends(get_current_user)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+async def get_product(
+    product_id: int,
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
+):
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
@@ -38,25 +46,31 @@ async def get_product(product_id: int, db: Session = Depends(get_db_session), us
 async def update_product(
     product_id: int,
     payload: ProductUpdate,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_db_session),
     user=Depends(get_current_user),
 ):
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(product, field, value)
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    await db.commit()
+    await scan_lookup.invalidate_product(product_id)
+    await db.refresh(product)
     return product
 
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_product(product_id: int, db: Session = Depends(get_db_session), user=Depends(get_current_user)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+async def delete_product(
+    product_id: int,
+    db: AsyncSession = Depends(get_db_session),
+    user=Depends(get_current_user),
+):
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    db.delete(product)
-    db.commit()
+    await db.delete(product)
+    await db.commit()
+    await scan_lookup.invalidate_product(product_id)
     return None
@@ -3,16 +3,35 @@ from __future__ import annotations
 import json
 import uuid
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
-from sqlalchemy import String, cast
-from sqlalchemy.orm import Session
-
-from app.api.deps import get_current_user, get_db_session
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, UploadFile, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError, parse_obj_as
+from sqlalchemy import String, cast, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.deps import get_current_user, get_db_session, get_session_factory
+from app.core.config import settings
 from app.models.qrcode import QrCode
 from app.models.reuse_history import ReuseHistory
-from app.schemas.qrcode import QrOptions, QrOut, QrUpdateRequest, ReuseHistoryOut, ReuseStartRequest
-from app.services.qr_service import build_qr_response, create_qrcode, start_reuse_cycle
+from app.schemas.qrcode import (
+    QrBulkItem,
+    QrOptions,
+    QrOut,
+    QrUpdateRequest,
+    ReuseHistoryOut,
+    ReuseStartRequest,
+)
+from app.services.mask_library import get_mask
+from app.services.qr_service import (
+    build_qr_response,
+    create_qrcode_async,
+    create_qrcodes_bulk,
+    start_reuse_cycle,
+)
+from app.services.render_pool import render_pool
+from app.services.scan_lookup import scan_lookup
 from app.utils.qr_renderer import decode_qr_image
+from app.utils.rate_limit import rate_limiter
 
 router = APIRouter()
 
@@ -24,17 +43,22 @@ async def generate_qrcode(
     customer_id: int | None = Form(None),
     reuse_allowed: bool = Form(False),
     options: str | None = Form(None),
+    mask_id: int | None = Form(
+        None, description="Mask trong thư viện /masks (thay cho mask_image)"
+    ),
     mask_image: UploadFile | None = File(None),
     logo_image: UploadFile | None = File(None),
-    db: Session = Depends(get_db_session),
+    x_render_profile: bool = Header(False),
+    db: AsyncSession = Depends(get_db_session),
     user=Depends(get_current_user),
 ):
+    await rate_limiter.check("generate_qrcode", user=user.id)
     options_obj = QrOptions.parse_raw(options) if options else QrOptions()
     try:
         payload = json.loads(data)
     except json.JSONDecodeError:
         payload = data
-    qrcode = create_qrcode(
+    qrcode = await create_qrcode_async(
         db,
         product_id=product_id,
         customer_id=customer_id,
@@ -43,74 +67,139 @@ async def generate_qrcode(
         options=options_obj,
         mask_file=mask_image,
         logo_file=logo_image,
+        mask_id=mask_id,
+        profile=x_render_profile and settings.render_profiling_enabled,
     )
-    return build_qr_response(qrcode)
+    return await build_qr_response(qrcode)
+
+
+@router.post("/generate/bulk")
+async def generate_qrcodes_bulk(
+    items: str = Form(
+        ..., description="JSON list các phần tử {data, product_id, customer_id, reuse_allowed}"
+    ),
+    options: str | None = Form(None),
+    mask_id: int | None = Form(
+        None, description="Mask trong thư viện /masks (thay cho mask_image)"
+    ),
+    mask_image: UploadFile | None = File(None),
+    logo_image: UploadFile | None = File(None),
+    db: AsyncSession = Depends(get_db_session),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(get_session_factory),
+    user=Depends(get_current_user),
+):
+    options_obj = QrOptions.parse_raw(options) if options else QrOptions()
+    try:
+        parsed_items = parse_obj_as(list[QrBulkItem], json.loads(items))
+    except (json.JSONDecodeError, ValidationError) as exc:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)
+        ) from exc
+    if not parsed_items:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Danh sách rỗng"
+        )
+    if len(parsed_items) > settings.bulk_generate_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Tối đa {settings.bulk_generate_max_items} mã mỗi lô",
+        )
+    # mỗi mã trong lô tính một lượt; pool đang đầy thì trả 503 như /generate thay vì xếp lô phía sau
+    await rate_limiter.check("generate_qrcode_bulk", cost=len(parsed_items), user=user.id)
+    if render_pool.full:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Hàng đợi render QR đang đầy, vui lòng thử lại sau",
+            headers={"Retry-After": "1"},
+        )
+
+    if mask_id is not None:
+        # kiểm tra trước để mask không tồn tại trả 404 thay vì lỗi giữa stream
+        await get_mask(db, mask_id)
+    # Đọc file trước khi trả StreamingResponse: UploadFile không còn dùng được khi body đang stream
+    mask_bytes = await mask_image.read() if mask_image else None
+    logo_bytes = await logo_image.read() if logo_image else None
+
+    async def stream():
+        # session của dependency đã đóng khi body bắt đầu stream -> mở session riêng
+        async with session_factory() as stream_db:
+            async for event in create_qrcodes_bulk(
+                stream_db,
+                items=parsed_items,
+                options=options_obj,
+                mask_bytes=mask_bytes,
+                logo_bytes=logo_bytes,
+                mask_id=mask_id,
+            ):
+                yield json.dumps(event) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 @router.get("/", response_model=list[QrOut])
 async def list_qrcodes(
     query: str | None = None,
     active: bool | None = None,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_db_session),
     user=Depends(get_current_user),
 ):
-    qs = db.query(QrCode)
+    qs = select(QrCode)
     if query:
-        qs = qs.filter(cast(QrCode.id, String).ilike(f"%{query}%"))
+        qs = qs.where(cast(QrCode.id, String).ilike(f"%{query}%"))
     if active is not None:
-        qs = qs.filter(QrCode.active == active)
-    qrcodes = qs.order_by(QrCode.created_at.desc()).limit(100).all()
-    return [build_qr_response(qr) for qr in qrcodes]
+        qs = qs.where(QrCode.active == active)
+    qrcodes = await db.scalars(qs.order_by(QrCode.created_at.desc()).limit(100))
+    return [await build_qr_response(qr) for qr in qrcodes]
 
 
 @router.get("/{code_id}", response_model=QrOut)
-async def get_qrcode(code_id: uuid.UUID, db: Session = Depends(get_db_session), user=Depends(get_current_user)):
-    qrcode = db.query(QrCode).filter(QrCode.id == code_id).first()
+async def get_qrcode(
+    code_id: uuid.UUID, db: AsyncSession = Depends(get_db_session), user=Depends(get_current_user)
+):
+    qrcode = await db.get(QrCode, code_id)
     if not qrcode:
         raise HTTPException(status_code=404, detail="QR not found")
-    return build_qr_response(qrcode)
+    return await build_qr_response(qrcode)
 
 
 @router.patch("/{code_id}", response_model=QrOut)
 async def update_qrcode(
     code_id: uuid.UUID,
     payload: QrUpdateRequest,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_db_session),
     user=Depends(get_current_user),
 ):
-    qrcode = db.query(QrCode).filter(QrCode.id == code_id).first()
+    qrcode = await db.get(QrCode, code_id)
     if not qrcode:
         raise HTTPException(status_code=404, detail="QR not found")
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(qrcode, field, value)
     db.add(qrcode)
-    db.commit()
-    db.refresh(qrcode)
-    return build_qr_response(qrcode)
+    await db.commit()
+    await scan_lookup.invalidate_code(code_id)
+    await db.refresh(qrcode)
+    return await build_qr_response(qrcode)
 
 
 @router.post("/{code_id}/reuse/start", response_model=QrOut)
 async def start_reuse(
     code_id: uuid.UUID,
     payload: ReuseStartRequest,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_db_session),
     user=Depends(get_current_user),
 ):
-    qrcode = start_reuse_cycle(db, code_id, payload.reason, payload.note)
-    return build_qr_response(qrcode)
+    qrcode = await start_reuse_cycle(db, code_id, payload.reason, payload.note)
+    return await build_qr_response(qrcode)
 
 
 @router.get("/{code_id}/reuse/history", response_model=list[ReuseHistoryOut])
 async def reuse_history(
-    code_id: uuid.UUID, db: Session = Depends(get_db_session), user=Depends(get_current_user)
+    code_id: uuid.UUID, db: AsyncSession = Depends(get_db_session), user=Depends(get_current_user)
 ):
-    history = (
-        db.query(ReuseHistory)
-        .filter(ReuseHistory.code_id == code_id)
-        .order_by(ReuseHistory.ts.desc())
-        .all()
+    history = await db.scalars(
+        select(ReuseHistory).where(ReuseHistory.code_id == code_id).order_by(ReuseHistory.ts.desc())
     )
-    return history
+    return history.all()
 
 
 @router.post("/test-decode", response_model=dict)
@@ -1,19 +1,28 @@
 from __future__ import annotations
 
-import csv
-import io
 import uuid
-from datetime import datetime
+from datetime import UTC, datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
 from fastapi.responses import HTMLResponse, StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app.api.deps import get_current_user, get_db_session
-from app.models.product import Product
-from app.models.qrcode import QrCode
+from app.api.deps import get_current_user, get_db_session, get_session_factory
+from app.core.config import settings
 from app.models.scan_event import ScanEvent
 from app.schemas.scan import ScanCreateResponse, ScanEventOut
+from app.services.scan_export import (
+    EXPORT_FORMATS,
+    check_resume_point,
+    export_query,
+    gzip_chunks,
+    iter_row_batches,
+    require_pyarrow,
+)
+from app.services.scan_ingest import scan_ingestor
+from app.services.scan_lookup import scan_lookup
+from app.services.scan_rollup import rollup_writes
 from app.utils.rate_limit import rate_limiter
 
 router = APIRouter()
@@ -48,46 +57,48 @@ def _approx_geo_from_headers(headers) -> str | None:
 async def register_scan(
     request: Request,
     code_id: uuid.UUID = Query(..., description="Mã QR"),
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_db_session),
 ):
     client_ip = request.client.host if request.client else "unknown"
-    rate_limiter.check(f"{client_ip}:{code_id}")
-    qrcode = db.query(QrCode).filter(QrCode.id == code_id, QrCode.active.is_(True)).first()
-    if not qrcode:
+    await rate_limiter.check("scan", ip=client_ip, code_id=code_id)
+    qrcode = await scan_lookup.get(db, code_id)
+    if not qrcode or not qrcode.active:
         raise HTTPException(status_code=404, detail="QR không tồn tại hoặc đã tắt")
     user_agent = request.headers.get("user-agent")
-    event = ScanEvent(
-        code_id=qrcode.id,
-        ip=client_ip,
-        user_agent=user_agent,
-        referer=request.headers.get("referer"),
-        approx_geo=_approx_geo_from_headers(request.headers),
-        device=_detect_device(user_agent),
-        reuse_cycle_at_scan=qrcode.reuse_cycle,
-    )
-    db.add(event)
-    db.commit()
-    db.refresh(event)
-    product_name = None
-    if qrcode.product_id:
-        product = db.query(Product).filter(Product.id == qrcode.product_id).first()
-        product_name = product.name if product else None
+    event = {
+        "code_id": qrcode.code_id,
+        "ip": client_ip,
+        "user_agent": user_agent,
+        "referer": request.headers.get("referer"),
+        "approx_geo": _approx_geo_from_headers(request.headers),
+        "device": _detect_device(user_agent),
+        "reuse_cycle_at_scan": qrcode.reuse_cycle,
+        "ts": datetime.now(UTC),
+        # chủ sở hữu lúc quét: lượt quét không đổi chủ khi mã được gán lại
+        "product_id": qrcode.product_id,
+        "customer_id": qrcode.customer_id,
+    }
+    if settings.scan_ingest_mode == "sync":
+        db.add(ScanEvent(**event))
+        for statement, params in rollup_writes(db.get_bind().dialect.name, [event]):
+            await db.execute(statement, params)
+        await db.commit()
+    else:
+        # write-behind: trả về ngay khi event đã vào buffer, thread nền ghi theo lô
+        await scan_ingestor.enqueue(event)
     return ScanCreateResponse(
         message="Đã ghi nhận lượt quét",
-        product_name=product_name,
+        product_name=qrcode.product_name,
         reuse_cycle=qrcode.reuse_cycle,
     )
 
 
 @router.get("/scan/{code_id}", response_class=HTMLResponse)
-async def scan_page(code_id: uuid.UUID, db: Session = Depends(get_db_session)):
-    qrcode = db.query(QrCode).filter(QrCode.id == code_id).first()
+async def scan_page(code_id: uuid.UUID, db: AsyncSession = Depends(get_db_session)):
+    qrcode = await scan_lookup.get(db, code_id)
     if not qrcode:
         raise HTTPException(status_code=404, detail="QR không tồn tại")
-    product_name = None
-    if qrcode.product_id:
-        product = db.query(Product).filter(Product.id == qrcode.product_id).first()
-        product_name = product.name if product else None
+    product_name = qrcode.product_name
     html = f"""
     <html>
     <head><title>QR Info</title></head>
@@ -108,39 +119,47 @@ async def list_scans(
     code_id: uuid.UUID | None = None,
     start: datetime | None = None,
     end: datetime | None = None,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_db_session),
     user=Depends(get_current_user),
 ):
-    qs = db.query(ScanEvent)
+    qs = select(ScanEvent)
     if code_id:
-        qs = qs.filter(ScanEvent.code_id == code_id)
+        qs = qs.where(ScanEvent.code_id == code_id)
     if start:
-        qs = qs.filter(ScanEvent.ts >= start)
+        qs = qs.where(ScanEvent.ts >= start)
     if end:
-        qs = qs.filter(ScanEvent.ts <= end)
-    return qs.order_by(ScanEvent.ts.desc()).limit(500).all()
+        qs = qs.where(ScanEvent.ts <= end)
+    return (await db.scalars(qs.order_by(ScanEvent.ts.desc()).limit(500))).all()
 
 
-@router.get("/export/scans.csv")
+@router.get("/export/scans.{export_format}")
 async def export_scans(
+    request: Request,
+    export_format: str = Path(..., description="csv, ndjson, arrow (IPC stream) hoặc parquet"),
     code_id: uuid.UUID | None = None,
     start: datetime | None = None,
     end: datetime | None = None,
-    db: Session = Depends(get_db_session),
+    resume_after: int | None = Query(None, description="id dòng cuối đã nhận, xuất tiếp sau nó"),
+    db: AsyncSession = Depends(get_db_session),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(get_session_factory),
     user=Depends(get_current_user),
 ):
-    qs = db.query(ScanEvent)
-    if code_id:
-        qs = qs.filter(ScanEvent.code_id == code_id)
-    if start:
-        qs = qs.filter(ScanEvent.ts >= start)
-    if end:
-        qs = qs.filter(ScanEvent.ts <= end)
-    events = qs.order_by(ScanEvent.ts.desc()).all()
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow(["id", "code_id", "ts", "ip", "device", "approx_geo"])
-    for ev in events:
-        writer.writerow([ev.id, ev.code_id, ev.ts.isoformat(), ev.ip, ev.device, ev.approx_geo])
-    buffer.seek(0)
-    return StreamingResponse(iter([buffer.getvalue()]), media_type="text/csv")
+    export = EXPORT_FORMATS.get(export_format)
+    if export is None:
+        raise HTTPException(status_code=404, detail="Định dạng export không hỗ trợ")
+    if export.needs_pyarrow:
+        require_pyarrow()
+    if resume_after is not None:
+        await check_resume_point(db, resume_after)
+    query = export_query(code_id, start, end, resume_after)
+    # generator tự mở session: session của dependency đã đóng khi body bắt đầu stream
+    batches = iter_row_batches(session_factory, query, settings.export_fetch_size)
+    chunks = export.encoder(batches, header=resume_after is None)
+    headers = {
+        "Content-Disposition": f'attachment; filename="scans.{export_format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if export.gzip and "gzip" in request.headers.get("accept-encoding", "").lower():
+        chunks = gzip_chunks(chunks, settings.export_gzip_level)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=export.media_type, headers=headers)
@@ -1,9 +1,10 @@
 """Cấu hình ứng dụng sử dụng Pydantic Settings."""
 from __future__ import annotations
 
+import tempfile
 from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import Any, Literal
 
 from pydantic import BaseSettings, Field, PostgresDsn, RedisDsn, validator
 
@@ -19,6 +20,14 @@ class Settings(BaseSettings):
     database_url: PostgresDsn = Field(
         default="postgresql+psycopg2://postgres:postgres@db:5432/qr", env="DATABASE_URL"
     )
+    # URL cho engine async; bỏ trống thì suy ra từ database_url (psycopg2 -> asyncpg)
+    async_database_url: str | None = Field(default=None, env="ASYNC_DATABASE_URL")
+    db_pool_size: int = Field(default=10, ge=1, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=20, ge=0, env="DB_MAX_OVERFLOW")
+    db_pool_timeout: float = Field(default=30, gt=0, env="DB_POOL_TIMEOUT")
+    db_pool_recycle: int = Field(default=1800, env="DB_POOL_RECYCLE")
+    # Số prepared statement asyncpg giữ trên mỗi connection (0 = tắt, cần khi đi qua pgbouncer)
+    db_statement_cache_size: int = Field(default=100, ge=0, env="DB_STATEMENT_CACHE_SIZE")
     redis_url: RedisDsn = Field(default="redis://redis:6379/0", env="REDIS_URL")
 
     jwt_secret_key: str = Field(default="super-secret-key", min_length=16, env="JWT_SECRET")
@@ -28,14 +37,140 @@ class Settings(BaseSettings):
     cors_origins: list[str] = Field(default_factory=lambda: ["*"])
 
     upload_dir: Path = Field(default_factory=lambda: Path("/data/uploads"))
+    # Nơi lưu ảnh QR/mask/logo: "local" (upload_dir, phục vụ qua /static) hoặc "s3" (S3/MinIO)
+    storage_backend: Literal["local", "s3"] = Field(default="local", env="STORAGE_BACKEND")
+    s3_endpoint: str = Field(default="http://minio:9000", env="S3_ENDPOINT")
+    # Host client dùng để tải ảnh (CDN, domain public của MinIO); bỏ trống = s3_endpoint
+    s3_public_endpoint: str | None = Field(default=None, env="S3_PUBLIC_ENDPOINT")
+    s3_bucket: str = Field(default="qr-uploads", env="S3_BUCKET")
+    s3_region: str = Field(default="us-east-1", env="S3_REGION")
+    s3_access_key: str = Field(default="", env="S3_ACCESS_KEY")
+    s3_secret_key: str = Field(default="", env="S3_SECRET_KEY")
+    s3_presign_expires_seconds: int = Field(
+        default=3600, ge=1, le=7 * 24 * 3600, env="S3_PRESIGN_EXPIRES_SECONDS"
+    )
+    # File từ ngưỡng này trở lên được tải lên bằng multipart, mỗi part part_size MiB (tối thiểu 5)
+    s3_multipart_threshold_mb: int = Field(default=16, ge=5, env="S3_MULTIPART_THRESHOLD_MB")
+    s3_multipart_part_size_mb: int = Field(default=8, ge=5, env="S3_MULTIPART_PART_SIZE_MB")
+    s3_max_concurrency: int = Field(default=4, ge=1, env="S3_MAX_CONCURRENCY")
+    # Blob theo nội dung: số hash mỗi process nhớ là đã có trong storage (bỏ qua upload lại) và
+    # thời gian nhớ (tối đa nửa blob_gc_grace_seconds, giá trị lớn hơn bị cắt xuống)
+    blob_known_max_entries: int = Field(default=10_000, ge=0, env="BLOB_KNOWN_MAX_ENTRIES")
+    blob_known_ttl_seconds: float = Field(default=600, ge=0, env="BLOB_KNOWN_TTL_SECONDS")
+    # GC chỉ xoá blob đã hết tham chiếu lâu hơn khoảng này (chừa cho request đang tạo QR dở)
+    blob_gc_grace_seconds: int = Field(default=86_400, ge=0, env="BLOB_GC_GRACE_SECONDS")
+    # Policy rate limit theo route (số lượt mỗi phút, 0 = tắt limit đó)
     rate_limit_scan_per_minute: int = Field(default=30, env="RATE_LIMIT_SCAN_PER_MINUTE")
+    rate_limit_scan_ip_per_minute: int = Field(
+        default=300, ge=0, env="RATE_LIMIT_SCAN_IP_PER_MINUTE"
+    )
+    rate_limit_scan_code_per_minute: int = Field(
+        default=6000, ge=0, env="RATE_LIMIT_SCAN_CODE_PER_MINUTE"
+    )
+    rate_limit_login_ip_per_minute: int = Field(
+        default=10, ge=0, env="RATE_LIMIT_LOGIN_IP_PER_MINUTE"
+    )
+    rate_limit_login_email_per_minute: int = Field(
+        default=5, ge=0, env="RATE_LIMIT_LOGIN_EMAIL_PER_MINUTE"
+    )
+    rate_limit_generate_per_minute: int = Field(
+        default=30, ge=0, env="RATE_LIMIT_GENERATE_PER_MINUTE"
+    )
+    rate_limit_generate_burst: int = Field(default=10, ge=1, env="RATE_LIMIT_GENERATE_BURST")
+    # Tạo hàng loạt: mỗi mã trong lô tính một lượt, dồn được tối đa bulk_generate_max_items
+    rate_limit_bulk_generate_per_hour: int = Field(
+        default=100_000, ge=0, env="RATE_LIMIT_BULK_GENERATE_PER_HOUR"
+    )
+    # Phần quota còn lại (theo số đếm Redis gần nhất) mỗi process tự cho qua; 0 = luôn hỏi Redis
+    rate_limit_local_share: float = Field(default=0.2, ge=0, le=1, env="RATE_LIMIT_LOCAL_SHARE")
+    rate_limit_redis_timeout_ms: int = Field(default=50, ge=1, env="RATE_LIMIT_REDIS_TIMEOUT_MS")
+    # Circuit breaker Redis: số lỗi liên tiếp để mở mạch, backoff ban đầu/tối đa trước khi thử lại
+    rate_limit_breaker_failures: int = Field(default=3, ge=1, env="RATE_LIMIT_BREAKER_FAILURES")
+    rate_limit_breaker_backoff_seconds: float = Field(
+        default=1.0, gt=0, env="RATE_LIMIT_BREAKER_BACKOFF_SECONDS"
+    )
+    rate_limit_breaker_max_backoff_seconds: float = Field(
+        default=30.0, gt=0, env="RATE_LIMIT_BREAKER_MAX_BACKOFF_SECONDS"
+    )
+    # Trạng thái in-memory (token cục bộ, bộ đếm khi Redis lỗi): số khoá tối đa và số phần lock
+    rate_limit_fallback_max_entries: int = Field(
+        default=100_000, ge=1, env="RATE_LIMIT_FALLBACK_MAX_ENTRIES"
+    )
+    rate_limit_fallback_stripes: int = Field(default=16, ge=1, env="RATE_LIMIT_FALLBACK_STRIPES")
+
+    # Số process render QR (0 = dùng một thread nền thay cho process pool) và số job được xếp hàng
+    render_workers: int = Field(default=2, ge=0, env="RENDER_WORKERS")
+    render_queue_size: int = Field(default=16, ge=0, env="RENDER_QUEUE_SIZE")
+    # Cache render theo nội dung: số entry/dung lượng LRU trong RAM (0 = tắt) và tầng đĩa trong
+    # render_cache_dir - phải nằm ngoài upload_dir, vì upload_dir được phục vụ công khai qua /static
+    render_cache_max_entries: int = Field(default=512, ge=0, env="RENDER_CACHE_MAX_ENTRIES")
+    render_cache_max_mb: int = Field(default=64, ge=0, env="RENDER_CACHE_MAX_MB")
+    render_cache_disk: bool = Field(default=True, env="RENDER_CACHE_DISK")
+    render_cache_dir: Path = Field(
+        default_factory=lambda: Path(tempfile.gettempdir()) / "qr-render-cache",
+        env="RENDER_CACHE_DIR",
+    )
+    render_cache_disk_max_mb: int = Field(default=1024, ge=0, env="RENDER_CACHE_DISK_MAX_MB")
+    # Nén PNG: mức zlib 0-9 và optimize (thử thêm bộ lọc, chậm hơn nhưng file nhỏ hơn)
+    png_compress_level: int = Field(default=9, ge=0, le=9, env="PNG_COMPRESS_LEVEL")
+    png_optimize: bool = Field(default=False, env="PNG_OPTIMIZE")
+    # Cho phép header X-Render-Profile: true chạy render dưới cProfile (chỉ nên bật khi debug)
+    render_profiling_enabled: bool = Field(default=False, env="RENDER_PROFILING_ENABLED")
+    mask_pyramid_cache_size: int = Field(default=16, ge=1, env="MASK_PYRAMID_CACHE_SIZE")
+    # Cache tra cứu khi quét (trạng thái QR, tên sản phẩm): LRU+TTL trong process, Redis tuỳ chọn
+    scan_cache_ttl_seconds: float = Field(default=30, ge=0, env="SCAN_CACHE_TTL_SECONDS")
+    scan_cache_max_entries: int = Field(default=100_000, ge=0, env="SCAN_CACHE_MAX_ENTRIES")
+    scan_cache_redis: bool = Field(default=False, env="SCAN_CACHE_REDIS")
+    scan_cache_redis_ttl_seconds: int = Field(default=600, ge=1, env="SCAN_CACHE_REDIS_TTL_SECONDS")
+    scan_cache_redis_timeout_ms: int = Field(default=50, ge=1, env="SCAN_CACHE_REDIS_TIMEOUT_MS")
+    # Ghi scan event: "sync" (commit từng lượt quét) hoặc write-behind qua buffer "memory"/"redis"
+    scan_ingest_mode: Literal["sync", "memory", "redis"] = Field(
+        default="sync", env="SCAN_INGEST_MODE"
+    )
+    scan_ingest_batch_size: int = Field(default=500, ge=1, env="SCAN_INGEST_BATCH_SIZE")
+    scan_ingest_flush_interval_ms: int = Field(
+        default=200, ge=1, env="SCAN_INGEST_FLUSH_INTERVAL_MS"
+    )
+    scan_ingest_max_buffer: int = Field(default=100_000, ge=1, env="SCAN_INGEST_MAX_BUFFER")
+    scan_ingest_redis_key: str = Field(default="scan_ingest", env="SCAN_INGEST_REDIS_KEY")
+    scan_ingest_redis_timeout_ms: int = Field(default=100, ge=1, env="SCAN_INGEST_REDIS_TIMEOUT_MS")
+    bulk_generate_max_items: int = Field(default=50_000, ge=1, env="BULK_GENERATE_MAX_ITEMS")
+    bulk_write_batch_size: int = Field(default=200, ge=1, env="BULK_WRITE_BATCH_SIZE")
+    # Compact rollup lượt quét định kỳ (0 = tắt, chỉ cập nhật khi ghi event / chạy tay)
+    scan_rollup_compact_interval_seconds: float = Field(
+        default=0, ge=0, env="SCAN_ROLLUP_COMPACT_INTERVAL_SECONDS"
+    )
+    scan_rollup_compact_lookback_hours: int = Field(
+        default=3, ge=1, env="SCAN_ROLLUP_COMPACT_LOOKBACK_HOURS"
+    )
+    scan_rollup_compact_grace_seconds: int = Field(
+        default=300, ge=0, env="SCAN_ROLLUP_COMPACT_GRACE_SECONDS"
+    )
+    # Export: số dòng mỗi lần fetch từ server-side cursor, mức nén gzip khi client nhận gzip
+    export_fetch_size: int = Field(default=2000, ge=1, env="EXPORT_FETCH_SIZE")
+    export_gzip_level: int = Field(default=6, ge=1, le=9, env="EXPORT_GZIP_LEVEL")
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
         allow_population_by_field_name = True
 
-    @validator("upload_dir", pre=True)
+    @property
+    def async_database_dsn(self) -> str:
+        if self.async_database_url:
+            return self.async_database_url
+        url = str(self.database_url)
+        for sync_driver, async_driver in (
+            ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+            ("postgresql://", "postgresql+asyncpg://"),
+            ("sqlite+pysqlite://", "sqlite+aiosqlite://"),
+            ("sqlite://", "sqlite+aiosqlite://"),
+        ):
+            if url.startswith(sync_driver):
+                return async_driver + url[len(sync_driver) :]
+        return url
+
+    @validator("upload_dir", "render_cache_dir", pre=True)
     def _ensure_path(cls, value: Any) -> Path:  # type: ignore[override]
         if isinstance(value, Path):
             return value
@@ -3,6 +3,9 @@ import json
 import logging
 from logging import LogRecord
 
+# Thuộc tính sẵn có của LogRecord; mọi thuộc tính khác đến từ ``extra=`` và được đưa vào JSON
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
 
 class JsonFormatter(logging.Formatter):
     def format(self, record: LogRecord) -> str:  # type: ignore[override]
@@ -11,9 +14,12 @@ class JsonFormatter(logging.Formatter):
             "name": record.name,
             "message": record.getMessage(),
         }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in payload:
+                payload[key] = value
         if record.exc_info:
             payload["exc_info"] = self.formatException(record.exc_info)
-        return json.dumps(payload)
+        return json.dumps(payload, default=str)
 
 
 def setup_logging() -> None:
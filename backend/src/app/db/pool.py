@@ -0,0 +1,79 @@
+"""Connection pool có đo đạc: số kết nối đang mượn, overflow và thời gian chờ lấy kết nối.
+
+SQLAlchemy không có event "bắt đầu chờ" nên thời gian chờ được đo bằng cách bọc ``_do_get`` của
+``QueuePool``; ``checkout``/``checkin`` cập nhật gauge ngay sau khi trạng thái pool đổi. Nhãn
+``pool`` lấy từ ``pool_logging_name`` của engine (``async``/``sync``).
+"""
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+from app.core.metrics import registry
+
+POOL_WAIT_SECONDS = registry.histogram(
+    "db_pool_wait_seconds",
+    "Thời gian chờ lấy kết nối từ pool",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0),
+    labelnames=("pool",),
+)
+POOL_TIMEOUTS = registry.counter(
+    "db_pool_timeouts_total",
+    "Số lần hết pool_timeout mà không lấy được kết nối",
+    labelnames=("pool",),
+)
+POOL_CHECKED_OUT = registry.gauge(
+    "db_pool_checked_out", "Số kết nối đang được mượn", labelnames=("pool",)
+)
+POOL_OVERFLOW = registry.gauge(
+    "db_pool_overflow",
+    "Số kết nối đang mở vượt pool_size (âm = pool chưa mở đủ)",
+    labelnames=("pool",),
+)
+POOL_SIZE = registry.gauge("db_pool_size", "pool_size đã cấu hình", labelnames=("pool",))
+
+
+def pool_stats(pool: Pool) -> dict[str, Any]:
+    """Trạng thái hiện tại của pool; pool không giới hạn (NullPool...) chỉ có ``class``."""
+    stats: dict[str, Any] = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+    return stats
+
+
+class _InstrumentedPoolMixin:
+    def _metrics_label(self) -> str:
+        return getattr(self, "logging_name", None) or "default"
+
+    def _report(self) -> None:
+        label = self._metrics_label()
+        POOL_CHECKED_OUT.set(self.checkedout(), pool=label)
+        POOL_OVERFLOW.set(self.overflow(), pool=label)
+        POOL_SIZE.set(self.size(), pool=label)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.inc(pool=self._metrics_label())
+            raise
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - start, pool=self._metrics_label())
+        self._report()
+        return record
+
+    def _do_return_conn(self, record) -> None:
+        super()._do_return_conn(record)
+        self._report()
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
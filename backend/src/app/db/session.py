@@ -1,16 +1,57 @@
-"""Khởi tạo session SQLAlchemy đồng bộ."""
+"""Khởi tạo engine/session SQLAlchemy.
+
+API dùng engine async (``AsyncSession``) để truy vấn không chặn event loop. Engine đồng bộ vẫn
+được giữ cho Alembic, seed và các thread nền (ví dụ flusher ghi scan event).
+"""
+from typing import Any
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.db.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+
+
+def sync_engine_options(url: str) -> dict[str, Any]:
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {"pool_pre_ping": True, "poolclass": InstrumentedQueuePool, "pool_logging_name": "sync"}
+
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+engine = create_engine(settings.database_url, **sync_engine_options(settings.database_url))
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def async_engine_options(url: str) -> dict[str, Any]:
+    """Tham số pool/statement cache lấy từ ``Settings`` theo từng loại driver."""
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        return {}
+    options: dict[str, Any] = {
+        "pool_pre_ping": True,
+        "poolclass": InstrumentedAsyncQueuePool,
+        "pool_logging_name": "async",
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+    if make_url(url).get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "prepared_statement_cache_size": settings.db_statement_cache_size
+        }
+    return options
+
+
+def create_async_session_factory(url: str) -> async_sessionmaker[AsyncSession]:
+    async_engine = create_async_engine(url, **async_engine_options(url))
+    # expire_on_commit=False: object vẫn đọc được sau commit mà không cần lazy load (không có
+    # I/O ngầm trong AsyncSession)
+    return async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+
+AsyncSessionLocal = create_async_session_factory(settings.async_database_dsn)
+async_engine = AsyncSessionLocal.kw["bind"]
+
@@ -1,18 +1,28 @@
 from __future__ import annotations
 
 import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.staticfiles import StaticFiles
 
-from app.api.routes import analytics, auth, customers, products, qrcodes, scans
+from app.api.deps import get_session_factory
+from app.api.routes import analytics, auth, customers, masks, products, qrcodes, scans
 from app.core.config import settings
 from app.core.logging import setup_logging
-from app.db.session import get_db
+from app.core.metrics import registry
+from app.db.pool import pool_stats
+from app.services.render_pool import render_pool
+from app.services.scan_ingest import scan_ingestor
+from app.services.scan_rollup import rollup_compactor
+from app.storage import storage
+from app.utils.rate_limit import rate_limiter
 
 setup_logging()
 
@@ -24,8 +34,27 @@ class RequestContextMiddleware(BaseHTTPMiddleware):
         return response
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    if settings.scan_ingest_mode != "sync":
+        scan_ingestor.start()
+    rollup_compactor.start()
+    yield
+    rollup_compactor.stop()
+    render_pool.shutdown()
+    # xả hết scan event còn trong buffer trước khi process thoát
+    scan_ingestor.stop(drain=True)
+    await rate_limiter.close()
+    await storage.close()
+
+
 def create_app() -> FastAPI:
-    app = FastAPI(title=settings.project_name, openapi_url=settings.openapi_url, docs_url=settings.docs_url)
+    app = FastAPI(
+        title=settings.project_name,
+        openapi_url=settings.openapi_url,
+        docs_url=settings.docs_url,
+        lifespan=lifespan,
+    )
     app.add_middleware(RequestContextMiddleware)
     app.add_middleware(
         CORSMiddleware,
@@ -43,19 +72,24 @@ def create_app() -> FastAPI:
     app.include_router(auth.router, prefix=f"{settings.api_prefix}/auth", tags=["auth"])
     app.include_router(customers.router, prefix=f"{settings.api_prefix}/customers", tags=["customers"])
     app.include_router(products.router, prefix=f"{settings.api_prefix}/products", tags=["products"])
+    app.include_router(masks.router, prefix=f"{settings.api_prefix}/masks", tags=["masks"])
     app.include_router(qrcodes.router, prefix=f"{settings.api_prefix}/qrcodes", tags=["qrcodes"])
     app.include_router(scans.router, prefix="/api", tags=["scan"])
     app.include_router(analytics.router, prefix=f"{settings.api_prefix}/analytics", tags=["analytics"])
 
-    static_path = Path(settings.upload_dir)
-    app.mount("/static", StaticFiles(directory=static_path), name="static")
+    if settings.storage_backend == "local":
+        # với backend S3, client tải ảnh qua presigned URL, API không phục vụ file
+        app.mount("/static", StaticFiles(directory=Path(settings.upload_dir)), name="static")
 
     @app.get("/healthz")
-    async def healthcheck():
-        for db in get_db():
-            db.execute("SELECT 1")
-            break
-        return {"status": "ok"}
+    async def healthcheck(session_factory=Depends(get_session_factory)):
+        async with session_factory() as db:
+            await db.execute(text("SELECT 1"))
+        return {"status": "ok", "db_pool": pool_stats(session_factory.kw["bind"].pool)}
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
     return app
 
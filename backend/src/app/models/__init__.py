@@ -6,6 +6,9 @@ from .scan_event import ScanEvent
 from .reuse_history import ReuseHistory
 from .webhook import Webhook
 from .api_key import ApiKey
+from .mask import MaskAsset
+from .scan_rollup import ScanRollupDaily, ScanRollupHourly
+from .blob import Blob
 
 __all__ = [
     "User",
@@ -16,4 +19,8 @@ __all__ = [
     "ReuseHistory",
     "Webhook",
     "ApiKey",
+    "MaskAsset",
+    "ScanRollupHourly",
+    "ScanRollupDaily",
+    "Blob",
 ]
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class Blob(Base):
+    """Một file duy nhất theo nội dung trong storage (``blobs/<ab>/<sha256>.<ext>``).
+
+    ``refcount`` là số tham chiếu từ ``qrcodes`` (ảnh PNG/SVG, mask, logo) và ``masks``;
+    ``updated_at`` đổi mỗi lần ``refcount`` đổi, để GC chỉ xoá blob đã hết tham chiếu đủ lâu.
+    """
+
+    __tablename__ = "blobs"
+    __table_args__ = (Index("ix_blobs_refcount_updated_at", "refcount", "updated_at"),)
+
+    path: Mapped[str] = mapped_column(String(255), primary_key=True)
+    refcount: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -3,25 +3,38 @@ from __future__ import annotations
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text, func
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    Uuid,
+    func,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-try:
-    from sqlalchemy.dialects.postgresql import JSONB, UUID
-except Exception:  # pragma: no cover
-    from sqlalchemy import JSON as JSONB  # type: ignore
-    from sqlalchemy import String as UUID  # type: ignore
-
 from app.db.base import Base
 
 
 class QrCode(Base):
     __tablename__ = "qrcodes"
+    __table_args__ = (
+        # danh sách QR: lọc theo active (tuỳ chọn), mới nhất trước
+        Index("ix_qrcodes_active_created_at", "active", "created_at"),
+        Index("ix_qrcodes_created_at", "created_at"),
+    )
 
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
     product_id: Mapped[int | None] = mapped_column(ForeignKey("products.id"), nullable=True, index=True)
     customer_id: Mapped[int | None] = mapped_column(ForeignKey("customers.id"), nullable=True, index=True)
-    data_json: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    data_json: Mapped[dict | None] = mapped_column(
+        JSON().with_variant(JSONB, "postgresql"), nullable=True
+    )
     data_url: Mapped[str | None] = mapped_column(Text, nullable=True)
     reuse_allowed: Mapped[bool] = mapped_column(Boolean, default=False)
     reuse_cycle: Mapped[int] = mapped_column(Integer, default=0)
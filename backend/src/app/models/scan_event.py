@@ -3,22 +3,23 @@ from __future__ import annotations
 import uuid
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, func
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, String, Text, Uuid, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-try:
-    from sqlalchemy.dialects.postgresql import UUID
-except Exception:  # pragma: no cover
-    from sqlalchemy import String as UUID  # type: ignore
-
 from app.db.base import Base
 
 
 class ScanEvent(Base):
     __tablename__ = "scan_events"
+    __table_args__ = (
+        # theo một mã: lọc khoảng ts, sắp theo (ts, id) -> đọc thẳng theo thứ tự index, không sort
+        Index("ix_scan_events_code_id_ts", "code_id", "ts", "id"),
+        # không lọc mã: liệt kê/xuất mới nhất trước, compact rollup theo khoảng ts
+        Index("ix_scan_events_ts", "ts", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    code_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("qrcodes.id"), index=True)
+    code_id: Mapped[uuid.UUID] = mapped_column(Uuid, ForeignKey("qrcodes.id"))
     ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     ip: Mapped[str | None] = mapped_column(String(64), nullable=True)
     user_agent: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -26,5 +27,8 @@ class ScanEvent(Base):
     approx_geo: Mapped[str | None] = mapped_column(String(255), nullable=True)
     device: Mapped[str | None] = mapped_column(String(50), nullable=True)
     reuse_cycle_at_scan: Mapped[int] = mapped_column(Integer, default=0)
+    # chủ sở hữu của mã tại thời điểm quét (mã có thể được gán lại); không FK để giữ lịch sử
+    product_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    customer_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
     qrcode = relationship("QrCode", back_populates="scan_events")
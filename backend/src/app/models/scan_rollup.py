@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import uuid
+from datetime import date, datetime
+
+from sqlalchemy import Date, DateTime, Index, Integer, PrimaryKeyConstraint, String, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class ScanRollupHourly(Base):
+    """Số lượt quét theo giờ (UTC) cho từng mã QR/thiết bị/chủ sở hữu.
+
+    ``product_id``/``customer_id`` là giá trị tại thời điểm quét (``0`` khi mã chưa gán), chép sẵn
+    để lọc không cần join. Chúng nằm trong khoá chính nên mã được gán lại giữa giờ sẽ có hai dòng.
+    """
+
+    __tablename__ = "scan_rollups_hourly"
+    __table_args__ = (
+        PrimaryKeyConstraint("bucket", "code_id", "device", "product_id", "customer_id"),
+        Index("ix_scan_rollups_hourly_product", "product_id", "bucket"),
+        Index("ix_scan_rollups_hourly_customer", "customer_id", "bucket"),
+        Index("ix_scan_rollups_hourly_code", "code_id", "bucket"),
+    )
+
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    code_id: Mapped[uuid.UUID] = mapped_column(Uuid)
+    device: Mapped[str] = mapped_column(String(50))
+    product_id: Mapped[int] = mapped_column(Integer, default=0)
+    customer_id: Mapped[int] = mapped_column(Integer, default=0)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ScanRollupDaily(Base):
+    """Như ``ScanRollupHourly`` nhưng theo ngày (UTC)."""
+
+    __tablename__ = "scan_rollups_daily"
+    __table_args__ = (
+        PrimaryKeyConstraint("bucket", "code_id", "device", "product_id", "customer_id"),
+        Index("ix_scan_rollups_daily_product", "product_id", "bucket"),
+        Index("ix_scan_rollups_daily_customer", "customer_id", "bucket"),
+        Index("ix_scan_rollups_daily_code", "code_id", "bucket"),
+    )
+
+    bucket: Mapped[date] = mapped_column(Date)
+    code_id: Mapped[uuid.UUID] = mapped_column(Uuid)
+    device: Mapped[str] = mapped_column(String(50))
+    product_id: Mapped[int] = mapped_column(Integer, default=0)
+    customer_id: Mapped[int] = mapped_column(Integer, default=0)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
@@ -30,8 +30,16 @@ class QrTimelineEntry(BaseModel):
     meta: dict | None = None
 
 
+class QrTimelineBucket(BaseModel):
+    bucket: datetime
+    key: str | None
+    count: int
+
+
 class QrAnalyticsResponse(BaseModel):
     code_id: str
     product_name: str | None
     total_scans: int
     timeline: list[QrTimelineEntry]
+    next_cursor: str | None = None
+    buckets: list[QrTimelineBucket] | None = None
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class MaskOut(BaseModel):
+    id: int
+    name: str
+    sha256: str
+    threshold: int
+    width: int
+    height: int
+    url: str
+    created_at: datetime
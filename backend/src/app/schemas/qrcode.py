@@ -24,6 +24,13 @@ class QrGenerateRequest(BaseModel):
     options: QrOptions = Field(default_factory=QrOptions)
 
 
+class QrBulkItem(BaseModel):
+    data: dict | str
+    product_id: int | None = None
+    customer_id: int | None = None
+    reuse_allowed: bool = False
+
+
 class QrOut(BaseModel):
     code_id: uuid.UUID
     product_id: int | None
@@ -0,0 +1,198 @@
+"""Đếm tham chiếu tới blob (``blobs``) và dọn blob không còn mã QR/mask nào dùng.
+
+- ``retain_writes``/``release_writes``: câu lệnh cộng/trừ ``refcount``, chạy trong cùng
+  transaction với INSERT ``qrcodes``/``masks`` (hoặc DELETE mask) nên số đếm không lệch khi lỗi.
+- ``reconcile``: đếm lại tham chiếu thật từ ``qrcodes`` và ``masks`` (sửa lệch sau khi sửa tay
+  database); chỉ ghi đè dòng mà ``refcount`` không đổi trong lúc đếm.
+- ``collect_garbage``: xoá blob có ``refcount = 0`` lâu hơn ``blob_gc_grace_seconds``. Dòng bị
+  xoá (và khoá) trước, file bị xoá khi transaction còn mở rồi mới commit: ``BlobStore.put``
+  đồng thời chờ khoá dòng rồi ghi lại file (xem docstring ``BlobStore``). Lỗi storage chỉ để
+  lại file mồ côi.
+
+Đường dẫn không nằm dưới ``blobs/`` (file tạo trước khi có blob store) không được đếm và không
+bao giờ bị GC xoá.
+
+Chạy tay::
+
+    python -m app.services.blob_refs --reconcile
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import sys
+from collections import Counter
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from sqlalchemy import Executable, Insert, bindparam, delete, func, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.blob import Blob
+from app.models.mask import MaskAsset
+from app.models.qrcode import QrCode
+from app.storage import storage
+from app.storage.blobs import BLOB_PREFIX, blob_store, is_blob_path
+
+logger = logging.getLogger(__name__)
+
+_blobs = Blob.__table__
+
+
+def _upsert(dialect_name: str) -> Insert:
+    if dialect_name == "postgresql":
+        statement = pg_insert(_blobs)
+    elif dialect_name == "sqlite":
+        statement = sqlite_insert(_blobs)
+    else:
+        raise NotImplementedError(f"Blob store chưa hỗ trợ database {dialect_name}")
+    return statement.on_conflict_do_update(
+        index_elements=["path"],
+        set_={
+            "refcount": _blobs.c.refcount + statement.excluded.refcount,
+            "updated_at": statement.excluded.updated_at,
+        },
+    )
+
+
+def _counts(paths: Iterable[str | None]) -> list[tuple[str, int]]:
+    # sắp theo path: các transaction luôn khoá dòng theo cùng thứ tự, tránh deadlock trên Postgres
+    return sorted(Counter(path for path in paths if is_blob_path(path)).items())
+
+
+def retain_writes(
+    dialect_name: str, paths: Iterable[str | None]
+) -> list[tuple[Executable, list[dict[str, Any]]]]:
+    """Các cặp (câu lệnh, tham số) cộng một tham chiếu cho mỗi lần ``paths`` nhắc tới blob."""
+    now = datetime.now(UTC)
+    rows = [
+        {"path": path, "refcount": count, "created_at": now, "updated_at": now}
+        for path, count in _counts(paths)
+    ]
+    return [(_upsert(dialect_name), rows)] if rows else []
+
+
+def release_writes(paths: Iterable[str | None]) -> list[tuple[Executable, list[dict[str, Any]]]]:
+    now = datetime.now(UTC)
+    rows = [{"b_path": path, "b_count": count, "b_now": now} for path, count in _counts(paths)]
+    if not rows:
+        return []
+    statement = (
+        update(_blobs)
+        .where(_blobs.c.path == bindparam("b_path"))
+        .values(refcount=_blobs.c.refcount - bindparam("b_count"), updated_at=bindparam("b_now"))
+    )
+    return [(statement, rows)]
+
+
+def _references() -> Any:
+    columns = (
+        QrCode.image_path_png,
+        QrCode.image_path_svg,
+        QrCode.mask_path,
+        QrCode.logo_path,
+        MaskAsset.path,
+    )
+    refs = union_all(*(select(column.label("path")) for column in columns)).subquery()
+    return (
+        select(refs.c.path, func.count())
+        .where(refs.c.path.startswith(BLOB_PREFIX))
+        .group_by(refs.c.path)
+    )
+
+
+async def reconcile(db: AsyncSession) -> int:
+    """Đặt lại ``refcount`` theo số tham chiếu thật; trả về số dòng đã sửa."""
+    # đọc refcount trước rồi mới đếm tham chiếu: tham chiếu commit trước lần đọc đầu chắc chắn có
+    # trong lần đếm, còn dòng bị đổi sau lần đọc đầu thì điều kiện refcount cũ làm UPDATE bỏ qua
+    stored = dict((await db.execute(select(Blob.path, Blob.refcount))).all())
+    actual = dict((await db.execute(_references())).all())
+    now = datetime.now(UTC)
+    fixes = [
+        {"b_path": path, "b_seen": refcount, "b_actual": actual.get(path, 0), "b_now": now}
+        for path, refcount in sorted(stored.items())
+        if refcount != actual.get(path, 0)
+    ]
+    if fixes:
+        await db.execute(
+            update(_blobs)
+            .where(_blobs.c.path == bindparam("b_path"), _blobs.c.refcount == bindparam("b_seen"))
+            .values(refcount=bindparam("b_actual"), updated_at=bindparam("b_now")),
+            fixes,
+        )
+    # blob được tham chiếu nhưng chưa có dòng (vd. ghi tay vào qrcodes)
+    missing = [path for path in actual if path not in stored]
+    dialect_name = db.get_bind().dialect.name
+    for statement, rows in retain_writes(
+        dialect_name, (path for path in missing for _ in range(actual[path]))
+    ):
+        await db.execute(statement, rows)
+    await db.commit()
+    return len(fixes) + len(missing)
+
+
+async def collect_garbage(
+    db: AsyncSession,
+    grace_seconds: float | None = None,
+    batch_size: int = 500,
+    dry_run: bool = False,
+) -> list[str]:
+    """Xoá các blob không còn tham chiếu; trả về đường dẫn đã xoá (hoặc sẽ xoá nếu ``dry_run``)."""
+    grace = settings.blob_gc_grace_seconds if grace_seconds is None else grace_seconds
+    cutoff = datetime.now(UTC) - timedelta(seconds=grace)
+    orphaned = (Blob.refcount <= 0, Blob.updated_at < cutoff)
+    if dry_run:
+        return list(await db.scalars(select(Blob.path).where(*orphaned).order_by(Blob.path)))
+
+    removed: list[str] = []
+    while True:
+        query = select(Blob.path).where(*orphaned).order_by(Blob.path).limit(batch_size)
+        candidates = list(await db.scalars(query))
+        if not candidates:
+            return removed
+        # điều kiện được kiểm lại trong DELETE: blob vừa được tham chiếu lại thì giữ nguyên
+        result = await db.execute(
+            delete(Blob).where(Blob.path.in_(candidates), *orphaned).returning(Blob.path)
+        )
+        deleted = list(result.scalars())
+        for path in deleted:
+            blob_store.forget(path)
+            try:
+                await storage.delete(path)
+            except Exception:
+                logger.exception("blob_gc_delete_failed", extra={"path": path})
+        await db.commit()
+        removed.extend(deleted)
+        if len(candidates) < batch_size:
+            return removed
+
+
+async def _run(reconcile_first: bool, grace_seconds: float | None, dry_run: bool) -> None:
+    async with AsyncSessionLocal() as db:
+        if reconcile_first:
+            print(f"reconciled={await reconcile(db)}")
+        removed = await collect_garbage(db, grace_seconds, dry_run=dry_run)
+    await storage.close()
+    print(f"{'orphaned' if dry_run else 'removed'}={len(removed)}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Dọn blob không còn mã QR/mask nào tham chiếu")
+    parser.add_argument(
+        "--reconcile", action="store_true", help="Đếm lại tham chiếu từ qrcodes/masks trước khi dọn"
+    )
+    parser.add_argument("--grace-seconds", type=float, help="Mặc định: BLOB_GC_GRACE_SECONDS")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ liệt kê, không xoá")
+    args = parser.parse_args(argv)
+    asyncio.run(_run(args.reconcile, args.grace_seconds, args.dry_run))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
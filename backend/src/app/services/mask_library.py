@@ -0,0 +1,143 @@
+"""Thư viện mask: tải lên và nhị phân hoá một lần, dùng lại cho mọi lần tạo QR."""
+from __future__ import annotations
+
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from fastapi import HTTPException, status
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.models.mask import MaskAsset
+from app.models.qrcode import QrCode
+from app.services.blob_refs import release_writes, retain_writes
+from app.storage import storage
+from app.storage.blobs import blob_store, is_blob_path
+from app.utils.mask_pyramid import binarize, otsu_threshold
+
+_mask_bytes: OrderedDict[str, bytes] = OrderedDict()
+_mask_bytes_lock = threading.Lock()
+
+
+def _remember_bytes(sha256: str, data: bytes) -> None:
+    with _mask_bytes_lock:
+        _mask_bytes[sha256] = data
+        _mask_bytes.move_to_end(sha256)
+        while len(_mask_bytes) > settings.mask_pyramid_cache_size:
+            _mask_bytes.popitem(last=False)
+
+
+def _binarize_upload(data: bytes, threshold: int | None) -> tuple[bytes, int, tuple[int, int]]:
+    try:
+        image = Image.open(io.BytesIO(data)).convert("L")
+    except (UnidentifiedImageError, OSError) as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Ảnh mask không hợp lệ"
+        ) from exc
+    threshold = threshold or otsu_threshold(image)
+    buffer = io.BytesIO()
+    binarize(image, threshold).save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue(), threshold, image.size
+
+
+async def create_mask(
+    db: AsyncSession, *, name: str, data: bytes, threshold: int | None
+) -> MaskAsset:
+    png_bytes, threshold, (width, height) = await run_in_threadpool(
+        _binarize_upload, data, threshold
+    )
+    sha256 = hashlib.sha256(png_bytes).hexdigest()
+
+    # Cùng một mask sau nhị phân hoá => dùng lại bản ghi sẵn có thay vì lưu thêm bản sao
+    existing = await _mask_by_sha256(db, sha256)
+    if existing:
+        return existing
+
+    path, _ = await blob_store.put(png_bytes, ".png")
+    mask = MaskAsset(
+        name=name,
+        sha256=sha256,
+        path=path,
+        threshold=threshold,
+        width=width,
+        height=height,
+    )
+    db.add(mask)
+    for statement, params in retain_writes(db.get_bind().dialect.name, [path]):
+        await db.execute(statement, params)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # request song song vừa lưu cùng mask (unique sha256): dùng bản ghi của request đó
+        await db.rollback()
+        existing = await _mask_by_sha256(db, sha256)
+        if existing is None:
+            raise
+        return existing
+    await db.refresh(mask)
+
+    # pyramid được dựng trong process render khi mask được dùng lần đầu, không dựng ở đây
+    _remember_bytes(sha256, png_bytes)
+    return mask
+
+
+async def _mask_by_sha256(db: AsyncSession, sha256: str) -> MaskAsset | None:
+    query = select(MaskAsset).where(MaskAsset.sha256 == sha256)
+    return (await db.execute(query)).scalar_one_or_none()
+
+
+async def get_mask(db: AsyncSession, mask_id: int) -> MaskAsset:
+    mask = await db.get(MaskAsset, mask_id)
+    if not mask:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Mask not found")
+    return mask
+
+
+async def load_mask_bytes(mask: MaskAsset) -> bytes:
+    """PNG nhị phân của mask; chỉ đọc storage ở lần đầu."""
+    with _mask_bytes_lock:
+        cached = _mask_bytes.get(mask.sha256)
+    if cached is None:
+        cached = await storage.open(mask.path)
+        _remember_bytes(mask.sha256, cached)
+    return cached
+
+
+async def delete_mask(db: AsyncSession, mask_id: int) -> None:
+    mask = await get_mask(db, mask_id)
+    query = select(QrCode.id).where(QrCode.mask_path == mask.path).limit(1)
+    in_use = (await db.execute(query)).first()
+    if in_use:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Mask đang được QR sử dụng"
+        )
+    await db.delete(mask)
+    for statement, params in release_writes([mask.path]):
+        await db.execute(statement, params)
+    await db.commit()
+    # file trong blob store có thể đang được QR khác dùng (cùng nội dung): để GC xoá khi hết tham
+    # chiếu; chỉ file tạo trước khi có blob store mới xoá ngay
+    if not is_blob_path(mask.path):
+        await storage.delete(mask.path)
+    with _mask_bytes_lock:
+        _mask_bytes.pop(mask.sha256, None)
+
+
+async def build_mask_response(mask: MaskAsset) -> dict[str, Any]:
+    return {
+        "id": mask.id,
+        "name": mask.name,
+        "sha256": mask.sha256,
+        "threshold": mask.threshold,
+        "width": mask.width,
+        "height": mask.height,
+        "url": await storage.url_for(mask.path),
+        "created_at": mask.created_at,
+    }
@@ -1,17 +1,29 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import uuid
+from collections.abc import AsyncIterator
 from typing import Any
 
 from fastapi import HTTPException, UploadFile, status
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.models.qrcode import QrCode
 from app.models.reuse_history import ReuseHistory
-from app.schemas.qrcode import QrOptions
-from app.storage.local import storage
-from app.utils.qr_renderer import ImageMaskQrRenderer
+from app.schemas.qrcode import QrBulkItem, QrOptions
+from app.services.blob_refs import retain_writes
+from app.services.mask_library import get_mask, load_mask_bytes
+from app.services.render_pool import RenderQueueFull, render_pool
+from app.services.scan_lookup import scan_lookup
+from app.storage import storage
+from app.utils.qr_renderer import ImageMaskQrRenderer, RenderArtifacts, RenderResult
+
+# Cột của ``qrcodes`` trỏ tới blob trong storage, mỗi cột là một tham chiếu
+BLOB_COLUMNS = ("image_path_png", "image_path_svg", "mask_path", "logo_path")
 
 
 def _serialize_data(data: dict | str) -> tuple[dict | None, str | None]:
@@ -28,40 +40,49 @@ def _serialize_data(data: dict | str) -> tuple[dict | None, str | None]:
     return None, data
 
 
-def create_qrcode(
-    db: Session,
-    *,
-    product_id: int | None,
-    customer_id: int | None,
+def _payload_text(data: dict | str) -> str:
+    return json.dumps(data) if isinstance(data, dict) else str(data)
+
+
+def _render_params(
     data: dict | str,
-    reuse_allowed: bool,
     options: QrOptions,
-    mask_file: UploadFile | None,
-    logo_file: UploadFile | None,
-) -> QrCode:
-    mask_bytes = mask_file.file.read() if mask_file else None
-    logo_bytes = logo_file.file.read() if logo_file else None
-
+    mask_bytes: bytes | None,
+    logo_bytes: bytes | None,
+    mask_binarized: bool = False,
+) -> dict[str, Any]:
     if logo_bytes and options.ecc != "H":
         # Chèn logo cần ECC cao hơn để che bớt module nhưng vẫn đọc được
         options.ecc = "H"
+    return {
+        "data": _payload_text(data),
+        "ecc": options.ecc,
+        "fg_color": options.fg_color,
+        "bg_color": options.bg_color,
+        "margin": options.margin,
+        "size": options.size,
+        "mask_bytes": mask_bytes,
+        "logo_bytes": logo_bytes if options.logo_enabled else None,
+        "threshold": options.threshold,
+        "mask_binarized": mask_binarized,
+    }
 
-    renderer = ImageMaskQrRenderer(
-        data=json.dumps(data) if isinstance(data, dict) else str(data),
-        ecc=options.ecc,
-        fg_color=options.fg_color,
-        bg_color=options.bg_color,
-        margin=options.margin,
-        size=options.size,
-        mask_bytes=mask_bytes,
-        logo_bytes=logo_bytes if options.logo_enabled else None,
-        threshold=options.threshold,
-    )
 
-    result = renderer.render()
+async def _library_mask(db: AsyncSession, mask_id: int) -> tuple[bytes, str]:
+    """(PNG nhị phân, đường dẫn storage) của mask trong thư viện."""
+    mask = await get_mask(db, mask_id)
+    return await load_mask_bytes(mask), mask.path
 
-    data_json, data_url = _serialize_data(data)
 
+def _new_qrcode(
+    result: RenderResult,
+    *,
+    product_id: int | None,
+    customer_id: int | None,
+    data: dict | str,
+    reuse_allowed: bool,
+) -> QrCode:
+    data_json, data_url = _serialize_data(data)
     qrcode = QrCode(
         id=result.code_id,
         product_id=product_id,
@@ -78,14 +99,195 @@ def create_qrcode(
         mask_path=result.mask_path,
         logo_path=result.logo_path,
     )
+    return qrcode
+
+
+def _blob_refs(qrcode: QrCode) -> list[str | None]:
+    return [getattr(qrcode, column) for column in BLOB_COLUMNS]
+
+
+def create_qrcode(
+    db: Session,
+    *,
+    product_id: int | None,
+    customer_id: int | None,
+    data: dict | str,
+    reuse_allowed: bool,
+    options: QrOptions,
+    mask_file: UploadFile | None,
+    logo_file: UploadFile | None,
+) -> QrCode:
+    mask_bytes = mask_file.file.read() if mask_file else None
+    logo_bytes = logo_file.file.read() if logo_file else None
+
+    renderer = ImageMaskQrRenderer(**_render_params(data, options, mask_bytes, logo_bytes))
+    result = renderer.render()
+    qrcode = _new_qrcode(
+        result,
+        product_id=product_id,
+        customer_id=customer_id,
+        data=data,
+        reuse_allowed=reuse_allowed,
+    )
     db.add(qrcode)
+    for statement, bind in retain_writes(db.get_bind().dialect.name, _blob_refs(qrcode)):
+        db.execute(statement, bind)
     db.commit()
     db.refresh(qrcode)
     return qrcode
 
 
-def start_reuse_cycle(db: Session, code_id: uuid.UUID, reason: str, note: str | None) -> QrCode:
-    qrcode = db.query(QrCode).filter(QrCode.id == code_id).first()
+async def create_qrcode_async(
+    db: AsyncSession,
+    *,
+    product_id: int | None,
+    customer_id: int | None,
+    data: dict | str,
+    reuse_allowed: bool,
+    options: QrOptions,
+    mask_file: UploadFile | None,
+    logo_file: UploadFile | None,
+    mask_id: int | None = None,
+    profile: bool = False,
+) -> QrCode:
+    """Như ``create_qrcode`` nhưng render trên ``render_pool`` để không chặn event loop.
+
+    ``mask_id`` chọn mask trong thư viện (ưu tiên hơn ``mask_file``): mask đã nhị phân hoá sẵn và
+    ``mask_path`` của QR trỏ tới bản duy nhất trong storage. ``profile`` bật cProfile cho lần
+    render này, bảng thống kê được ghi cùng log ``qr_render``.
+    """
+    stored_mask_path = None
+    if mask_id is not None:
+        mask_bytes, stored_mask_path = await _library_mask(db, mask_id)
+    else:
+        mask_bytes = await mask_file.read() if mask_file else None
+    logo_bytes = await logo_file.read() if logo_file else None
+
+    params = _render_params(
+        data, options, mask_bytes, logo_bytes, mask_binarized=stored_mask_path is not None
+    )
+    params["profile"] = profile
+    try:
+        artifacts = await render_pool.render(params)
+    except RenderQueueFull as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Hàng đợi render QR đang đầy, vui lòng thử lại sau",
+            headers={"Retry-After": "1"},
+        ) from exc
+    renderer = ImageMaskQrRenderer(**params, stored_mask_path=stored_mask_path)
+    result = await renderer.store(artifacts)
+    qrcode = _new_qrcode(
+        result,
+        product_id=product_id,
+        customer_id=customer_id,
+        data=data,
+        reuse_allowed=reuse_allowed,
+    )
+    db.add(qrcode)
+    for statement, bind in retain_writes(db.get_bind().dialect.name, _blob_refs(qrcode)):
+        await db.execute(statement, bind)
+    await db.commit()
+    await db.refresh(qrcode)
+    return qrcode
+
+
+async def create_qrcodes_bulk(
+    db: AsyncSession,
+    *,
+    items: list[QrBulkItem],
+    options: QrOptions,
+    mask_bytes: bytes | None,
+    logo_bytes: bytes | None,
+    mask_id: int | None = None,
+) -> AsyncIterator[dict[str, Any]]:
+    """Tạo hàng loạt QR dùng chung options/mask/logo, phát ra các sự kiện tiến độ.
+
+    Ảnh được render song song trên ``render_pool`` và ghi ra storage theo lô
+    ``bulk_write_batch_size``, các file trong lô được ghi đồng thời; mask/logo chỉ lưu một lần cho
+    cả lô. Toàn bộ bản ghi ``QrCode`` được INSERT nhiều dòng trong một transaction duy nhất ở cuối,
+    nên các ``code_ids`` trong sự kiện ``progress`` chỉ có hiệu lực khi nhận được sự kiện ``done``.
+    """
+    stored_mask_path = None
+    if mask_id is not None:
+        mask_bytes, stored_mask_path = await _library_mask(db, mask_id)
+    base_params = _render_params(
+        "", options, mask_bytes, logo_bytes, mask_binarized=stored_mask_path is not None
+    )
+    renderer = ImageMaskQrRenderer(**base_params, stored_mask_path=stored_mask_path)
+    source_paths = await renderer.store_sources()
+
+    total = len(items)
+    rows: list[dict[str, Any]] = []
+    batch: list[tuple[int, RenderArtifacts]] = []
+    written = 0
+
+    async def write_batch(pending: list[tuple[int, RenderArtifacts]]) -> list[dict[str, Any]]:
+        results = await asyncio.gather(
+            *(renderer.store(artifacts, source_paths=source_paths) for _, artifacts in pending)
+        )
+        batch_rows = []
+        for (index, _), result in zip(pending, results, strict=True):
+            item = items[index]
+            data_json, data_url = _serialize_data(item.data)
+            batch_rows.append(
+                {
+                    "id": result.code_id,
+                    "product_id": item.product_id,
+                    "customer_id": item.customer_id,
+                    "data_json": data_json,
+                    "data_url": data_url,
+                    "reuse_allowed": item.reuse_allowed,
+                    "reuse_cycle": 0,
+                    "active": True,
+                    "version": result.version,
+                    "ecc": result.ecc,
+                    "image_path_png": result.png_path,
+                    "image_path_svg": result.svg_path,
+                    "mask_path": result.mask_path,
+                    "logo_path": result.logo_path,
+                }
+            )
+        return batch_rows
+
+    async def flush() -> dict[str, Any]:
+        nonlocal written
+        batch_rows = await write_batch(list(batch))
+        batch.clear()
+        rows.extend(batch_rows)
+        written += len(batch_rows)
+        return {
+            "event": "progress",
+            "done": written,
+            "total": total,
+            "code_ids": [str(row["id"]) for row in batch_rows],
+        }
+
+    params_list = ({**base_params, "data": _payload_text(item.data)} for item in items)
+    try:
+        async for index, artifacts in render_pool.render_many(params_list):
+            batch.append((index, artifacts))
+            if len(batch) >= settings.bulk_write_batch_size:
+                yield await flush()
+        if batch:
+            yield await flush()
+        if rows:
+            await db.execute(insert(QrCode), rows)
+            refs = (row[column] for row in rows for column in BLOB_COLUMNS)
+            for statement, bind in retain_writes(db.get_bind().dialect.name, refs):
+                await db.execute(statement, bind)
+        await db.commit()
+    except Exception as exc:
+        await db.rollback()
+        yield {"event": "error", "done": written, "total": total, "detail": str(exc)}
+        return
+    yield {"event": "done", "done": written, "total": total}
+
+
+async def start_reuse_cycle(
+    db: AsyncSession, code_id: uuid.UUID, reason: str, note: str | None
+) -> QrCode:
+    qrcode = await db.get(QrCode, code_id)
     if not qrcode:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="QR not found")
     if not qrcode.reuse_allowed:
@@ -94,12 +296,16 @@ def start_reuse_cycle(db: Session, code_id: uuid.UUID, reason: str, note: str |
     history = ReuseHistory(code_id=qrcode.id, cycle=qrcode.reuse_cycle, reason=reason, note=note)
     db.add(history)
     db.add(qrcode)
-    db.commit()
-    db.refresh(qrcode)
+    await db.commit()
+    await scan_lookup.invalidate_code(qrcode.id)
+    await db.refresh(qrcode)
     return qrcode
 
 
-def build_qr_response(qrcode: QrCode) -> dict[str, Any]:
+async def build_qr_response(qrcode: QrCode) -> dict[str, Any]:
+    image_url_png, image_url_svg = await asyncio.gather(
+        storage.url_for(qrcode.image_path_png), storage.url_for(qrcode.image_path_svg)
+    )
     return {
         "code_id": qrcode.id,
         "product_id": qrcode.product_id,
@@ -109,8 +315,8 @@ def build_qr_response(qrcode: QrCode) -> dict[str, Any]:
         "active": qrcode.active,
         "version": qrcode.version,
         "ecc": qrcode.ecc,
-        "image_url_png": storage.url_for(qrcode.image_path_png),
-        "image_url_svg": storage.url_for(qrcode.image_path_svg),
+        "image_url_png": image_url_png,
+        "image_url_svg": image_url_svg,
         "created_at": qrcode.created_at,
         "updated_at": qrcode.updated_at,
     }
@@ -0,0 +1,272 @@
+"""Timeline của một mã QR: phân trang bằng cursor và chế độ gom theo giờ/ngày.
+
+Chế độ từng sự kiện gộp ``scan_events`` và ``reuse_history`` bằng ``UNION ALL`` trong SQL, sắp theo
+``(ts, kind, id)``. Mỗi nhánh tự lọc theo cursor và ``LIMIT`` trên index ``(code_id, ts, id)`` trước
+khi gộp, nên mỗi trang chỉ đọc tối đa ``2 * (limit + 1)`` dòng, dù mã đã có bao nhiêu lượt quét.
+
+Cursor là ``"<kind>:<id>"`` của dòng cuối trang trước; ``ts`` của nó được lấy lại bằng subquery
+thay vì truyền qua client (tránh lệch định dạng thời gian giữa các database).
+
+Chế độ gom (``bucket`` = ``hour``/``day``) đếm lượt quét theo thiết bị từ bảng rollup, hoặc theo
+``approx_geo`` từ ``scan_events`` trong cửa sổ thời gian có giới hạn.
+"""
+from __future__ import annotations
+
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from typing import Any, Literal
+
+from fastapi import HTTPException, status
+from sqlalchemy import (
+    ColumnElement,
+    Integer,
+    Select,
+    String,
+    Text,
+    cast,
+    func,
+    literal,
+    null,
+    select,
+    tuple_,
+    union_all,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.reuse_history import ReuseHistory
+from app.models.scan_event import ScanEvent
+from app.models.scan_rollup import ScanRollupDaily, ScanRollupHourly
+from app.services.scan_rollup import UNKNOWN_DEVICE, day_bucket, hour_bucket
+
+BucketUnit = Literal["hour", "day"]
+GroupBy = Literal["device", "geo"]
+SortOrder = Literal["asc", "desc"]
+
+# Cửa sổ mặc định và tối đa của chế độ gom: số bucket trả về luôn có giới hạn
+DEFAULT_WINDOWS = {"hour": timedelta(days=7), "day": timedelta(days=90)}
+MAX_WINDOWS = {"hour": timedelta(days=31), "day": timedelta(days=366)}
+
+_SCAN, _REUSE = 0, 1
+_KIND_NAMES = {_SCAN: "scan", _REUSE: "reuse"}
+_KIND_IDS = {name: kind for kind, name in _KIND_NAMES.items()}
+
+
+@dataclass(frozen=True)
+class TimelineCursor:
+    kind: int
+    id: int
+
+    def encode(self) -> str:
+        return f"{_KIND_NAMES[self.kind]}:{self.id}"
+
+    @classmethod
+    def decode(cls, raw: str) -> TimelineCursor:
+        name, _, value = raw.partition(":")
+        if name not in _KIND_IDS or not value.isdigit():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor không hợp lệ"
+            )
+        return cls(_KIND_IDS[name], int(value))
+
+
+def _after_cursor(
+    ts: Any, row_id: Any, kind: int, cursor: TimelineCursor | None, order: SortOrder
+) -> list[ColumnElement[bool]]:
+    """Điều kiện "đứng sau cursor" theo ``(ts, kind, id)`` cho một nhánh có ``kind`` cố định."""
+    if cursor is None:
+        return []
+    cursor_model = ScanEvent if cursor.kind == _SCAN else ReuseHistory
+    cursor_ts = select(cursor_model.ts).where(cursor_model.id == cursor.id).scalar_subquery()
+    later = kind > cursor.kind if order == "asc" else kind < cursor.kind
+    if kind == cursor.kind:
+        pair, cursor_pair = tuple_(ts, row_id), tuple_(cursor_ts, cursor.id)
+        return [pair > cursor_pair if order == "asc" else pair < cursor_pair]
+    if later:
+        return [ts >= cursor_ts if order == "asc" else ts <= cursor_ts]
+    return [ts > cursor_ts if order == "asc" else ts < cursor_ts]
+
+
+def _direction(order: SortOrder) -> Callable[[Any], Any]:
+    return (lambda column: column.asc()) if order == "asc" else (lambda column: column.desc())
+
+
+def scan_branch(
+    code_id: uuid.UUID, limit: int, cursor: TimelineCursor | None = None, order: SortOrder = "asc"
+) -> Select:
+    direction = _direction(order)
+    return (
+        select(
+            ScanEvent.ts.label("ts"),
+            literal(_SCAN, Integer).label("kind"),
+            ScanEvent.id.label("id"),
+            ScanEvent.reuse_cycle_at_scan.label("reuse_cycle"),
+            ScanEvent.ip.label("ip"),
+            ScanEvent.device.label("device"),
+            cast(null(), String).label("reason"),
+            cast(null(), Text).label("note"),
+        )
+        .where(
+            ScanEvent.code_id == code_id,
+            *_after_cursor(ScanEvent.ts, ScanEvent.id, _SCAN, cursor, order),
+        )
+        .order_by(direction(ScanEvent.ts), direction(ScanEvent.id))
+        .limit(limit)
+    )
+
+
+def reuse_branch(
+    code_id: uuid.UUID, limit: int, cursor: TimelineCursor | None = None, order: SortOrder = "asc"
+) -> Select:
+    direction = _direction(order)
+    return (
+        select(
+            ReuseHistory.ts.label("ts"),
+            literal(_REUSE, Integer).label("kind"),
+            ReuseHistory.id.label("id"),
+            ReuseHistory.cycle.label("reuse_cycle"),
+            cast(null(), String).label("ip"),
+            cast(null(), String).label("device"),
+            ReuseHistory.reason.label("reason"),
+            ReuseHistory.note.label("note"),
+        )
+        .where(
+            ReuseHistory.code_id == code_id,
+            *_after_cursor(ReuseHistory.ts, ReuseHistory.id, _REUSE, cursor, order),
+        )
+        .order_by(direction(ReuseHistory.ts), direction(ReuseHistory.id))
+        .limit(limit)
+    )
+
+
+def timeline_query(
+    code_id: uuid.UUID, limit: int, cursor: TimelineCursor | None = None, order: SortOrder = "asc"
+) -> Select:
+    """``limit`` sự kiện kế tiếp sau ``cursor``; chỉ phần gộp cuối (tối đa ``2 * limit`` dòng) cần
+    sort, mỗi nhánh đọc thẳng theo thứ tự index."""
+    direction = _direction(order)
+    branches = [
+        branch(code_id, limit, cursor, order).subquery() for branch in (scan_branch, reuse_branch)
+    ]
+    merged = union_all(*(select(branch) for branch in branches)).subquery()
+    return (
+        select(merged)
+        .order_by(direction(merged.c.ts), direction(merged.c.kind), direction(merged.c.id))
+        .limit(limit)
+    )
+
+
+async def timeline_page(
+    db: AsyncSession,
+    code_id: uuid.UUID,
+    limit: int,
+    cursor: TimelineCursor | None = None,
+    order: SortOrder = "asc",
+) -> tuple[list[dict[str, Any]], str | None]:
+    """Một trang sự kiện và cursor của trang sau (``None`` nếu đã hết)."""
+    rows = (await db.execute(timeline_query(code_id, limit + 1, cursor, order))).all()
+    entries = []
+    for row in rows[:limit]:
+        if row.kind == _SCAN:
+            entry = {"event": "scan", "meta": {"ip": row.ip, "device": row.device}}
+        else:
+            entry = {"event": "reuse_start", "meta": {"reason": row.reason, "note": row.note}}
+        entries.append({**entry, "ts": row.ts, "reuse_cycle": row.reuse_cycle})
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = TimelineCursor(last.kind, last.id).encode()
+    return entries, next_cursor
+
+
+async def scan_total(db: AsyncSession, code_id: uuid.UUID) -> int:
+    """Tổng lượt quét từ rollup ngày: chi phí theo số ngày có quét, không theo số lượt quét."""
+    total = await db.scalar(
+        select(func.coalesce(func.sum(ScanRollupDaily.count), 0)).where(
+            ScanRollupDaily.code_id == code_id
+        )
+    )
+    return int(total or 0)
+
+
+def _floor(unit: BucketUnit, ts: datetime) -> datetime:
+    hour = hour_bucket(ts)
+    return hour if unit == "hour" else hour.replace(hour=0)
+
+
+def _to_utc(value: datetime) -> datetime:
+    # giá trị không có tz được hiểu là UTC, không phụ thuộc TZ của server
+    return value.replace(tzinfo=UTC) if value.tzinfo is None else value.astimezone(UTC)
+
+
+def bucket_window(
+    unit: BucketUnit, start: datetime | None, end: datetime | None
+) -> tuple[datetime, datetime]:
+    """Cửa sổ ``[start, end)`` theo UTC, ``start`` làm tròn xuống đầu bucket chứa nó.
+
+    ``start``/``end`` không có tz được hiểu là UTC.
+    """
+    end = _to_utc(end) if end else datetime.now(UTC)
+    start = _floor(unit, _to_utc(start) if start else end - DEFAULT_WINDOWS[unit])
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start phải trước end")
+    if end - start > MAX_WINDOWS[unit]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cửa sổ theo {unit} tối đa {MAX_WINDOWS[unit].days} ngày",
+        )
+    return start, end
+
+
+def _truncate(dialect_name: str, unit: BucketUnit, column: Any) -> ColumnElement:
+    if dialect_name == "postgresql":
+        return func.date_trunc(unit, column)
+    # SQLite lưu thời gian dạng chuỗi ISO
+    return func.strftime("%Y-%m-%d %H:00:00" if unit == "hour" else "%Y-%m-%d 00:00:00", column)
+
+
+def _as_datetime(value: Any) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return value if value.tzinfo else value.replace(tzinfo=UTC)
+
+
+async def timeline_buckets(
+    db: AsyncSession,
+    code_id: uuid.UUID,
+    unit: BucketUnit,
+    group_by: GroupBy,
+    start: datetime,
+    end: datetime,
+) -> list[dict[str, Any]]:
+    """Số lượt quét theo bucket và thiết bị/vị trí trong ``[start, end)``."""
+    if group_by == "device":
+        rollup = ScanRollupHourly if unit == "hour" else ScanRollupDaily
+        if unit == "hour":
+            in_window = [rollup.bucket >= start, rollup.bucket < end]
+        else:
+            last_day = day_bucket(end - timedelta(microseconds=1))
+            in_window = [rollup.bucket >= start.date(), rollup.bucket <= last_day]
+        query = (
+            select(rollup.bucket, rollup.device, func.sum(rollup.count))
+            .where(rollup.code_id == code_id, *in_window)
+            .group_by(rollup.bucket, rollup.device)
+            .order_by(rollup.bucket, rollup.device)
+        )
+    else:
+        bucket = _truncate(db.get_bind().dialect.name, unit, ScanEvent.ts).label("bucket")
+        geo = func.coalesce(ScanEvent.approx_geo, UNKNOWN_DEVICE).label("geo")
+        query = (
+            select(bucket, geo, func.count())
+            .where(ScanEvent.code_id == code_id, ScanEvent.ts >= start, ScanEvent.ts < end)
+            .group_by(bucket, geo)
+            .order_by(bucket, geo)
+        )
+    rows = await db.execute(query)
+    return [
+        {"bucket": _as_datetime(bucket_value), "key": key, "count": int(count)}
+        for bucket_value, key, count in rows
+    ]
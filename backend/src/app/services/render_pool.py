@@ -0,0 +1,136 @@
+"""Pool render QR chạy ngoài event loop với hàng đợi giới hạn."""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import threading
+from collections.abc import AsyncIterator, Iterable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any
+
+from app.core.config import settings
+from app.utils.qr_renderer import RenderArtifacts, render_artifacts_job
+
+
+class RenderQueueFull(Exception):
+    """Số job đang chạy + đang chờ đã chạm giới hạn cấu hình."""
+
+
+class RenderPool:
+    """Chạy ``ImageMaskQrRenderer.render_artifacts`` trên process pool.
+
+    Việc render (PIL, Otsu, tìm version) là CPU-bound nên không được chạy trên thread của event
+    loop. Tối đa ``workers`` job chạy song song và ``queue_size`` job chờ; vượt quá thì
+    ``RenderQueueFull`` được raise ngay để API trả 503 thay vì dồn hàng đợi vô hạn.
+    """
+
+    # ``render_many`` chờ bao lâu trước khi thử lấy lại slot khi pool đầy
+    _FULL_RETRY_SECONDS = 0.05
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor: Executor | None = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return max(self.workers, 1) + self.queue_size
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def full(self) -> bool:
+        return self._pending >= self.capacity
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.workers > 0:
+                    # spawn: không fork process đang giữ event loop/thread của uvicorn
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=1, thread_name_prefix="qr-render"
+                    )
+            return self._executor
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise RenderQueueFull
+            self._pending += 1
+
+    def _release(self, _: Future | None = None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, executor: Executor, params: dict[str, Any]) -> asyncio.Future:
+        """Gửi job đã được tính vào ``pending``; slot chỉ được trả khi job thực sự kết thúc.
+
+        Request bị huỷ (client ngắt kết nối) chỉ huỷ được job còn chờ; job đang chạy vẫn giữ
+        slot tới khi xong, nên ``pending`` luôn phản ánh đúng tải của worker.
+        """
+        try:
+            future = executor.submit(render_artifacts_job, params)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    async def render(self, params: dict[str, Any]) -> RenderArtifacts:
+        # tạo executor trước khi lấy slot: lỗi tạo executor không được làm mất slot
+        executor = self._get_executor()
+        self._acquire()
+        return await self._submit(executor, params)
+
+    async def render_many(
+        self, params_list: Iterable[dict[str, Any]]
+    ) -> AsyncIterator[tuple[int, RenderArtifacts]]:
+        """Render cả lô, trả về ``(index, artifacts)`` theo thứ tự hoàn thành.
+
+        Khác ``render``, lô lớn không bị từ chối khi hàng đợi đầy: chỉ giữ tối đa 2 job mỗi
+        worker trong executor (đủ để worker không rảnh) và chờ job xong mới nạp tiếp. Mỗi job lấy
+        slot như ``render`` nên lô không bao giờ đẩy ``pending`` vượt ``capacity``; khi pool đầy
+        job của request khác, lô chờ slot trống thay vì chen lên trước.
+        """
+        executor = self._get_executor()
+        window = max(self.workers, 1) * 2
+        jobs = enumerate(params_list)
+        job = next(jobs, None)
+        in_flight: dict[asyncio.Future[RenderArtifacts], int] = {}
+        try:
+            while job is not None or in_flight:
+                while job is not None and len(in_flight) < window:
+                    try:
+                        self._acquire()
+                    except RenderQueueFull:
+                        break
+                    index, params = job
+                    in_flight[self._submit(executor, params)] = index
+                    job = next(jobs, None)
+                if not in_flight:
+                    await asyncio.sleep(self._FULL_RETRY_SECONDS)
+                    continue
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    index = in_flight.pop(future)
+                    yield index, future.result()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+render_pool = RenderPool(settings.render_workers, settings.render_queue_size)
@@ -0,0 +1,257 @@
+"""Xuất scan event dạng stream: server-side cursor -> mã hoá từng lô -> (tuỳ chọn) gzip.
+
+Truy vấn chỉ lấy các cột cần xuất (tuple, không dựng object ORM) và đọc qua
+``AsyncSession.stream`` với ``yield_per``, nên mỗi lúc chỉ có một lô ``export_fetch_size`` dòng
+nằm trong bộ nhớ, bất kể file xuất lớn đến đâu.
+
+Định dạng (``EXPORT_FORMATS``): ``csv``, ``ndjson``, ``arrow`` (Arrow IPC stream) và ``parquet``.
+Arrow/Parquet cần ``pyarrow`` (extra ``export``); mỗi lô từ cursor thành một record batch
+(Parquet: một row group) với ``ts`` kiểu timestamp UTC và ``code_id`` kiểu UUID (16 byte nhị phân
+trên pyarrow chưa có kiểu ``uuid``).
+
+Thứ tự xuất là ``(ts, id)`` giảm dần. Khi tải bị đứt, client gửi lại ``id`` của dòng cuối đã
+nhận (``resume_after``) để xuất tiếp từ dòng kế tiếp (keyset pagination, không dùng OFFSET).
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import uuid
+import zlib
+from collections.abc import AsyncIterator, Callable, Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import Row, Select, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.models.scan_event import ScanEvent
+
+try:  # pragma: no cover - phụ thuộc optional
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except Exception:  # pragma: no cover
+    pa = None  # type: ignore
+    pq = None  # type: ignore
+
+EXPORT_COLUMNS = (
+    ScanEvent.id,
+    ScanEvent.code_id,
+    ScanEvent.ts,
+    ScanEvent.ip,
+    ScanEvent.device,
+    ScanEvent.approx_geo,
+)
+EXPORT_HEADER = [column.key for column in EXPORT_COLUMNS]
+
+
+def export_query(
+    code_id: uuid.UUID | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after_id: int | None = None,
+) -> Select:
+    query = select(*EXPORT_COLUMNS)
+    if code_id:
+        query = query.where(ScanEvent.code_id == code_id)
+    if start:
+        query = query.where(ScanEvent.ts >= start)
+    if end:
+        query = query.where(ScanEvent.ts <= end)
+    if after_id is not None:
+        # so sánh ts ngay trong SQL: ts đọc ra rồi bind lại có thể lệch định dạng (SQLite lưu chuỗi)
+        after_ts = select(ScanEvent.ts).where(ScanEvent.id == after_id).scalar_subquery()
+        query = query.where(tuple_(ScanEvent.ts, ScanEvent.id) < tuple_(after_ts, after_id))
+    return query.order_by(ScanEvent.ts.desc(), ScanEvent.id.desc())
+
+
+async def check_resume_point(db: AsyncSession, scan_id: int) -> None:
+    """404 nếu dòng ``resume_after`` không tồn tại (thay vì âm thầm xuất rỗng)."""
+    if await db.scalar(select(ScanEvent.id).where(ScanEvent.id == scan_id)) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy scan event để xuất tiếp"
+        )
+
+
+async def iter_row_batches(
+    session_factory: async_sessionmaker[AsyncSession], query: Select, batch_size: int
+) -> AsyncIterator[Sequence[Row]]:
+    """Các lô dòng đọc từ server-side cursor; session được mở và đóng trong chính generator."""
+    async with session_factory() as db:
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            yield partition
+
+
+def _csv_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def csv_chunks(
+    batches: AsyncIterator[Sequence[Row]], header: bool = True
+) -> AsyncIterator[bytes]:
+    """Mỗi lô dòng thành một chunk CSV UTF-8; ``header=False`` khi xuất tiếp để nối vào file cũ."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_HEADER)
+        yield buffer.getvalue().encode("utf-8")
+    async for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int) -> AsyncIterator[bytes]:
+    """Nén gzip liên tục; mỗi chunk được sync-flush để client nhận dữ liệu ngay theo từng lô."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def ndjson_chunks(
+    batches: AsyncIterator[Sequence[Row]], header: bool = True
+) -> AsyncIterator[bytes]:
+    """Mỗi dòng một object JSON; ``header`` không dùng (giữ chung chữ ký với các encoder khác)."""
+    async for rows in batches:
+        lines = (
+            json.dumps(
+                {
+                    name: str(value) if isinstance(value, uuid.UUID) else _csv_value(value)
+                    for name, value in zip(EXPORT_HEADER, row, strict=True)
+                },
+                ensure_ascii=False,
+            )
+            for row in rows
+        )
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _ChunkSink:
+    """File chỉ ghi cho pyarrow: gom byte đã ghi để phát đi, ``tell`` vẫn tính từ đầu file."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data: Any) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def require_pyarrow() -> None:
+    if pa is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Định dạng này cần cài pyarrow (pip install '.[export]')",
+        )
+
+
+def arrow_schema() -> pa.Schema:
+    require_pyarrow()
+    uuid_type = pa.uuid() if hasattr(pa, "uuid") else pa.binary(16)
+    return pa.schema(
+        [
+            pa.field("id", pa.int64(), nullable=False),
+            pa.field("code_id", uuid_type, nullable=False, metadata={"logical_type": "uuid"}),
+            pa.field("ts", pa.timestamp("us", tz="UTC")),
+            pa.field("ip", pa.string()),
+            pa.field("device", pa.string()),
+            pa.field("approx_geo", pa.string()),
+        ]
+    )
+
+
+def _record_batch(schema: pa.Schema, rows: Sequence[Row]) -> pa.RecordBatch:
+    columns = (list(column) for column in zip(*rows, strict=True))
+    ids, code_ids, timestamps, ips, devices, geos = columns
+    uuid_type = schema.field("code_id").type
+    code_storage = pa.array([code_id.bytes for code_id in code_ids], pa.binary(16))
+    if isinstance(uuid_type, pa.ExtensionType):
+        code_array = pa.ExtensionArray.from_storage(uuid_type, code_storage)
+    else:
+        code_array = code_storage
+    # SQLite trả về datetime không tz: coi như UTC giống cột timestamptz của Postgres
+    arrays = [
+        pa.array(ids, pa.int64()),
+        code_array,
+        pa.array(timestamps, schema.field("ts").type),
+        pa.array(ips, pa.string()),
+        pa.array(devices, pa.string()),
+        pa.array(geos, pa.string()),
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+async def arrow_chunks(
+    batches: AsyncIterator[Sequence[Row]], header: bool = True
+) -> AsyncIterator[bytes]:
+    """Arrow IPC stream: schema ở chunk đầu, sau đó mỗi lô là một record batch."""
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+    yield sink.drain()
+    async for rows in batches:
+        if rows:
+            writer.write_batch(_record_batch(schema, rows))
+            yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+async def parquet_chunks(
+    batches: AsyncIterator[Sequence[Row]], header: bool = True
+) -> AsyncIterator[bytes]:
+    """Parquet nén zstd; mỗi lô là một row group, footer được ghi ở chunk cuối."""
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    async for rows in batches:
+        if rows:
+            writer.write_batch(_record_batch(schema, rows))
+            yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+@dataclass(frozen=True)
+class ExportFormat:
+    media_type: str
+    encoder: Callable[..., AsyncIterator[bytes]]
+    # Parquet đã tự nén theo cột, gzip thêm một lớp chỉ tốn CPU
+    gzip: bool = True
+    needs_pyarrow: bool = False
+
+
+EXPORT_FORMATS: dict[str, ExportFormat] = {
+    "csv": ExportFormat("text/csv", csv_chunks),
+    "ndjson": ExportFormat("application/x-ndjson", ndjson_chunks),
+    "arrow": ExportFormat("application/vnd.apache.arrow.stream", arrow_chunks, needs_pyarrow=True),
+    "parquet": ExportFormat(
+        "application/vnd.apache.parquet", parquet_chunks, gzip=False, needs_pyarrow=True
+    ),
+}
@@ -0,0 +1,320 @@
+"""Ghi scan event kiểu write-behind: đưa vào buffer rồi flush theo lô bằng một INSERT nhiều dòng.
+
+``POST /api/scan`` chỉ cần đẩy event vào buffer là trả về; một thread nền gom tối đa
+``scan_ingest_batch_size`` event hoặc chờ tối đa ``scan_ingest_flush_interval_ms`` rồi ghi cả lô
+trong một transaction (kèm cập nhật rollup, xem ``scan_rollup``). Thời điểm quét (``ts``) được
+lấy lúc event vào buffer, không phải lúc flush.
+
+Hai loại buffer (``scan_ingest_mode``):
+
+- ``memory``: deque trong process. Lô ghi lỗi được trả lại đầu hàng đợi và thử lại; khi tắt
+  ứng dụng buffer được xả hết. Event mất nếu process chết đột ngột.
+- ``redis``: list Redis theo mẫu reliable queue. Lô đang ghi được chuyển sang list ``processing``
+  riêng của từng consumer và chỉ bị xoá sau khi commit xong; consumer chết giữa chừng thì lô
+  được trả lại hàng đợi khi consumer khác khởi động (at-least-once: có thể ghi trùng, không mất).
+
+Buffer đầy hoặc Redis lỗi/timeout (``scan_ingest_redis_timeout_ms``) thì event được ghi ngay
+trên threadpool như chế độ ``sync`` thay vì bị bỏ; event loop không bao giờ chờ Redis hay
+database quá timeout.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Callable
+from datetime import UTC, datetime
+from typing import Any
+
+import redis
+import redis.asyncio as aioredis
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.scan_event import ScanEvent
+from app.services.scan_rollup import rollup_writes
+
+logger = logging.getLogger(__name__)
+
+ScanRow = dict[str, Any]
+
+# kiểm tra độ dài và RPUSH trong một lệnh: nhiều worker đẩy cùng lúc không vượt được max_size
+PUSH_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[1]) then
+    return -1
+end
+return redis.call('RPUSH', KEYS[1], ARGV[2])
+"""
+
+
+def _dump_row(row: ScanRow) -> str:
+    return json.dumps({**row, "code_id": str(row["code_id"]), "ts": row["ts"].isoformat()})
+
+
+def _load_row(raw: str) -> ScanRow:
+    row = json.loads(raw)
+    row["code_id"] = uuid.UUID(row["code_id"])
+    row["ts"] = datetime.fromisoformat(row["ts"])
+    return row
+
+
+class BufferFull(Exception):
+    """Buffer đã chạm ``scan_ingest_max_buffer`` hoặc không ghi được vào Redis."""
+
+
+class MemoryScanBuffer:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._rows: deque[ScanRow] = deque()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    async def push(self, row: ScanRow) -> int:
+        """Thêm event vào cuối buffer; trả về số event đang chờ."""
+        with self._lock:
+            if len(self._rows) >= self.max_size:
+                raise BufferFull
+            self._rows.append(row)
+            return len(self._rows)
+
+    def take(self, limit: int) -> list[ScanRow]:
+        with self._lock:
+            return [self._rows.popleft() for _ in range(min(limit, len(self._rows)))]
+
+    def ack(self, rows: list[ScanRow]) -> None:
+        pass
+
+    def nack(self, rows: list[ScanRow]) -> None:
+        with self._lock:
+            self._rows.extendleft(reversed(rows))
+
+    def recover(self) -> None:
+        pass
+
+
+class RedisScanBuffer:
+    """Reliable queue trên Redis.
+
+    ``<key>`` là hàng đợi, ``<key>:processing:<consumer>`` là lô consumer đang ghi.
+
+    ``push`` chạy trên event loop nên dùng client ``redis.asyncio``; ``take``/``ack``/``nack`` chạy
+    trong thread flush với client đồng bộ. Cả hai client đều có timeout kết nối và đọc/ghi.
+    """
+
+    HEARTBEAT_TTL = 30
+
+    def __init__(self, redis_url: str, key: str, max_size: int, timeout: float = 0.1):
+        self.key = key
+        self.max_size = max_size
+        self.timeout = timeout
+        self.consumer = uuid.uuid4().hex
+        self.processing_key = f"{key}:processing:{self.consumer}"
+        self._redis_url = redis_url
+        self._client: redis.Redis | None = None
+        self._async_client: aioredis.Redis | None = None
+        self._push_script = None
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis.from_url(
+                self._redis_url,
+                decode_responses=True,
+                socket_timeout=self.timeout,
+                socket_connect_timeout=self.timeout,
+            )
+        return self._client
+
+    @client.setter
+    def client(self, client: redis.Redis) -> None:
+        self._client = client
+
+    @property
+    def async_client(self) -> aioredis.Redis:
+        if self._async_client is None:
+            self._async_client = aioredis.Redis.from_url(
+                self._redis_url,
+                decode_responses=True,
+                socket_timeout=self.timeout,
+                socket_connect_timeout=self.timeout,
+            )
+        if self._push_script is None:
+            self._push_script = self._async_client.register_script(PUSH_SCRIPT)
+        return self._async_client
+
+    @async_client.setter
+    def async_client(self, client: aioredis.Redis) -> None:
+        self._async_client = client
+        self._push_script = None
+
+    def __len__(self) -> int:
+        try:
+            return int(self.client.llen(self.key))
+        except (redis.RedisError, OSError):
+            return 0
+
+    async def push(self, row: ScanRow) -> int:
+        """RPUSH event nếu hàng đợi chưa đầy; trả về độ dài hàng đợi sau khi thêm."""
+        try:
+            client = self.async_client
+            length = await asyncio.wait_for(
+                self._push_script(
+                    keys=[self.key], args=[self.max_size, _dump_row(row)], client=client
+                ),
+                self.timeout,
+            )
+        except (redis.RedisError, OSError, TimeoutError) as exc:
+            raise BufferFull from exc
+        if length < 0:
+            raise BufferFull
+        return int(length)
+
+    def take(self, limit: int) -> list[ScanRow]:
+        self.client.set(f"{self.key}:alive:{self.consumer}", 1, ex=self.HEARTBEAT_TTL)
+        # lô trước ghi lỗi mà ``nack`` cũng lỗi vẫn nằm trong processing: trả về hàng đợi trước,
+        # nếu không ``ack`` của lô này sẽ xoá luôn cả lô cũ
+        if self.client.llen(self.processing_key):
+            self._requeue(self.processing_key)
+        pipe = self.client.pipeline(transaction=False)
+        for _ in range(limit):
+            pipe.lmove(self.key, self.processing_key, "LEFT", "RIGHT")
+        return [_load_row(raw) for raw in pipe.execute() if raw is not None]
+
+    def ack(self, rows: list[ScanRow]) -> None:
+        self.client.delete(self.processing_key)
+
+    def nack(self, rows: list[ScanRow]) -> None:
+        self._requeue(self.processing_key)
+
+    def recover(self) -> None:
+        """Trả lại hàng đợi các lô của consumer đã chết (hết heartbeat) hoặc của chính mình."""
+        for processing_key in self.client.scan_iter(f"{self.key}:processing:*"):
+            consumer = processing_key.rsplit(":", 1)[-1]
+            if consumer == self.consumer or not self.client.exists(f"{self.key}:alive:{consumer}"):
+                self._requeue(processing_key)
+
+    def _requeue(self, processing_key: str) -> None:
+        # lấy từ cuối processing đẩy về đầu hàng đợi -> giữ nguyên thứ tự ban đầu
+        while self.client.lmove(processing_key, self.key, "RIGHT", "LEFT") is not None:
+            pass
+
+
+class ScanIngestor:
+    """Buffer + thread flush nền cho scan event."""
+
+    def __init__(
+        self,
+        buffer: MemoryScanBuffer | RedisScanBuffer,
+        batch_size: int,
+        flush_interval: float,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        self.buffer = buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._flush_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping.clear()
+        self.buffer.recover()
+        self._thread = threading.Thread(target=self._run, name="scan-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self, drain: bool = True) -> None:
+        """Dừng thread flush; ``drain`` ghi nốt mọi event còn trong buffer."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if drain:
+            try:
+                while self.flush() > 0:
+                    pass
+            except Exception:
+                logger.exception("scan_ingest_drain_failed", extra={"pending": len(self.buffer)})
+
+    async def enqueue(self, row: ScanRow) -> None:
+        """Đưa event vào buffer; buffer đầy/Redis lỗi thì ghi ngay (trên threadpool)."""
+        row.setdefault("ts", datetime.now(UTC))
+        try:
+            pending = await self.buffer.push(row)
+        except BufferFull:
+            await run_in_threadpool(self.write, [row])
+            return
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def write(self, rows: list[ScanRow]) -> None:
+        with self.session_factory() as db:
+            db.execute(insert(ScanEvent), rows)
+            for statement, params in rollup_writes(db.get_bind().dialect.name, rows):
+                db.execute(statement, params)
+            db.commit()
+
+    def flush(self) -> int:
+        """Ghi một lô; trả về số event đã ghi (lô lỗi được trả lại buffer rồi raise)."""
+        with self._flush_lock:
+            rows = self.buffer.take(self.batch_size)
+            if not rows:
+                return 0
+            try:
+                self.write(rows)
+            except Exception:
+                self.buffer.nack(rows)
+                raise
+            self.buffer.ack(rows)
+            return len(rows)
+
+    def _run(self) -> None:
+        backoff = self.flush_interval
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                while self.flush() >= self.batch_size and not self._stopping.is_set():
+                    pass
+                backoff = self.flush_interval
+            except Exception:
+                logger.exception("scan_ingest_flush_failed")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+
+def _build_ingestor() -> ScanIngestor:
+    if settings.scan_ingest_mode == "redis":
+        buffer: MemoryScanBuffer | RedisScanBuffer = RedisScanBuffer(
+            str(settings.redis_url),
+            settings.scan_ingest_redis_key,
+            settings.scan_ingest_max_buffer,
+            timeout=settings.scan_ingest_redis_timeout_ms / 1000,
+        )
+    else:
+        buffer = MemoryScanBuffer(settings.scan_ingest_max_buffer)
+    return ScanIngestor(
+        buffer,
+        batch_size=settings.scan_ingest_batch_size,
+        flush_interval=settings.scan_ingest_flush_interval_ms / 1000,
+    )
+
+
+scan_ingestor = _build_ingestor()
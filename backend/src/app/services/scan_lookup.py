@@ -0,0 +1,229 @@
+"""Cache read-through cho dữ liệu mà mỗi lượt quét cần: trạng thái QR và tên sản phẩm.
+
+Hai bảng tra riêng: ``code_id -> (active, reuse_cycle, product_id, customer_id)`` và
+``product_id -> name``, nên đổi tên sản phẩm chỉ cần xoá một khoá. Tầng 1 là LRU + TTL trong
+process; tầng 2 (tuỳ chọn, ``scan_cache_redis``) là Redis dùng chung giữa các worker. Các thao tác
+ghi (``update_qrcode``, ``start_reuse_cycle``, sửa/xoá sản phẩm) xoá khoá ở cả hai tầng sau khi
+commit; tầng process của worker *khác* vẫn có thể cũ tối đa ``scan_cache_ttl_seconds``.
+
+Lượt đọc DB chạy song song với một lần ghi có thể đọc phải giá trị cũ rồi ghi nó vào cache *sau*
+khi khoá đã bị xoá. Để chặn việc này, mỗi khoá có một số thế hệ: xoá khoá thì tăng thế hệ, và giá
+trị đọc từ DB chỉ được ghi vào cache nếu thế hệ chưa đổi kể từ trước lúc đọc (Redis: so trong
+script Lua; trong process: so bộ đếm số lần xoá).
+
+Mã không tồn tại cũng được cache (ngắn hơn) để quét mã rác không đập thẳng vào DB.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import uuid
+from dataclasses import asdict, dataclass
+
+import redis
+import redis.asyncio as aioredis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.product import Product
+from app.models.qrcode import QrCode
+from app.utils.ttl_cache import MISSING, TtlLruCache
+
+logger = logging.getLogger(__name__)
+
+NEGATIVE_TTL_SECONDS = 5.0
+
+# KEYS: khoá giá trị, khoá thế hệ; ARGV: thế hệ lúc bắt đầu đọc DB, giá trị, TTL (giây)
+SET_IF_CURRENT_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+@dataclass(frozen=True)
+class CodeState:
+    code_id: uuid.UUID
+    active: bool
+    reuse_cycle: int
+    product_id: int | None
+    customer_id: int | None
+
+
+@dataclass(frozen=True)
+class ScanTarget:
+    code_id: uuid.UUID
+    active: bool
+    reuse_cycle: int
+    product_id: int | None
+    customer_id: int | None
+    product_name: str | None
+
+
+class ScanLookupCache:
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        redis_url: str | None = None,
+        redis_ttl: int = 600,
+        redis_timeout: float = 0.05,
+        prefix: str = "scanlookup",
+    ):
+        self.codes = TtlLruCache(max_entries, ttl)
+        self.products = TtlLruCache(max_entries, ttl)
+        self.redis_url = redis_url
+        self.redis_ttl = redis_ttl
+        self.redis_timeout = redis_timeout
+        self.prefix = prefix
+        self._client: aioredis.Redis | None = None
+        self._set_script = None
+        # số lần xoá khoá trong process; đổi trong lúc đọc DB thì không ghi kết quả vào tầng 1
+        self._invalidations = 0
+
+    @property
+    def client(self) -> aioredis.Redis | None:
+        if self._client is None:
+            if self.redis_url is None:
+                return None
+            self._client = aioredis.Redis.from_url(
+                self.redis_url,
+                decode_responses=True,
+                socket_timeout=self.redis_timeout,
+                socket_connect_timeout=self.redis_timeout,
+            )
+        if self._set_script is None:
+            self._set_script = self._client.register_script(SET_IF_CURRENT_SCRIPT)
+        return self._client
+
+    @client.setter
+    def client(self, client: aioredis.Redis) -> None:
+        self._client = client
+        self._set_script = None
+
+    async def get(self, db: AsyncSession, code_id: uuid.UUID) -> ScanTarget | None:
+        """Trạng thái QR + tên sản phẩm; ``None`` nếu mã không tồn tại."""
+        state = await self.code_state(db, code_id)
+        if state is None:
+            return None
+        product_name = await self.product_name(db, state.product_id) if state.product_id else None
+        return ScanTarget(**asdict(state), product_name=product_name)
+
+    async def code_state(self, db: AsyncSession, code_id: uuid.UUID) -> CodeState | None:
+        cached = self.codes.get(code_id)
+        if cached is not MISSING:
+            return cached
+        invalidations = self._invalidations
+        raw, generation = await self._redis_get(f"code:{code_id}")
+        if raw is not None:
+            document = json.loads(raw)
+            state = CodeState(**{**document, "code_id": code_id}) if document else None
+        else:
+            query = select(
+                QrCode.active, QrCode.reuse_cycle, QrCode.product_id, QrCode.customer_id
+            ).where(QrCode.id == code_id)
+            row = (await db.execute(query)).first()
+            state = CodeState(code_id, *row) if row else None
+            document = {k: v for k, v in asdict(state).items() if k != "code_id"} if state else None
+            await self._redis_set(
+                f"code:{code_id}", generation, json.dumps(document), negative=state is None
+            )
+        if invalidations == self._invalidations:
+            self.codes.set(code_id, state, ttl=None if state else NEGATIVE_TTL_SECONDS)
+        return state
+
+    async def product_name(self, db: AsyncSession, product_id: int) -> str | None:
+        cached = self.products.get(product_id)
+        if cached is not MISSING:
+            return cached
+        invalidations = self._invalidations
+        raw, generation = await self._redis_get(f"product:{product_id}")
+        if raw is not None:
+            name = json.loads(raw)
+        else:
+            name = (await db.execute(select(Product.name).where(Product.id == product_id))).scalar()
+            await self._redis_set(
+                f"product:{product_id}", generation, json.dumps(name), negative=name is None
+            )
+        if invalidations == self._invalidations:
+            self.products.set(
+                product_id, name, ttl=None if name is not None else NEGATIVE_TTL_SECONDS
+            )
+        return name
+
+    async def invalidate_code(self, code_id: uuid.UUID) -> None:
+        """Gọi *sau* khi commit thay đổi của mã ``code_id``."""
+        self._invalidations += 1
+        self.codes.delete(code_id)
+        await self._redis_delete(f"code:{code_id}")
+
+    async def invalidate_product(self, product_id: int) -> None:
+        """Gọi *sau* khi commit thay đổi của sản phẩm ``product_id``."""
+        self._invalidations += 1
+        self.products.delete(product_id)
+        await self._redis_delete(f"product:{product_id}")
+
+    def clear(self) -> None:
+        self.codes.clear()
+        self.products.clear()
+
+    # Redis là tầng phụ: lỗi kết nối/timeout chỉ làm mất cache, không làm hỏng lượt quét
+    async def _redis_get(self, key: str) -> tuple[str | None, str | None]:
+        """(giá trị, thế hệ) của khoá; thế hệ ``None`` nghĩa là không được ghi lại vào Redis."""
+        client = self.client
+        if client is None:
+            return None, None
+        try:
+            raw, generation = await asyncio.wait_for(
+                client.mget(f"{self.prefix}:{key}", f"{self.prefix}:{key}:gen"),
+                self.redis_timeout,
+            )
+        except (redis.RedisError, OSError, TimeoutError):
+            return None, None
+        return raw, generation or "0"
+
+    async def _redis_set(
+        self, key: str, generation: str | None, value: str, negative: bool = False
+    ) -> None:
+        client = self.client
+        if client is None or generation is None:
+            return
+        ttl = int(NEGATIVE_TTL_SECONDS) if negative else self.redis_ttl
+        try:
+            await asyncio.wait_for(
+                self._set_script(
+                    keys=[f"{self.prefix}:{key}", f"{self.prefix}:{key}:gen"],
+                    args=[generation, value, ttl],
+                    client=client,
+                ),
+                self.redis_timeout,
+            )
+        except (redis.RedisError, OSError, TimeoutError):
+            pass
+
+    async def _redis_delete(self, key: str) -> None:
+        client = self.client
+        if client is None:
+            return
+        try:
+            async with client.pipeline(transaction=True) as pipe:
+                # thế hệ sống lâu hơn mọi giá trị để lượt đọc đang dở không ghi đè được sau khi xoá
+                pipe.incr(f"{self.prefix}:{key}:gen")
+                pipe.expire(f"{self.prefix}:{key}:gen", self.redis_ttl * 2)
+                pipe.delete(f"{self.prefix}:{key}")
+                await asyncio.wait_for(pipe.execute(), self.redis_timeout)
+        except (redis.RedisError, OSError, TimeoutError):
+            logger.warning("scan_lookup_invalidate_failed", extra={"key": key})
+
+
+scan_lookup = ScanLookupCache(
+    ttl=settings.scan_cache_ttl_seconds,
+    max_entries=settings.scan_cache_max_entries,
+    redis_url=str(settings.redis_url) if settings.scan_cache_redis else None,
+    redis_ttl=settings.scan_cache_redis_ttl_seconds,
+    redis_timeout=settings.scan_cache_redis_timeout_ms / 1000,
+)
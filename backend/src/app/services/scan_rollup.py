@@ -0,0 +1,263 @@
+"""Bảng tổng hợp lượt quét theo giờ/ngày (``scan_rollups_hourly``/``scan_rollups_daily``).
+
+Hai cách cập nhật:
+
+- Khi ghi scan event (``POST /api/scan`` ở chế độ ``sync`` hoặc mỗi lô của ``ScanIngestor``): các
+  event được gom theo ``(bucket, code_id, device, product_id, customer_id)`` rồi UPSERT
+  ``count = count + n`` trong cùng transaction với INSERT event, nên rollup luôn khớp với
+  ``scan_events``.
+- ``compact``: tính lại rollup của một khoảng giờ *đã đóng* từ ``scan_events`` (backfill sau khi
+  migrate, sửa lệch). ``RollupCompactor`` chạy nó định kỳ cho ``scan_rollup_compact_lookback_hours``
+  giờ gần nhất, chừa ``scan_rollup_compact_grace_seconds`` cho event write-behind đến muộn.
+
+Bucket tính theo UTC. Event không có ``device`` được tính vào ``unknown``. Chủ sở hữu lấy từ
+``scan_events.product_id``/``customer_id`` (ghi lúc quét), không join ``qrcodes``: mã được gán lại
+thì lượt quét cũ vẫn thuộc sản phẩm/khách hàng cũ.
+
+Chạy tay::
+
+    python -m app.services.scan_rollup --since 2024-01-01
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import threading
+import uuid
+from collections import Counter
+from collections.abc import Callable, Iterable
+from datetime import UTC, date, datetime, time, timedelta
+from typing import Any
+
+from sqlalchemy import Insert, Table, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.scan_event import ScanEvent
+from app.models.scan_rollup import ScanRollupDaily, ScanRollupHourly
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_DEVICE = "unknown"
+# giá trị product_id/customer_id của rollup khi mã chưa gán (cột thuộc khoá chính, không được NULL)
+NO_OWNER = 0
+
+# (bucket, code_id, device, product_id, customer_id)
+RollupKey = tuple[Any, uuid.UUID, str, int, int]
+
+
+def _rollup_key(
+    bucket: Any,
+    code_id: uuid.UUID,
+    device: str | None,
+    product_id: int | None,
+    customer_id: int | None,
+) -> RollupKey:
+    return (
+        bucket,
+        code_id,
+        device or UNKNOWN_DEVICE,
+        product_id or NO_OWNER,
+        customer_id or NO_OWNER,
+    )
+
+
+def _utc(ts: datetime) -> datetime:
+    # SQLite trả về datetime không tz (lưu UTC); Postgres trả theo timezone của session
+    return ts.replace(tzinfo=UTC) if ts.tzinfo is None else ts.astimezone(UTC)
+
+
+def hour_bucket(ts: datetime) -> datetime:
+    return _utc(ts).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(ts: datetime) -> date:
+    return _utc(ts).date()
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=UTC)
+
+
+def _rows(counts: Counter[RollupKey]) -> list[dict[str, Any]]:
+    # thứ tự khoá cố định -> các UPSERT đồng thời khoá dòng theo cùng thứ tự, tránh deadlock
+    return [
+        {
+            "bucket": bucket,
+            "code_id": code_id,
+            "device": device,
+            "product_id": product_id,
+            "customer_id": customer_id,
+            "count": count,
+        }
+        for (bucket, code_id, device, product_id, customer_id), count in sorted(
+            counts.items(), key=lambda item: (item[0][0], str(item[0][1]), *item[0][2:])
+        )
+    ]
+
+
+def _upsert(dialect_name: str, table: Table) -> Insert:
+    if dialect_name == "postgresql":
+        statement = pg_insert(table)
+    elif dialect_name == "sqlite":
+        statement = sqlite_insert(table)
+    else:
+        raise NotImplementedError(f"Rollup chưa hỗ trợ database {dialect_name}")
+    return statement.on_conflict_do_update(
+        index_elements=["bucket", "code_id", "device", "product_id", "customer_id"],
+        set_={"count": table.c["count"] + statement.excluded["count"]},
+    )
+
+
+def rollup_writes(
+    dialect_name: str, events: Iterable[dict[str, Any]]
+) -> list[tuple[Insert, list[dict[str, Any]]]]:
+    """Các cặp (câu UPSERT, tham số) cộng ``events`` vào rollup giờ và ngày."""
+    hourly: Counter[RollupKey] = Counter()
+    daily: Counter[RollupKey] = Counter()
+    for event in events:
+        ts = event.get("ts") or datetime.now(UTC)
+        rest = (
+            event["code_id"], event.get("device"), event.get("product_id"), event.get("customer_id")
+        )
+        hourly[_rollup_key(hour_bucket(ts), *rest)] += 1
+        daily[_rollup_key(day_bucket(ts), *rest)] += 1
+    return [
+        (_upsert(dialect_name, ScanRollupHourly.__table__), _rows(hourly)),
+        (_upsert(dialect_name, ScanRollupDaily.__table__), _rows(daily)),
+    ]
+
+
+def compact(db: Session, since: datetime, until: datetime) -> tuple[int, int]:
+    """Tính lại rollup giờ trong ``[since, until)`` từ ``scan_events`` và rollup ngày của các ngày
+    đã trọn vẹn trước ``until`` (cộng từ rollup giờ). Trả về số dòng (giờ, ngày) đã ghi.
+
+    Khoảng này phải đã đóng: event ghi vào giữa lúc tính lại sẽ bị đếm thiếu hoặc trùng.
+    """
+    since, until = hour_bucket(since), hour_bucket(until)
+    if since >= until:
+        return 0, 0
+
+    hourly: Counter[RollupKey] = Counter()
+    events = (
+        select(
+            ScanEvent.ts,
+            ScanEvent.code_id,
+            ScanEvent.device,
+            ScanEvent.product_id,
+            ScanEvent.customer_id,
+        )
+        .where(ScanEvent.ts >= since, ScanEvent.ts < until)
+        .execution_options(yield_per=settings.export_fetch_size)
+    )
+    for ts, *rest in db.execute(events):
+        hourly[_rollup_key(hour_bucket(ts), *rest)] += 1
+    hourly_rows = _rows(hourly)
+    db.execute(
+        delete(ScanRollupHourly).where(
+            ScanRollupHourly.bucket >= since, ScanRollupHourly.bucket < until
+        )
+    )
+    if hourly_rows:
+        db.execute(ScanRollupHourly.__table__.insert(), hourly_rows)
+
+    # ngày D trọn vẹn khi D < ngày của until; rollup giờ trước ``since`` đã có sẵn từ lần trước
+    first_day, end_day = since.date(), until.date()
+    daily: Counter[RollupKey] = Counter()
+    if first_day < end_day:
+        hours = select(
+            ScanRollupHourly.bucket,
+            ScanRollupHourly.code_id,
+            ScanRollupHourly.device,
+            ScanRollupHourly.product_id,
+            ScanRollupHourly.customer_id,
+            ScanRollupHourly.count,
+        ).where(
+            ScanRollupHourly.bucket >= _day_start(first_day),
+            ScanRollupHourly.bucket < _day_start(end_day),
+        )
+        for bucket, code_id, device, product_id, customer_id, count in db.execute(hours):
+            daily[(day_bucket(bucket), code_id, device, product_id, customer_id)] += count
+        db.execute(
+            delete(ScanRollupDaily).where(
+                ScanRollupDaily.bucket >= first_day, ScanRollupDaily.bucket < end_day
+            )
+        )
+    daily_rows = _rows(daily)
+    if daily_rows:
+        db.execute(ScanRollupDaily.__table__.insert(), daily_rows)
+    db.commit()
+    return len(hourly_rows), len(daily_rows)
+
+
+def compact_recent(db: Session, now: datetime | None = None) -> tuple[int, int]:
+    until = (now or datetime.now(UTC)) - timedelta(
+        seconds=settings.scan_rollup_compact_grace_seconds
+    )
+    since = until - timedelta(hours=settings.scan_rollup_compact_lookback_hours)
+    return compact(db, since, until)
+
+
+class RollupCompactor:
+    """Thread nền gọi ``compact_recent`` mỗi ``interval`` giây."""
+
+    def __init__(self, interval: float, session_factory: Callable[[], Session] = SessionLocal):
+        self.interval = interval
+        self.session_factory = session_factory
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="scan-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self) -> tuple[int, int]:
+        with self.session_factory() as db:
+            return compact_recent(db)
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            try:
+                hourly, daily = self.run_once()
+                logger.info(
+                    "scan_rollup_compacted", extra={"hourly_rows": hourly, "daily_rows": daily}
+                )
+            except Exception:
+                logger.exception("scan_rollup_compact_failed")
+
+
+rollup_compactor = RollupCompactor(settings.scan_rollup_compact_interval_seconds)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Tính lại rollup lượt quét từ scan_events")
+    parser.add_argument(
+        "--since", type=datetime.fromisoformat, help="Mặc định: cửa sổ compact định kỳ"
+    )
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Mặc định: giờ hiện tại (UTC)")
+    args = parser.parse_args(argv)
+    with SessionLocal() as db:
+        if args.since is None:
+            hourly, daily = compact_recent(db)
+        else:
+            until = args.until or datetime.now(UTC)
+            hourly, daily = compact(db, args.since, until)
+    print(f"hourly={hourly} daily={daily}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+"""Backend lưu file được chọn theo ``settings.storage_backend``."""
+from __future__ import annotations
+
+from app.core.config import Settings, settings
+from app.storage.base import Storage
+from app.storage.local import LocalStorage
+from app.storage.s3 import Credentials, S3Storage
+
+
+def create_storage(config: Settings) -> Storage:
+    if config.storage_backend == "s3":
+        mib = 1024 * 1024
+        return S3Storage(
+            config.s3_endpoint,
+            config.s3_bucket,
+            Credentials(config.s3_access_key, config.s3_secret_key, config.s3_region),
+            public_endpoint=config.s3_public_endpoint,
+            presign_expires=config.s3_presign_expires_seconds,
+            multipart_threshold=config.s3_multipart_threshold_mb * mib,
+            part_size=config.s3_multipart_part_size_mb * mib,
+            max_concurrency=config.s3_max_concurrency,
+        )
+    return LocalStorage(config.upload_dir)
+
+
+storage = create_storage(settings)
+
+__all__ = ["LocalStorage", "S3Storage", "Storage", "create_storage", "storage"]
@@ -0,0 +1,43 @@
+"""Giao diện chung của các backend lưu file (ảnh QR, mask, logo)."""
+from __future__ import annotations
+
+import mimetypes
+from abc import ABC, abstractmethod
+from typing import BinaryIO
+
+
+def content_type_for(relative_path: str) -> str:
+    content_type, _ = mimetypes.guess_type(relative_path)
+    return content_type or "application/octet-stream"
+
+
+def as_bytes(data: bytes | BinaryIO) -> bytes:
+    return data if isinstance(data, bytes) else data.read()
+
+
+class Storage(ABC):
+    """Backend lưu file theo đường dẫn tương đối (vd. ``qr/<hex>.png``).
+
+    Mọi thao tác I/O đều là coroutine để không chặn event loop. ``url_for`` trả về URL client tải
+    trực tiếp: đường dẫn ``/static`` với backend local, presigned URL với S3 để ảnh không phải đi
+    qua process API.
+    """
+
+    @abstractmethod
+    async def save(self, relative_path: str, data: bytes | BinaryIO) -> str:
+        """Ghi (đè) file và trả về đường dẫn dùng để lưu vào database."""
+
+    @abstractmethod
+    async def open(self, relative_path: str) -> bytes:
+        """Đọc toàn bộ file; ``FileNotFoundError`` nếu không tồn tại."""
+
+    @abstractmethod
+    async def delete(self, relative_path: str) -> None:
+        """Xoá file; không lỗi nếu file đã không còn."""
+
+    @abstractmethod
+    async def url_for(self, relative_path: str) -> str:
+        ...
+
+    async def close(self) -> None:  # noqa: B027 - backend không giữ kết nối thì không cần ghi đè
+        """Giải phóng kết nối (gọi khi app dừng)."""
@@ -0,0 +1,105 @@
+"""Lưu file theo nội dung: mỗi nội dung khác nhau chỉ có một bản trong storage."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from collections.abc import Callable, Sequence
+from datetime import UTC, datetime
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.blob import Blob
+from app.storage import storage as default_storage
+from app.storage.base import Storage
+from app.utils.ttl_cache import MISSING, TtlLruCache
+
+BLOB_PREFIX = "blobs/"
+
+
+def blob_path(data: bytes, suffix: str) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{BLOB_PREFIX}{digest[:2]}/{digest}{suffix}"
+
+
+def is_blob_path(path: str | None) -> bool:
+    return bool(path) and path.startswith(BLOB_PREFIX)
+
+
+class BlobStore:
+    """Ghi file dưới ``blobs/<ab>/<sha256><suffix>``; cùng nội dung thì cùng đường dẫn.
+
+    Nội dung bất biến theo đường dẫn nên ghi đè cũng vô hại; ``known`` chỉ để bỏ qua lượt
+    upload lại những blob process này vừa ghi (logo/mask dùng chung cho nhiều mã). Blob mới ghi
+    chưa có tham chiếu: bên gọi đăng ký ``refcount`` (``app.services.blob_refs``) trong cùng
+    transaction với bản ghi trỏ tới nó.
+
+    Chạy song song với GC (``collect_garbage``): trước khi ghi, ``put`` đặt lại ``updated_at``
+    của dòng ``blobs`` (nếu có) trong transaction riêng. GC chỉ xoá dòng cũ hơn
+    ``blob_gc_grace_seconds`` và xoá file trước khi commit việc xoá dòng, nên:
+
+    - ``put`` chạm trước: điều kiện trong DELETE của GC không còn đúng, dòng và file được giữ;
+    - GC xoá trước: UPDATE chờ khoá dòng tới khi GC commit (file đã bị xoá), không còn dòng nào
+      và ``put`` ghi lại file.
+
+    ``known`` chỉ nhớ tối đa nửa ``grace_seconds`` kể từ lần chạm, nên GC (ở bất kỳ process nào)
+    không thể xoá một blob mà ``known`` còn nhớ.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        known_max_entries: int,
+        known_ttl: float,
+        grace_seconds: float,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        self.storage = storage
+        self.known = TtlLruCache(known_max_entries, min(known_ttl, grace_seconds / 2))
+        self.session_factory = session_factory
+
+    async def put(self, data: bytes, suffix: str) -> tuple[str, bool]:
+        """(đường dẫn, ``True`` nếu lần này thực sự ghi ra storage)."""
+        [(path, written)] = await self.put_many([(data, suffix)])
+        return path, written
+
+    async def put_many(self, items: Sequence[tuple[bytes, str]]) -> list[tuple[str, bool]]:
+        """Như ``put`` cho nhiều file, chạm các dòng ``blobs`` trong một câu lệnh."""
+        paths = [blob_path(data, suffix) for data, suffix in items]
+        pending = {
+            path: data
+            for path, (data, _) in zip(paths, items, strict=True)
+            if self.known.get(path) is MISSING
+        }
+        if pending:
+            await run_in_threadpool(self._touch, sorted(pending))
+            await asyncio.gather(*(self.storage.save(path, data) for path, data in pending.items()))
+            for path in pending:
+                self.known.set(path, True)
+        return [(path, path in pending) for path in paths]
+
+    def _touch(self, paths: list[str]) -> None:
+        with self.session_factory() as db:
+            db.execute(
+                update(Blob.__table__)
+                .where(Blob.path.in_(paths))
+                .values(updated_at=datetime.now(UTC))
+            )
+            db.commit()
+
+    def forget(self, path: str) -> None:
+        self.known.delete(path)
+
+    def clear(self) -> None:
+        self.known.clear()
+
+
+blob_store = BlobStore(
+    default_storage,
+    settings.blob_known_max_entries,
+    settings.blob_known_ttl_seconds,
+    settings.blob_gc_grace_seconds,
+)
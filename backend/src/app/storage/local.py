@@ -1,28 +1,43 @@
 """Lưu file QR vào thư mục upload."""
 from __future__ import annotations
 
+import os
+import uuid
 from pathlib import Path
 from typing import BinaryIO
 
-from app.core.config import settings
+from starlette.concurrency import run_in_threadpool
 
+from app.storage.base import Storage, as_bytes
+
+
+class LocalStorage(Storage):
+    """Lưu file dưới ``base_dir``, phục vụ qua mount ``/static`` của app.
+
+    Ghi/đọc đĩa chạy trên threadpool. File được ghi ra file tạm rồi ``os.replace`` nên request
+    ``/static`` đồng thời không bao giờ đọc phải file ghi dở.
+    """
 
-class LocalStorage:
     def __init__(self, base_dir: Path):
         self.base_dir = base_dir
         self.base_dir.mkdir(parents=True, exist_ok=True)
 
-    def save(self, relative_path: str, data: bytes | BinaryIO) -> str:
+    def _write(self, relative_path: str, data: bytes) -> None:
         path = self.base_dir / relative_path
         path.parent.mkdir(parents=True, exist_ok=True)
-        if isinstance(data, bytes):
-            path.write_bytes(data)
-        else:
-            path.write_bytes(data.read())
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    async def save(self, relative_path: str, data: bytes | BinaryIO) -> str:
+        await run_in_threadpool(self._write, relative_path, as_bytes(data))
         return relative_path
 
-    def url_for(self, relative_path: str) -> str:
-        return f"/static/{relative_path}"
+    async def open(self, relative_path: str) -> bytes:
+        return await run_in_threadpool((self.base_dir / relative_path).read_bytes)
 
+    async def delete(self, relative_path: str) -> None:
+        await run_in_threadpool((self.base_dir / relative_path).unlink, missing_ok=True)
 
-storage = LocalStorage(settings.upload_dir)
+    async def url_for(self, relative_path: str) -> str:
+        return f"/static/{relative_path}"
@@ -0,0 +1,287 @@
+"""Backend lưu file trên S3 hoặc dịch vụ tương thích (MinIO, R2, ...), ký request SigV4 qua httpx.
+
+Object nằm ở ``<endpoint>/<bucket>/<đường dẫn>`` (path-style, MinIO mặc định dùng kiểu này). File
+từ ``multipart_threshold`` byte trở lên (SVG lớn) được tải lên bằng multipart upload, các part
+gửi song song; lỗi giữa chừng thì huỷ upload để không để lại part mồ côi trong bucket.
+
+``url_for`` trả về presigned GET URL ký bằng ``public_endpoint`` (host client nhìn thấy, vd. CDN
+hoặc domain public của MinIO) nên trình duyệt tải ảnh thẳng từ S3, không qua API.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import BinaryIO
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+
+import httpx
+
+from app.storage.base import Storage, as_bytes, content_type_for
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+# S3 yêu cầu mọi part trừ part cuối tối thiểu 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PRESIGN_SECONDS = 7 * 24 * 3600
+
+
+@dataclass(frozen=True)
+class Credentials:
+    access_key: str
+    secret_key: str
+    region: str = "us-east-1"
+    service: str = "s3"
+
+    def scope(self, date: str) -> str:
+        return f"{date}/{self.region}/{self.service}/aws4_request"
+
+    def signing_key(self, date: str) -> bytes:
+        key = f"AWS4{self.secret_key}".encode()
+        for part in (date, self.region, self.service, "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        return key
+
+
+def _quote(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+
+def _canonical_query(params: dict[str, str]) -> str:
+    return "&".join(f"{_quote(k)}={_quote(v)}" for k, v in sorted(params.items()))
+
+
+def _signature(
+    credentials: Credentials,
+    method: str,
+    path: str,
+    params: dict[str, str],
+    headers: dict[str, str],
+    payload_hash: str,
+    amz_date: str,
+) -> str:
+    signed_headers = ";".join(sorted(headers))
+    canonical_request = "\n".join(
+        [
+            method,
+            _quote(path, safe="/-_.~"),
+            _canonical_query(params),
+            "".join(f"{name}:{headers[name].strip()}\n" for name in sorted(headers)),
+            signed_headers,
+            payload_hash,
+        ]
+    )
+    string_to_sign = "\n".join(
+        [
+            ALGORITHM,
+            amz_date,
+            credentials.scope(amz_date[:8]),
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ]
+    )
+    key = credentials.signing_key(amz_date[:8])
+    return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+def _amz_date(now: datetime | None) -> str:
+    return (now or datetime.now(UTC)).strftime("%Y%m%dT%H%M%SZ")
+
+
+def sign_headers(
+    credentials: Credentials,
+    method: str,
+    url: str,
+    params: dict[str, str] | None = None,
+    payload: bytes = b"",
+    headers: dict[str, str] | None = None,
+    now: datetime | None = None,
+) -> dict[str, str]:
+    """Header cần gửi kèm request (``Authorization``, ``x-amz-date``, ``x-amz-content-sha256``)."""
+    parts = urlsplit(url)
+    amz_date = _amz_date(now)
+    payload_hash = hashlib.sha256(payload).hexdigest()
+    signed = {
+        **{name.lower(): value for name, value in (headers or {}).items()},
+        "host": parts.netloc,
+        "x-amz-content-sha256": payload_hash,
+        "x-amz-date": amz_date,
+    }
+    signature = _signature(
+        credentials, method, parts.path or "/", params or {}, signed, payload_hash, amz_date
+    )
+    authorization = (
+        f"{ALGORITHM} Credential={credentials.access_key}/{credentials.scope(amz_date[:8])}, "
+        f"SignedHeaders={';'.join(sorted(signed))}, Signature={signature}"
+    )
+    signed.pop("host")
+    return {**signed, "authorization": authorization}
+
+
+def presign_url(
+    credentials: Credentials,
+    method: str,
+    url: str,
+    expires: int,
+    now: datetime | None = None,
+) -> str:
+    """URL ký sẵn bằng query string, hết hạn sau ``expires`` giây (tối đa 7 ngày)."""
+    parts = urlsplit(url)
+    amz_date = _amz_date(now)
+    params = {
+        "X-Amz-Algorithm": ALGORITHM,
+        "X-Amz-Credential": f"{credentials.access_key}/{credentials.scope(amz_date[:8])}",
+        "X-Amz-Date": amz_date,
+        "X-Amz-Expires": str(min(expires, MAX_PRESIGN_SECONDS)),
+        "X-Amz-SignedHeaders": "host",
+    }
+    host = {"host": parts.netloc}
+    signature = _signature(
+        credentials, method, parts.path or "/", params, host, UNSIGNED_PAYLOAD, amz_date
+    )
+    query = _canonical_query({**params, "X-Amz-Signature": signature})
+    return f"{parts.scheme}://{parts.netloc}{_quote(parts.path, safe='/-_.~')}?{query}"
+
+
+def _xml_text(body: bytes, tag: str) -> str:
+    for element in ElementTree.fromstring(body).iter():
+        if element.tag.rsplit("}", 1)[-1] == tag and element.text:
+            return element.text
+    raise ValueError(f"Phản hồi S3 thiếu <{tag}>")
+
+
+class S3Storage(Storage):
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        credentials: Credentials,
+        *,
+        public_endpoint: str | None = None,
+        presign_expires: int = 3600,
+        multipart_threshold: int = 16 * 1024 * 1024,
+        part_size: int = 8 * 1024 * 1024,
+        max_concurrency: int = 4,
+        timeout: float = 30.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.public_endpoint = (public_endpoint or endpoint).rstrip("/")
+        self.bucket = bucket
+        self.credentials = credentials
+        self.presign_expires = presign_expires
+        self.multipart_threshold = multipart_threshold
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        # transport thay thế (vd. httpx.MockTransport) cho test với stand-in kiểu MinIO
+        self.transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._client_loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # AsyncClient gắn với event loop tạo ra nó: script đồng bộ chạy nhiều asyncio.run liên tiếp
+        # thì mỗi loop cần client riêng
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(timeout=self.timeout, transport=self.transport)
+            self._client_loop = loop
+        return self._client
+
+    def _url(self, relative_path: str, endpoint: str | None = None) -> str:
+        return f"{endpoint or self.endpoint}/{self.bucket}/{relative_path.lstrip('/')}"
+
+    async def _request(
+        self,
+        method: str,
+        relative_path: str,
+        *,
+        params: dict[str, str] | None = None,
+        content: bytes = b"",
+        headers: dict[str, str] | None = None,
+    ) -> httpx.Response:
+        url = self._url(relative_path)
+        signed = sign_headers(self.credentials, method, url, params, content, headers)
+        if params:
+            # tự mã hoá query theo đúng dạng chính tắc đã ký (uploadId có thể chứa ký tự đặc biệt)
+            url = f"{url}?{_canonical_query(params)}"
+        response = await self.client.request(method, url, content=content, headers=signed)
+        if response.status_code == 404 and method in ("GET", "HEAD"):
+            raise FileNotFoundError(relative_path)
+        response.raise_for_status()
+        return response
+
+    async def save(self, relative_path: str, data: bytes | BinaryIO) -> str:
+        payload = as_bytes(data)
+        headers = {"content-type": content_type_for(relative_path)}
+        if len(payload) >= self.multipart_threshold:
+            await self._save_multipart(relative_path, payload, headers)
+        else:
+            await self._request("PUT", relative_path, content=payload, headers=headers)
+        return relative_path
+
+    async def _save_multipart(
+        self, relative_path: str, payload: bytes, headers: dict[str, str]
+    ) -> None:
+        created = await self._request(
+            "POST", relative_path, params={"uploads": ""}, headers=headers
+        )
+        upload_id = _xml_text(created.content, "UploadId")
+        size = self.part_size
+        chunks = [payload[i : i + size] for i in range(0, len(payload), size)]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def upload_part(number: int, chunk: bytes) -> str:
+            async with semaphore:
+                response = await self._request(
+                    "PUT",
+                    relative_path,
+                    params={"partNumber": str(number), "uploadId": upload_id},
+                    content=chunk,
+                )
+            return response.headers["etag"]
+
+        try:
+            etags = await asyncio.gather(
+                *(upload_part(number, chunk) for number, chunk in enumerate(chunks, start=1))
+            )
+            manifest = "".join(
+                f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                for number, etag in enumerate(etags, start=1)
+            )
+            await self._request(
+                "POST",
+                relative_path,
+                params={"uploadId": upload_id},
+                content=f"<CompleteMultipartUpload>{manifest}</CompleteMultipartUpload>".encode(),
+                headers={"content-type": "application/xml"},
+            )
+        except BaseException:
+            try:
+                await self._request("DELETE", relative_path, params={"uploadId": upload_id})
+            except httpx.HTTPError:
+                pass
+            raise
+
+    async def open(self, relative_path: str) -> bytes:
+        return (await self._request("GET", relative_path)).content
+
+    async def delete(self, relative_path: str) -> None:
+        # S3 trả 204 kể cả khi object không tồn tại
+        await self._request("DELETE", relative_path)
+
+    async def url_for(self, relative_path: str) -> str:
+        return presign_url(
+            self.credentials,
+            "GET",
+            self._url(relative_path, self.public_endpoint),
+            self.presign_expires,
+        )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,303 @@
+"""Benchmark ``ImageMaskQrRenderer``: thời gian, peak RSS và dung lượng đầu ra theo từng kịch bản.
+
+Chạy::
+
+    python -m app.utils.bench_renderer --output bench/baseline.json
+    python -m app.utils.bench_renderer --compare bench/baseline.json --output bench/current.json
+
+Mỗi kịch bản chạy trong một process con riêng (``max_tasks_per_child=1``) để peak RSS đo được
+không bị lẫn với kịch bản trước. Cache render bị tắt; mask pyramid chỉ được giữ giữa các lần lặp
+khi dùng ``--warm`` (mặc định mỗi lần lặp tính lại từ ảnh mask gốc).
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from functools import cache
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any
+
+from PIL import Image, ImageDraw
+
+from app.utils.mask_pyramid import mask_pyramids
+from app.utils.qr_renderer import ImageMaskQrRenderer
+from app.utils.render_cache import render_cache
+
+PAYLOAD_LENGTHS = {"short": 24, "medium": 180, "long": 900}
+MASK_KINDS = ("none", "circle", "dense", "sparse")
+SIZES = (256, 1024, 2048, 4096)
+# Ngưỡng mặc định khi so sánh với baseline: tăng quá 20% bị coi là regression
+DEFAULT_TOLERANCE = 0.2
+
+
+@dataclass(frozen=True)
+class BenchCase:
+    payload: str = "short"
+    ecc: str = "M"
+    mask: str = "none"
+    logo: bool = False
+    size: int = 256
+
+    @property
+    def name(self) -> str:
+        logo = "logo" if self.logo else "nologo"
+        return f"{self.payload}-{self.ecc}-{self.mask}-{logo}-{self.size}"
+
+
+def default_cases(quick: bool = False) -> list[BenchCase]:
+    """Tổ hợp các kịch bản: mỗi trục quét riêng quanh một kịch bản gốc thay vì tích Descartes."""
+    base = BenchCase()
+    cases = [base]
+    cases += [BenchCase(payload=name) for name in PAYLOAD_LENGTHS if name != base.payload]
+    cases += [BenchCase(ecc=ecc) for ecc in ("L", "Q", "H") if ecc != base.ecc]
+    # circle/sparse bị từ chối sau khi quét toàn bộ (hàng chục giây) nên chỉ có ở bộ đầy đủ
+    masks = ("dense",) if quick else MASK_KINDS
+    cases += [BenchCase(mask=mask) for mask in masks if mask != base.mask]
+    cases += [BenchCase(logo=True, ecc="H")]
+    sizes = SIZES[:2] if quick else SIZES
+    cases += [BenchCase(size=size) for size in sizes if size != base.size]
+    if not quick:
+        cases += [
+            BenchCase(payload="long", ecc="H", mask="dense", logo=True, size=4096),
+            BenchCase(payload="medium", ecc="Q", mask="dense", size=2048),
+        ]
+    return cases
+
+
+def _png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@cache
+def mask_bytes(kind: str) -> bytes | None:
+    """Mask tổng hợp 0/255 (đen = được đặt module), sinh tất định.
+
+    ``circle``/``sparse`` thường không fit được nên đo đúng trường hợp xấu nhất: quét hết 40
+    version cho mọi mức giãn rồi từ chối mask.
+    """
+    if kind == "none":
+        return None
+    size = 256
+    image = Image.new("L", (size, size), 255)
+    draw = ImageDraw.Draw(image)
+    if kind == "circle":
+        draw.ellipse((4, 4, size - 4, size - 4), fill=0)
+    elif kind == "dense":
+        # chỉ chừa một viền trắng mỏng nằm gọn trong quiet zone -> mọi version đều fit được
+        draw.rectangle((5, 5, size - 6, size - 6), fill=0)
+    elif kind == "sparse":
+        draw.rectangle((0, 0, size, size), fill=0)
+        for offset in range(16, size, 48):
+            draw.line((0, offset, size, offset), fill=255, width=6)
+            draw.line((offset, 0, offset, size), fill=255, width=6)
+    else:
+        raise ValueError(f"Loại mask không hỗ trợ: {kind}")
+    return _png(image)
+
+
+@cache
+def logo_bytes() -> bytes:
+    image = Image.new("RGBA", (128, 128), (220, 40, 40, 255))
+    ImageDraw.Draw(image).ellipse((24, 24, 104, 104), fill=(255, 255, 255, 255))
+    return _png(image)
+
+
+def renderer_params(case: BenchCase) -> dict[str, Any]:
+    rng = random.Random(case.payload)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789"
+    path = "".join(rng.choice(alphabet) for _ in range(PAYLOAD_LENGTHS[case.payload]))
+    return {
+        "data": f"https://example.com/{path}",
+        "ecc": case.ecc,
+        "fg_color": "#000000",
+        "bg_color": "#FFFFFF",
+        "margin": 4,
+        "size": case.size,
+        "mask_bytes": mask_bytes(case.mask),
+        "logo_bytes": logo_bytes() if case.logo else None,
+        # mask tổng hợp đã là 0/255, ngưỡng cố định tránh quirk Otsu với ảnh hai mức
+        "threshold": 128,
+    }
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(case: BenchCase, repeat: int, warm: bool = False) -> dict[str, Any]:
+    """Chạy một kịch bản ``repeat`` lần trong process hiện tại, trả về số liệu tổng hợp."""
+    saved_cache = render_cache.max_entries, render_cache.disk_dir
+    render_cache.max_entries, render_cache.disk_dir = 0, None
+    try:
+        return _measure(case, repeat, warm)
+    finally:
+        render_cache.max_entries, render_cache.disk_dir = saved_cache
+
+
+def _measure(case: BenchCase, repeat: int, warm: bool) -> dict[str, Any]:
+    params = renderer_params(case)
+    rss_before = _peak_rss_mb()
+    walls: list[float] = []
+    stages: dict[str, list[float]] = {}
+    artifacts = None
+    error = None
+    for _ in range(repeat):
+        if not warm:
+            mask_pyramids.clear()
+        renderer = ImageMaskQrRenderer(**params)
+        start = time.perf_counter()
+        try:
+            artifacts = renderer.render_artifacts()
+        except ValueError as exc:
+            # mask bị từ chối: vẫn là một kết quả cần đo (đường tìm kiếm dài nhất)
+            error = str(exc)
+        walls.append(time.perf_counter() - start)
+        for stage, seconds in renderer.timer.timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "case": asdict(case),
+        "repeat": repeat,
+        "wall_ms_median": round(statistics.median(walls) * 1000, 3),
+        "wall_ms_min": round(min(walls) * 1000, 3),
+        "wall_ms_max": round(max(walls) * 1000, 3),
+        "stages_ms_median": {
+            stage: round(statistics.median(values) * 1000, 3)
+            for stage, values in sorted(stages.items())
+        },
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "rss_growth_mb": round(_peak_rss_mb() - rss_before, 1),
+        "outcome": "rejected" if artifacts is None else "ok",
+        "detail": error if artifacts is None else None,
+        "png_bytes": len(artifacts.png_bytes) if artifacts else 0,
+        "svg_bytes": len(artifacts.svg_bytes) if artifacts else 0,
+        "version": artifacts.version if artifacts else None,
+        "candidates_evaluated": artifacts.candidates_evaluated if artifacts else None,
+    }
+
+
+def _run_isolated(case: BenchCase, repeat: int, warm: bool) -> dict[str, Any]:
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=get_context("spawn"), max_tasks_per_child=1
+    ) as pool:
+        return pool.submit(run_case, case, repeat, warm).result()
+
+
+def _git_commit() -> str | None:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip() or None
+
+
+def run_suite(
+    cases: list[BenchCase], repeat: int, warm: bool = False, isolated: bool = True
+) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    for case in cases:
+        if isolated:
+            results[case.name] = _run_isolated(case, repeat, warm)
+        else:
+            results[case.name] = run_case(case, repeat, warm)
+        print(_format_line(case.name, results[case.name]), file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": datetime.now(UTC).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "warm": warm,
+        },
+        "results": results,
+    }
+
+
+def _format_line(name: str, result: dict[str, Any]) -> str:
+    return (
+        f"{name:<40} {result['wall_ms_median']:>10.2f} ms  {result['peak_rss_mb']:>7.1f} MB  "
+        f"png={result['png_bytes']:>8}  svg={result['svg_bytes']:>8}  {result['outcome']}"
+    )
+
+
+def compare(
+    baseline: dict[str, Any], current: dict[str, Any], tolerance: float = DEFAULT_TOLERANCE
+) -> list[str]:
+    """Danh sách regression của ``current`` so với ``baseline`` (rỗng = đạt)."""
+    regressions = []
+    metrics = ("wall_ms_median", "peak_rss_mb", "png_bytes", "svg_bytes")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        if before.get("outcome") != result.get("outcome"):
+            regressions.append(
+                f"{name}: outcome {before.get('outcome')} -> {result.get('outcome')}"
+            )
+            continue
+        for metric in metrics:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--output", type=Path, help="Ghi kết quả JSON ra file")
+    parser.add_argument("--compare", type=Path, help="Baseline JSON để so sánh")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="Chỉ chạy các kịch bản nhỏ")
+    parser.add_argument("--warm", action="store_true", help="Giữ mask pyramid giữa các lần lặp")
+    parser.add_argument(
+        "--in-process", action="store_true", help="Không tách process con (peak RSS kém chính xác)"
+    )
+    parser.add_argument(
+        "--case", action="append", default=[], help="Chỉ chạy kịch bản có tên chứa chuỗi này"
+    )
+    args = parser.parse_args(argv)
+
+    cases = default_cases(args.quick)
+    if args.case:
+        cases = [case for case in cases if any(pattern in case.name for pattern in args.case)]
+    report = run_suite(cases, args.repeat, warm=args.warm, isolated=not args.in_process)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), "utf-8")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text("utf-8"))
+        regressions = compare(baseline, report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Nhị phân hoá mask và "kim tự tháp" mask đã fit sẵn theo kích thước ma trận QR.
+
+Ảnh mask chỉ cần nhị phân hoá một lần. Sau đó ``MaskPyramid`` giữ các bản giãn (dilation) và bản
+thu nhỏ về từng kích thước ma trận (21..177 module + viền), đã đánh dấu vùng finder, để vòng tìm
+version của renderer chỉ còn là một phép tra cứu. Các mức được tính lười, lần đầu renderer cần,
+và giữ suốt đời process (mỗi worker render một bản): không tính sẵn cả 40 version vì vòng tìm
+version thường dừng sau vài kích thước đầu.
+"""
+from __future__ import annotations
+
+import io
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
+
+from PIL import Image, ImageFilter
+
+from app.core.config import settings
+from app.utils.render_cache import content_key
+
+try:  # pragma: no cover
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+# Ma trận bool: list lồng nhau (fallback thuần Python) hoặc numpy.ndarray 2 chiều.
+MaskMatrix = Any
+
+MAX_DILATION_PASSES = 3
+
+
+@lru_cache(maxsize=64)
+def finder_reservation(size: int):
+    """Mảng bool (chỉ đọc) đánh dấu 3 vùng finder 7x7 luôn được phép đặt module."""
+    reserved = np.zeros((size, size), dtype=bool)  # type: ignore[union-attr]
+    for x, y in ((0, 0), (size - 7, 0), (0, size - 7)):
+        reserved[y : y + 7, x : x + 7] = True
+    reserved.setflags(write=False)
+    return reserved
+
+
+def otsu_threshold(image: Image.Image) -> int:
+    histogram = image.histogram()
+    total = sum(histogram)
+    sum_total = sum(i * histogram[i] for i in range(256))
+    sum_b = 0.0
+    weight_b = 0.0
+    max_var = 0.0
+    threshold = 0
+    for i in range(256):
+        weight_b += histogram[i]
+        if weight_b == 0:
+            continue
+        weight_f = total - weight_b
+        if weight_f == 0:
+            break
+        sum_b += i * histogram[i]
+        mean_b = sum_b / weight_b
+        mean_f = (sum_total - sum_b) / weight_f
+        var_between = weight_b * weight_f * (mean_b - mean_f) ** 2
+        if var_between > max_var:
+            max_var = var_between
+            threshold = i
+    return threshold
+
+
+def binarize(image: Image.Image, threshold: int | None) -> Image.Image:
+    """Ảnh L -> 0/255 bằng bảng tra 256 phần tử (PIL áp bảng trong C, không gọi lambda)."""
+    threshold = threshold or otsu_threshold(image)
+    return image.point([0] * threshold + [255] * (256 - threshold), mode="L")
+
+
+def load_binary_mask(data: bytes, threshold: int | None, binarized: bool = False) -> Image.Image:
+    image = Image.open(io.BytesIO(data)).convert("L")
+    return image if binarized else binarize(image, threshold)
+
+
+def mask_to_bool(mask_image: Image.Image, module_size: int, vectorized: bool) -> MaskMatrix:
+    resized = mask_image.resize((module_size, module_size), Image.NEAREST)
+    if vectorized:
+        # np.asarray đọc thẳng buffer của PIL, phép so sánh tạo mảng bool mới (ghi được)
+        return np.asarray(resized) < 128  # type: ignore[union-attr]
+    pixels = resized.load()
+    return [[pixels[x, y] < 128 for x in range(module_size)] for y in range(module_size)]
+
+
+def reserve_finders(mask_bool: MaskMatrix) -> None:
+    if np is not None and isinstance(mask_bool, np.ndarray):
+        np.logical_or(mask_bool, finder_reservation(len(mask_bool)), out=mask_bool)
+        return
+    size = len(mask_bool)
+    finder_coords = [(0, 0), (size - 7, 0), (0, size - 7)]
+    for (x, y) in finder_coords:
+        for row in range(y, y + 7):
+            for col in range(x, x + 7):
+                mask_bool[row][col] = True
+
+
+class MaskPyramid:
+    """Các mức giãn của một mask nhị phân và mask đã fit theo từng kích thước ma trận.
+
+    Mask trả về từ ``fitted`` được dùng chung giữa các lần render nên là chỉ đọc.
+    """
+
+    def __init__(self, binary: Image.Image):
+        self._levels: list[Image.Image] = [binary]
+        self._fitted: dict[tuple[int, int, bool], MaskMatrix] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def image(self) -> Image.Image:
+        return self._levels[0]
+
+    def level(self, dilation: int) -> Image.Image:
+        with self._lock:
+            while len(self._levels) <= dilation:
+                self._levels.append(self._levels[-1].filter(ImageFilter.MaxFilter(size=3)))
+            return self._levels[dilation]
+
+    def fitted(self, dilation: int, module_size: int, vectorized: bool) -> MaskMatrix:
+        key = (dilation, module_size, vectorized)
+        mask_bool = self._fitted.get(key)
+        if mask_bool is None:
+            mask_bool = mask_to_bool(self.level(dilation), module_size, vectorized)
+            reserve_finders(mask_bool)
+            if vectorized:
+                mask_bool.setflags(write=False)
+            self._fitted[key] = mask_bool
+        return mask_bool
+
+
+class MaskPyramidRegistry:
+    """LRU các ``MaskPyramid`` theo nội dung mask, sống suốt đời process (kể cả worker render)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._pyramids: OrderedDict[str, MaskPyramid] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data: bytes, threshold: int | None, binarized: bool = False) -> MaskPyramid:
+        key = content_key("mask", data, None if binarized else threshold, binarized)
+        with self._lock:
+            pyramid = self._pyramids.get(key)
+            if pyramid is not None:
+                self._pyramids.move_to_end(key)
+                return pyramid
+        pyramid = MaskPyramid(load_binary_mask(data, threshold, binarized))
+        with self._lock:
+            self._pyramids[key] = pyramid
+            while len(self._pyramids) > self.max_entries:
+                self._pyramids.popitem(last=False)
+        return pyramid
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pyramids.clear()
+
+
+mask_pyramids = MaskPyramidRegistry(settings.mask_pyramid_cache_size)
@@ -0,0 +1,111 @@
+"""Bảng dung lượng QR và cache payload đã mã hoá.
+
+Thay cho việc gọi ``qr.make(fit=False)`` rồi bắt ``DataOverflowError`` để thử version kế tiếp:
+dung lượng của mọi tổ hợp version × ECC × chế độ mã hoá được tính sẵn khi import, nên version
+nhỏ nhất cho một payload được tra trong O(1). Các segment đã mã hoá của payload và codeword theo
+từng version cũng được cache để việc thử version tiếp theo không phải mã hoá lại dữ liệu.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from functools import lru_cache
+
+from qrcode import util
+from qrcode.exceptions import DataOverflowError
+
+MODES = {
+    "numeric": util.MODE_NUMBER,
+    "alphanumeric": util.MODE_ALPHA_NUM,
+    "byte": util.MODE_8BIT_BYTE,
+}
+
+# Ba nhóm version có độ dài trường "character count" khác nhau (chuẩn ISO/IEC 18004).
+_VERSION_CLASSES = ((1, 9), (10, 26), (27, 40))
+
+
+def _payload_bits(mode: int, length: int) -> int:
+    """Số bit dữ liệu (không tính header) của ``length`` ký tự ở chế độ ``mode``."""
+    if mode == util.MODE_NUMBER:
+        return 10 * (length // 3) + (0, 4, 7)[length % 3]
+    if mode == util.MODE_ALPHA_NUM:
+        return 11 * (length // 2) + 6 * (length % 2)
+    return 8 * length
+
+
+def _max_chars(mode: int, version: int, bit_limit: int) -> int:
+    available = bit_limit - 4 - util.length_in_bits(mode, version)
+    if available <= 0:
+        return 0
+    if mode == util.MODE_NUMBER:
+        chars = 3 * (available // 10)
+        rest = available % 10
+        return chars + (2 if rest >= 7 else 1 if rest >= 4 else 0)
+    if mode == util.MODE_ALPHA_NUM:
+        return 2 * (available // 11) + (1 if available % 11 >= 6 else 0)
+    return available // 8
+
+
+def _build_capacity_table() -> dict[int, dict[int, tuple[int, ...]]]:
+    table: dict[int, dict[int, tuple[int, ...]]] = {}
+    for ecc in range(4):
+        bit_limits = util.BIT_LIMIT_TABLE[ecc]
+        table[ecc] = {
+            mode: (0,) + tuple(_max_chars(mode, v, bit_limits[v]) for v in range(1, 41))
+            for mode in MODES.values()
+        }
+    return table
+
+
+# CAPACITY_TABLE[ecc][mode][version] = số ký tự tối đa của một segment đơn (index 0 bỏ trống).
+CAPACITY_TABLE = _build_capacity_table()
+
+
+class EncodedPayload:
+    """Payload đã tách segment tối ưu, dùng lại được cho mọi version cần thử."""
+
+    def __init__(self, data: str, ecc: int):
+        self.ecc = ecc
+        # Cùng cách tách segment với ``QRCode.add_data`` (optimize=20) để ma trận không đổi.
+        self.segments = tuple(util.optimal_data_chunks(data, minimum=20))
+        self._codewords: dict[int, list[int]] = {}
+        self._min_version: int | None = None
+
+    def bits_needed(self, version: int) -> int:
+        return sum(
+            4
+            + util.length_in_bits(segment.mode, version)
+            + _payload_bits(segment.mode, len(segment))
+            for segment in self.segments
+        )
+
+    def min_version(self) -> int:
+        if self._min_version is None:
+            self._min_version = self._lookup_min_version()
+        return self._min_version
+
+    def _lookup_min_version(self) -> int:
+        if len(self.segments) == 1:
+            segment = self.segments[0]
+            version = bisect_left(CAPACITY_TABLE[self.ecc][segment.mode], len(segment), 1)
+            if version <= 40:
+                return version
+            raise DataOverflowError("Payload vượt quá dung lượng QR version 40")
+        bit_limits = util.BIT_LIMIT_TABLE[self.ecc]
+        for first, last in _VERSION_CLASSES:
+            version = bisect_left(bit_limits, self.bits_needed(first), first, last + 1)
+            if version <= last:
+                return version
+        raise DataOverflowError("Payload vượt quá dung lượng QR version 40")
+
+    def codewords(self, version: int) -> list[int]:
+        """Codeword (data + ECC) cho ``version``; chỉ mã hoá một lần cho mỗi version."""
+        cached = self._codewords.get(version)
+        if cached is None:
+            cached = util.create_data(version, self.ecc, list(self.segments))
+            self._codewords[version] = cached
+        return cached
+
+
+@lru_cache(maxsize=256)
+def encode_payload(data: str, ecc: int) -> EncodedPayload:
+    return EncodedPayload(data, ecc)
@@ -1,16 +1,36 @@
 """Render QR tuân theo mask ảnh với giải thích tiếng Việt."""
 from __future__ import annotations
 
+import asyncio
+import cProfile
 import io
+import logging
+import pstats
 import uuid
-from dataclasses import dataclass
-from typing import Iterable
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import groupby
+from typing import Any, TextIO
 
 import qrcode
-from PIL import Image, ImageColor, ImageFilter
-from qrcode.exceptions import DataOverflowError
+from PIL import Image, ImageColor
 
-from app.storage.local import storage
+from app.core.config import settings
+from app.core.metrics import StageTimer, registry
+from app.storage.blobs import blob_store
+from app.utils.mask_pyramid import (
+    MAX_DILATION_PASSES,
+    MaskMatrix,
+    MaskPyramid,
+    load_binary_mask,
+    mask_pyramids,
+    mask_to_bool,
+    otsu_threshold,
+    reserve_finders,
+)
+from app.utils.qr_capacity import EncodedPayload, encode_payload
+from app.utils.render_cache import content_key, render_cache
 
 try:  # pragma: no cover - phụ thuộc optional
     import cv2  # type: ignore
@@ -29,6 +49,21 @@ ECC_MAP = {
     "H": qrcode.constants.ERROR_CORRECT_H,
 }
 
+logger = logging.getLogger(__name__)
+
+RENDER_STAGE_SECONDS = registry.histogram(
+    "qr_render_stage_seconds", "Thời gian từng giai đoạn render QR", labelnames=("stage",)
+)
+RENDER_CANDIDATES = registry.histogram(
+    "qr_render_candidates",
+    "Số version đã thử mỗi lần render",
+    buckets=(1, 2, 3, 5, 10, 20, 40, 80, 160),
+)
+RENDER_BYTES_WRITTEN = registry.histogram(
+    "qr_render_bytes_written",
+    "Số byte ghi ra storage mỗi lần render",
+    buckets=(1_000, 4_000, 16_000, 64_000, 256_000, 1_000_000, 4_000_000),
+)
 
 @dataclass
 class RenderResult:
@@ -39,6 +74,73 @@ class RenderResult:
     svg_path: str
     mask_path: str | None
     logo_path: str | None
+    candidates_evaluated: int = 0
+    # Thời gian (giây) theo giai đoạn: cache_lookup, mask_load, version_search, dilation, png,
+    # logo, png_encode, svg, storage. Giai đoạn không chạy (vd. trúng cache) thì không có mặt.
+    timings: dict[str, float] = field(default_factory=dict)
+    # candidates_evaluated, dilation_passes, cache_hit, files_written, bytes_written
+    counters: dict[str, int] = field(default_factory=dict)
+    profile: str | None = None
+
+
+@dataclass
+class RenderArtifacts:
+    """Kết quả render thuần tính toán (chưa ghi storage), picklable để trả về từ process worker."""
+
+    version: int
+    ecc: str
+    png_bytes: bytes
+    svg_bytes: bytes
+    candidates_evaluated: int = 0
+    dilation_passes: int = 0
+    cache_hit: bool = False
+    timings: dict[str, float] = field(default_factory=dict)
+    # Bảng thống kê cProfile (text) khi renderer chạy với ``profile=True``
+    profile: str | None = None
+
+
+@dataclass
+class FitResult:
+    """Kết quả tìm version/fit mask: đủ để mã hoá lại ảnh mà không cần tìm kiếm."""
+
+    version: int
+    dilation_passes: int
+    candidates_evaluated: int
+    modules: list[list[bool]]
+
+
+def _pack_modules(modules: list[list[bool]]) -> bytes:
+    size = len(modules)
+    row_bytes = (size + 7) // 8
+    packed = bytearray()
+    for row in modules:
+        value = 0
+        for bit in row:
+            value = (value << 1) | bool(bit)
+        packed += (value << (row_bytes * 8 - size)).to_bytes(row_bytes, "big")
+    return bytes(packed)
+
+
+def _unpack_modules(packed: bytes, size: int) -> list[list[bool]]:
+    row_bytes = (size + 7) // 8
+    modules = []
+    for offset in range(0, size * row_bytes, row_bytes):
+        value = int.from_bytes(packed[offset : offset + row_bytes], "big") >> (row_bytes * 8 - size)
+        modules.append([bool((value >> (size - 1 - x)) & 1) for x in range(size)])
+    return modules
+
+
+@lru_cache(maxsize=256)
+def _scale_counts(source: int, target: int) -> tuple[int, ...]:
+    """Số pixel đích của mỗi pixel nguồn khi phóng ``source`` -> ``target`` (nearest-neighbour).
+
+    Chia hết thì mọi pixel lặp đúng ``target // source`` lần (tương đương kron); không chia hết
+    thì phần dư được rải đều, các module chênh nhau tối đa 1 pixel.
+    """
+    counts = [0] * source
+    for x in range(target):
+        counts[(2 * x + 1) * source // (2 * target)] += 1
+    return tuple(counts)
 
 
 class ImageMaskQrRenderer:
@@ -46,9 +148,22 @@ class ImageMaskQrRenderer:
 
     Thuật toán:
     1. Chuyển ảnh mask về grayscale rồi nhị phân bằng Otsu. Pixel đen thể hiện vùng được đặt module.
-    2. Tạo QR phiên bản nhỏ nhất -> nếu các module trùng vào vùng trắng => mask quá thưa. Khi đó lần lượt tăng version (mật độ module dày hơn).
+    2. Tạo QR phiên bản nhỏ nhất chứa được payload -> nếu các module trùng vào vùng trắng => mask
+       quá thưa. Khi đó lần lượt tăng version (mật độ module dày hơn).
     3. Nếu đã tới version 40 mà vẫn xung đột, ta nới lỏng mask bằng phép giãn (dilation) => giảm yêu cầu hình dạng.
-    4. Khi thành công, render PNG/SVG và (tùy chọn) chèn logo ở giữa.
+       Lượt sau bắt đầu lại từ version có ít xung đột nhất của lượt trước thay vì version 1.
+    4. Khi thành công, render PNG/SVG và (tùy chọn) chèn logo ở giữa. PNG được vẽ thẳng ở kích
+       thước đích thành ảnh palette 2 màu (chỉ số 0 = nền, 1 = module) nên file là PNG 1 bit.
+
+    Nếu có numpy, mask/ma trận module/vùng finder được biểu diễn bằng mảng bool và số xung đột
+    được đếm bằng một phép toán mảng; nếu không thì dùng vòng lặp thuần Python (kết quả như nhau).
+
+    Mask được lấy từ ``mask_pyramids`` (nhị phân hoá một lần, giãn và thu nhỏ theo từng kích thước
+    ma trận được tính sẵn/nhớ lại), nên cùng một mask không bị xử lý lại giữa các lần render.
+
+    Kết quả được cache theo nội dung đầu vào (``render_cache``): trùng toàn bộ đầu vào thì trả
+    luôn ảnh đã mã hoá; chỉ trùng phần quyết định hình dạng (data/ECC/margin/mask/threshold) thì
+    bỏ qua bước tìm version và chỉ mã hoá lại ảnh.
     """
 
     def __init__(
@@ -63,6 +178,9 @@ class ImageMaskQrRenderer:
         mask_bytes: bytes | None,
         logo_bytes: bytes | None,
         threshold: int | None = None,
+        mask_binarized: bool = False,
+        stored_mask_path: str | None = None,
+        profile: bool = False,
     ):
         self.data = data
         self.ecc = ecc if ecc in ECC_MAP else "H"
@@ -73,161 +191,373 @@ class ImageMaskQrRenderer:
         self.mask_bytes = mask_bytes
         self.logo_bytes = logo_bytes
         self.threshold = threshold
+        # mask_binarized: mask_bytes đã là ảnh 0/255 (mask trong thư viện), không nhị phân hoá lại
+        self.mask_binarized = mask_binarized
+        # stored_mask_path: mask đã nằm sẵn trong storage (thư viện mask), không lưu bản sao
+        self.stored_mask_path = stored_mask_path
+        self.vectorized = np is not None
+        # profile: chạy render dưới cProfile và đính kèm bảng thống kê vào kết quả
+        self.profile = profile
+        self.timer = StageTimer()
 
     def render(self) -> RenderResult:
-        mask_image = self._load_mask()
+        """Render và lưu đồng bộ, cho script/CLI (seed); trong event loop dùng
+        ``render_artifacts`` + ``await store``."""
+        return asyncio.run(self.store(self.render_artifacts()))
+
+    def render_artifacts(self) -> RenderArtifacts:
+        """Chọn version, fit mask và mã hoá PNG/SVG; không đụng tới storage."""
+        self.timer = StageTimer()
+        if not self.profile:
+            artifacts = self._render_artifacts()
+        else:
+            profiler = cProfile.Profile()
+            artifacts = profiler.runcall(self._render_artifacts)
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(30)
+            artifacts.profile = stream.getvalue()
+        artifacts.timings = dict(self.timer.timings)
+        return artifacts
+
+    def _render_artifacts(self) -> RenderArtifacts:
+        artifact_key = self.cache_key()
+        with self.timer.stage("cache_lookup"):
+            cached = render_cache.get(artifact_key)
+        if cached is not None:
+            meta, blobs = cached
+            return RenderArtifacts(
+                png_bytes=blobs["png"], svg_bytes=blobs["svg"], cache_hit=True, **meta
+            )
+
+        fit_key = self.fit_key()
+        with self.timer.stage("cache_lookup"):
+            cached = render_cache.get(fit_key)
+        if cached is not None:
+            meta, blobs = cached
+            fit = FitResult(
+                version=meta["version"],
+                dilation_passes=meta["dilation_passes"],
+                candidates_evaluated=meta["candidates_evaluated"],
+                modules=_unpack_modules(blobs["modules"], meta["size"]),
+            )
+        else:
+            fit = self._fit()
+            render_cache.put(
+                fit_key,
+                {
+                    "version": fit.version,
+                    "dilation_passes": fit.dilation_passes,
+                    "candidates_evaluated": fit.candidates_evaluated,
+                    "size": len(fit.modules),
+                },
+                {"modules": _pack_modules(fit.modules)},
+            )
+
+        artifacts = self._encode(fit)
+        render_cache.put(
+            artifact_key,
+            {
+                "version": artifacts.version,
+                "ecc": artifacts.ecc,
+                "candidates_evaluated": artifacts.candidates_evaluated,
+                "dilation_passes": artifacts.dilation_passes,
+            },
+            {"png": artifacts.png_bytes, "svg": artifacts.svg_bytes},
+        )
+        return artifacts
+
+    def fit_key(self) -> str:
+        """Khoá cache cho phần quyết định ma trận module."""
+        return content_key(
+            "fit",
+            self.data,
+            self.ecc,
+            self.margin,
+            self.threshold,
+            self.mask_binarized,
+            self.mask_bytes,
+        )
+
+    def cache_key(self) -> str:
+        """Khoá cache cho toàn bộ ảnh đầu ra."""
+        return content_key(
+            "artifacts",
+            self.fit_key(),
+            list(self.fg_color),
+            list(self.bg_color),
+            self.target_size,
+            self.logo_bytes,
+            settings.png_compress_level,
+            settings.png_optimize,
+        )
+
+    def _fit(self) -> FitResult:
+        with self.timer.stage("mask_load"):
+            pyramid = self._mask_pyramid()
         version = None
         dilation_passes = 0
         matrix = None
-        code_uuid = uuid.uuid4()
+        mask_bool = None
+        candidates_evaluated = 0
+        # Version nhỏ nhất đủ dung lượng cho payload: mọi version thấp hơn chắc chắn tràn dữ liệu
+        start_version = self._min_version()
         while True:
-            try_versions = self._candidate_versions(version)
+            # Xung đột không đơn điệu theo version nên không thể chia đôi; thay vào đó quét tuyến
+            # tính và cắt sớm mỗi phép so sánh khi vượt quá kết quả tốt nhất hiện có.
+            best_version = start_version
+            best_conflicts: int | None = None
             success = False
-            for version_candidate in try_versions:
-                matrix = self._build_matrix(version_candidate)
-                if mask_image is None:
-                    version = version_candidate
-                    success = True
-                    break
-                mask_bool = self._mask_for_matrix(mask_image, len(matrix))
-                self._ensure_finder_allowed(mask_bool)
-                conflicts = self._count_conflicts(matrix, mask_bool)
-                if conflicts == 0:
-                    version = version_candidate
-                    success = True
-                    break
+            with self.timer.stage("version_search"):
+                for version_candidate in self._candidate_versions(start_version):
+                    candidates_evaluated += 1
+                    matrix = self._build_matrix(version_candidate)
+                    if pyramid is None:
+                        version = version_candidate
+                        success = True
+                        break
+                    mask_bool = pyramid.fitted(dilation_passes, len(matrix), self.vectorized)
+                    conflicts = self._count_conflicts(matrix, mask_bool, limit=best_conflicts)
+                    if conflicts == 0:
+                        version = version_candidate
+                        success = True
+                        break
+                    if best_conflicts is None or conflicts < best_conflicts:
+                        best_conflicts = conflicts
+                        best_version = version_candidate
             if success:
                 break
-            if mask_image is not None and dilation_passes < 3:
-                mask_image = mask_image.filter(ImageFilter.MaxFilter(size=3))
+            if pyramid is not None and dilation_passes < MAX_DILATION_PASSES:
                 dilation_passes += 1
-                version = None
+                start_version = best_version
+                with self.timer.stage("dilation"):
+                    pyramid.level(dilation_passes)
                 continue
             raise ValueError("Mask không đủ mật độ để render QR")
 
         assert matrix is not None and version is not None
-        image = self._render_png(matrix, mask_image)
+        return FitResult(
+            version=version,
+            dilation_passes=dilation_passes,
+            candidates_evaluated=candidates_evaluated,
+            modules=self._allowed_modules(matrix, mask_bool),
+        )
+
+    def _encode(self, fit: FitResult) -> RenderArtifacts:
+        allowed = fit.modules
+        with self.timer.stage("png"):
+            image = self._render_png(allowed)
         if self.logo_bytes:
-            image = self._overlay_logo(image)
-        image = image.resize((self.target_size, self.target_size), Image.NEAREST)
+            with self.timer.stage("logo"):
+                image = self._overlay_logo(image)
 
         png_bytes = io.BytesIO()
-        image.save(png_bytes, format="PNG")
-        png_path = storage.save(f"qr/{code_uuid.hex}.png", png_bytes.getvalue())
+        with self.timer.stage("png_encode"):
+            image.save(
+                png_bytes,
+                format="PNG",
+                compress_level=settings.png_compress_level,
+                optimize=settings.png_optimize,
+            )
+        with self.timer.stage("svg"):
+            svg_bytes = self._render_svg(allowed)
+        return RenderArtifacts(
+            version=fit.version,
+            ecc=self.ecc,
+            png_bytes=png_bytes.getvalue(),
+            svg_bytes=svg_bytes,
+            candidates_evaluated=fit.candidates_evaluated,
+            dilation_passes=fit.dilation_passes,
+        )
 
-        svg_bytes = self._render_svg(matrix, mask_image)
-        svg_path = storage.save(f"qr/{code_uuid.hex}.svg", svg_bytes)
+    async def store(
+        self,
+        artifacts: RenderArtifacts,
+        code_uuid: uuid.UUID | None = None,
+        source_paths: tuple[str | None, str | None] | None = None,
+    ) -> RenderResult:
+        """Ghi PNG/SVG vào blob store (theo nội dung, file trùng không bị ghi lại).
 
-        mask_path = None
-        if self.mask_bytes:
-            mask_path = storage.save(f"qr/{code_uuid.hex}_mask.png", self.mask_bytes)
+        ``source_paths`` là cặp (mask_path, logo_path) đã lưu sẵn, dùng chung cho nhiều mã trong
+        cùng một lô; nếu bỏ trống thì mask/logo gốc được lưu (cũng theo nội dung) cho mã này.
+        Bên gọi phải đăng ký tham chiếu tới các đường dẫn trả về (``app.services.blob_refs``).
 
-        logo_path = None
-        if self.logo_bytes:
-            logo_path = storage.save(f"qr/{code_uuid.hex}_logo.png", self.logo_bytes)
+        Thời gian/bộ đếm của lần render được ghi log JSON (logger ``app.utils.qr_renderer``) và
+        cộng vào các histogram ``qr_render_*``; ``files_written``/``bytes_written`` chỉ tính file
+        thực sự được ghi ra storage.
+        """
+        timer = StageTimer()
+        code_uuid = code_uuid or uuid.uuid4()
+        with timer.stage("storage"):
+            (png_path, png_new), (svg_path, svg_new) = await blob_store.put_many(
+                [(artifacts.png_bytes, ".png"), (artifacts.svg_bytes, ".svg")]
+            )
+            written = [
+                data
+                for data, new in ((artifacts.png_bytes, png_new), (artifacts.svg_bytes, svg_new))
+                if new
+            ]
+            if source_paths is None:
+                source_paths, sources_written = await self._put_sources()
+                written += sources_written
+        mask_path, logo_path = source_paths
 
-        return RenderResult(
+        result = RenderResult(
             code_id=code_uuid,
-            version=version,
-            ecc=self.ecc,
+            version=artifacts.version,
+            ecc=artifacts.ecc,
             png_path=png_path,
             svg_path=svg_path,
             mask_path=mask_path,
             logo_path=logo_path,
+            candidates_evaluated=artifacts.candidates_evaluated,
+            timings={**artifacts.timings, **timer.timings},
+            counters={
+                "candidates_evaluated": artifacts.candidates_evaluated,
+                "dilation_passes": artifacts.dilation_passes,
+                "cache_hit": int(artifacts.cache_hit),
+                "files_written": len(written),
+                "bytes_written": sum(map(len, written)),
+            },
+            profile=artifacts.profile,
         )
+        report_render(result)
+        return result
+
+    async def store_sources(self) -> tuple[str | None, str | None]:
+        """Lưu ảnh mask/logo gốc, trả về (mask_path, logo_path)."""
+        paths, _ = await self._put_sources()
+        return paths
+
+    async def _put_sources(self) -> tuple[tuple[str | None, str | None], list[bytes]]:
+        written = []
+        mask_path = self.stored_mask_path
+        if self.mask_bytes and mask_path is None:
+            mask_path, new = await blob_store.put(self.mask_bytes, ".png")
+            if new:
+                written.append(self.mask_bytes)
+
+        logo_path = None
+        if self.logo_bytes:
+            logo_path, new = await blob_store.put(self.logo_bytes, ".png")
+            if new:
+                written.append(self.logo_bytes)
+        return (mask_path, logo_path), written
+
+    def _mask_pyramid(self) -> MaskPyramid | None:
+        if not self.mask_bytes:
+            return None
+        return mask_pyramids.get(self.mask_bytes, self.threshold, self.mask_binarized)
 
     def _load_mask(self) -> Image.Image | None:
         if not self.mask_bytes:
             return None
-        image = Image.open(io.BytesIO(self.mask_bytes)).convert("L")
-        threshold = self.threshold or self._otsu_threshold(image)
-        binary = image.point(lambda x: 0 if x < threshold else 255, mode="L")
-        return binary
+        return load_binary_mask(self.mask_bytes, self.threshold, self.mask_binarized)
 
     @staticmethod
     def _otsu_threshold(image: Image.Image) -> int:
-        histogram = image.histogram()
-        total = sum(histogram)
-        sum_total = sum(i * histogram[i] for i in range(256))
-        sum_b = 0.0
-        weight_b = 0.0
-        max_var = 0.0
-        threshold = 0
-        for i in range(256):
-            weight_b += histogram[i]
-            if weight_b == 0:
-                continue
-            weight_f = total - weight_b
-            if weight_f == 0:
-                break
-            sum_b += i * histogram[i]
-            mean_b = sum_b / weight_b
-            mean_f = (sum_total - sum_b) / weight_f
-            var_between = weight_b * weight_f * (mean_b - mean_f) ** 2
-            if var_between > max_var:
-                max_var = var_between
-                threshold = i
-        return threshold
+        return otsu_threshold(image)
 
     def _candidate_versions(self, start: int | None) -> Iterable[int]:
         start_version = start or 1
         return range(start_version, 41)
 
+    @property
+    def payload(self) -> EncodedPayload:
+        return encode_payload(self.data, ECC_MAP[self.ecc])
+
+    def _min_version(self) -> int:
+        """Version nhỏ nhất có đủ dung lượng cho payload ở mức ECC hiện tại (tra bảng)."""
+        return self.payload.min_version()
+
     def _build_matrix(self, version: int) -> list[list[int]]:
+        payload = self.payload
         qr = qrcode.QRCode(
-            version=version,
+            version=max(version, payload.min_version()),
             error_correction=ECC_MAP[self.ecc],
             box_size=1,
             border=self.margin,
         )
-        try:
-            qr.add_data(self.data)
-            qr.make(fit=False)
-        except DataOverflowError:
-            if version >= 40:
-                raise
-            return self._build_matrix(version + 1)
+        # Gắn sẵn segment + codeword đã cache: make() không phải mã hoá lại payload
+        qr.data_list = list(payload.segments)
+        qr.data_cache = payload.codewords(qr.version)
+        qr.make(fit=False)
         return qr.get_matrix()
 
-    def _mask_for_matrix(self, mask_image: Image.Image, module_size: int) -> list[list[bool]]:
-        resized = mask_image.resize((module_size, module_size), Image.NEAREST)
-        pixels = resized.load()
-        return [[pixels[x, y] < 128 for x in range(module_size)] for y in range(module_size)]
+    def _mask_for_matrix(self, mask_image: Image.Image, module_size: int) -> MaskMatrix:
+        return mask_to_bool(mask_image, module_size, self.vectorized)
 
     @staticmethod
-    def _ensure_finder_allowed(mask_bool: list[list[bool]]) -> None:
-        size = len(mask_bool)
-        finder_coords = [(0, 0), (size - 7, 0), (0, size - 7)]
-        for (x, y) in finder_coords:
-            for row in range(y, y + 7):
-                for col in range(x, x + 7):
-                    mask_bool[row][col] = True
+    def _ensure_finder_allowed(mask_bool: MaskMatrix) -> None:
+        reserve_finders(mask_bool)
 
     @staticmethod
-    def _count_conflicts(matrix: list[list[int]], mask_bool: list[list[bool]]) -> int:
+    def _count_conflicts(
+        matrix: list[list[int]], mask_bool: MaskMatrix, limit: int | None = None
+    ) -> int:
+        """Đếm module tối rơi vào vùng trắng của mask.
+
+        Khi có ``limit``, hàm được phép dừng sớm và trả về một giá trị bất kỳ > ``limit`` ngay khi
+        biết chắc ứng viên không tốt hơn. Cận dưới ``số module tối - số ô cho phép`` (độ phủ mask)
+        được kiểm tra trước khi so sánh từng ô.
+        """
+        if np is not None and isinstance(mask_bool, np.ndarray):
+            modules = np.asarray(matrix, dtype=bool)
+            if limit is not None:
+                lower_bound = int(np.count_nonzero(modules)) - int(np.count_nonzero(mask_bool))
+                if lower_bound > limit:
+                    return lower_bound
+            return int(np.count_nonzero(modules & ~mask_bool))
+        if limit is not None:
+            lower_bound = sum(map(sum, matrix)) - sum(map(sum, mask_bool))
+            if lower_bound > limit:
+                return lower_bound
         conflicts = 0
         for y, row in enumerate(matrix):
+            mask_row = mask_bool[y]
             for x, value in enumerate(row):
-                if value and not mask_bool[y][x]:
+                if value and not mask_row[x]:
                     conflicts += 1
+            if limit is not None and conflicts > limit:
+                return conflicts
         return conflicts
 
-    def _render_png(self, matrix: list[list[int]], mask_image: Image.Image | None) -> Image.Image:
-        size = len(matrix)
-        canvas = Image.new("RGB", (size + self.margin * 2, size + self.margin * 2), self.bg_color)
-        pixels = canvas.load()
-        mask_bool = None
-        if mask_image is not None:
-            mask_bool = self._mask_for_matrix(mask_image, size)
-            self._ensure_finder_allowed(mask_bool)
-        for y, row in enumerate(matrix):
-            for x, value in enumerate(row):
-                if not value:
-                    continue
-                if mask_bool is not None and not mask_bool[y][x]:
-                    continue
-                pixels[x + self.margin, y + self.margin] = self.fg_color
-        return canvas
+    @staticmethod
+    def _allowed_modules(matrix: list[list[int]], mask_bool: MaskMatrix | None) -> list[list[bool]]:
+        """Module tối cần vẽ: module tối của QR nằm trong vùng mask cho phép."""
+        if mask_bool is None:
+            return [[bool(value) for value in row] for row in matrix]
+        if np is not None and isinstance(mask_bool, np.ndarray):
+            return (np.asarray(matrix, dtype=bool) & mask_bool).tolist()
+        return [
+            [bool(value) and mask_bool[y][x] for x, value in enumerate(row)]
+            for y, row in enumerate(matrix)
+        ]
+
+    def _render_png(self, allowed: list[list[bool]]) -> Image.Image:
+        """Ảnh palette ``target_size`` x ``target_size``: chỉ số 0 = nền, 1 = module tối."""
+        size = len(allowed)
+        source = size + self.margin * 2
+        counts = _scale_counts(source, self.target_size)
+        if self.vectorized:
+            grid = np.zeros((source, source), dtype=np.uint8)
+            grid[self.margin : self.margin + size, self.margin : self.margin + size] = allowed
+            bitmap = np.repeat(np.repeat(grid, counts, axis=0), counts, axis=1).tobytes()
+        else:
+            blank = bytes(self.target_size)
+            rows = [blank * count for count in counts[: self.margin]]
+            pad = [False] * self.margin
+            # counts còn phần lề dưới: chỉ ghép với các hàng của ma trận
+            for row, count in zip(allowed, counts[self.margin :], strict=False):
+                line = b"".join(
+                    (b"\x01" if value else b"\x00") * width
+                    for value, width in zip(pad + row + pad, counts, strict=True)
+                )
+                rows.append(line * count)
+            rows.extend(blank * count for count in counts[self.margin + size :])
+            bitmap = b"".join(rows)
+        image = Image.frombytes("P", (self.target_size, self.target_size), bitmap)
+        image.putpalette(self.bg_color + self.fg_color)
+        return image
 
     def _overlay_logo(self, image: Image.Image) -> Image.Image:
         logo = Image.open(io.BytesIO(self.logo_bytes)).convert("RGBA")
@@ -239,33 +569,64 @@ class ImageMaskQrRenderer:
         image.paste(logo, (x, y), logo)
         return image.convert("RGB")
 
-    def _render_svg(self, matrix: list[list[int]], mask_image: Image.Image | None) -> bytes:
-        size = len(matrix)
-        mask_bool = None
-        if mask_image is not None:
-            mask_bool = self._mask_for_matrix(mask_image, size)
-            self._ensure_finder_allowed(mask_bool)
+    def _render_svg(self, allowed: list[list[bool]]) -> bytes:
+        buffer = io.StringIO()
+        self.write_svg(buffer, allowed)
+        return buffer.getvalue().encode("utf-8")
+
+    def write_svg(self, out: TextIO, allowed: list[list[bool]]) -> None:
+        """Ghi SVG vào ``out``: mọi module tối nằm trong một ``<path>`` duy nhất.
+
+        Các module liền nhau trên cùng hàng được gộp thành một hình chữ nhật ``M x y h w v s H x z``
+        nên số lệnh chỉ bằng số đoạn chạy (run), không phải số module. Hình vẽ ra trùng khớp từng
+        pixel với cách vẽ mỗi module một ``<rect>`` trước đây.
+        """
+        size = len(allowed)
         scale = 4
-        rects = []
-        for y, row in enumerate(matrix):
-            for x, value in enumerate(row):
-                if not value:
-                    continue
-                if mask_bool is not None and not mask_bool[y][x]:
-                    continue
-                rect = (
-                    f'<rect x="{(x + self.margin) * scale}" y="{(y + self.margin) * scale}" '
-                    f'width="{scale}" height="{scale}" fill="rgb{self.fg_color}" />'
-                )
-                rects.append(rect)
         width = (size + self.margin * 2) * scale
         height = (size + self.margin * 2) * scale
-        svg = (
+        out.write(
             f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
             f'viewBox="0 0 {width} {height}">'
-            f'<rect width="100%" height="100%" fill="rgb{self.bg_color}" />' + "".join(rects) + "</svg>"
+            f'<rect width="100%" height="100%" fill="rgb{self.bg_color}" />'
+            f'<path fill="rgb{self.fg_color}" d="'
         )
-        return svg.encode("utf-8")
+        for y, row in enumerate(allowed):
+            top = (y + self.margin) * scale
+            x = 0
+            for value, run in groupby(row):
+                length = len(list(run))
+                if value:
+                    left = (x + self.margin) * scale
+                    out.write(f"M{left} {top}h{length * scale}v{scale}H{left}z")
+                x += length
+        out.write('" /></svg>')
+
+
+def report_render(result: RenderResult) -> None:
+    """Ghi log JSON và cập nhật histogram cho một lần render đã lưu."""
+    for stage, seconds in result.timings.items():
+        RENDER_STAGE_SECONDS.observe(seconds, stage=stage)
+    RENDER_STAGE_SECONDS.observe(sum(result.timings.values()), stage="total")
+    if not result.counters.get("cache_hit"):
+        RENDER_CANDIDATES.observe(result.candidates_evaluated)
+    RENDER_BYTES_WRITTEN.observe(result.counters.get("bytes_written", 0))
+    extra: dict[str, Any] = {
+        "code_id": str(result.code_id),
+        "version": result.version,
+        "timings_ms": {
+            stage: round(seconds * 1000, 3) for stage, seconds in result.timings.items()
+        },
+        "counters": result.counters,
+    }
+    if result.profile:
+        extra["profile"] = result.profile
+    logger.info("qr_render", extra=extra)
+
+
+def render_artifacts_job(params: dict[str, Any]) -> RenderArtifacts:
+    """Điểm vào cho process worker: ``params`` là kwargs của ``ImageMaskQrRenderer``."""
+    return ImageMaskQrRenderer(**params).render_artifacts()
 
 
 def decode_qr_image(data: bytes) -> str | None:
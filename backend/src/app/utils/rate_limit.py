@@ -1,57 +1,467 @@
-"""Bộ đếm rate limit dựa trên Redis với fallback in-memory."""
+"""Rate limit theo policy: mỗi route có một ``RatePolicy`` gồm nhiều ``Limit`` trên các chiều khác
+nhau (ip, code_id, ip+code_id, email, user...), kiểm tra cùng lúc.
+
+- Thuật toán: ``gcra`` (Generic Cell Rate Algorithm, mỗi khoá chỉ lưu một mốc thời gian, cho dồn
+  tối đa ``burst`` lượt) hoặc ``sliding_log`` (sorted set các lượt trong ``period`` giây gần nhất,
+  chính xác tuyệt đối, tốn bộ nhớ theo ``rate`` nên chỉ dùng cho giới hạn nhỏ). Cả hai đều không
+  có đột biến gấp đôi ở mép cửa sổ như bộ đếm cố định.
+- Redis: mọi limit của một lượt gọi được tính trong *một* script Lua (một round-trip, đồng hồ lấy
+  từ ``TIME`` của Redis). Lượt gọi chỉ được tính vào các khoá khi tất cả limit đều cho qua.
+- Token cục bộ: sau mỗi lần Redis trả về số lượt còn lại ``r`` của một khoá, process được tự cho
+  qua tối đa ``r * rate_limit_local_share`` lượt (khoá mới: ``r = burst``) mà không hỏi Redis;
+  các lượt này được cộng dồn và đẩy lên Redis trong nền. Chỉ khoá đã gần chạm giới hạn mới phải
+  chờ Redis, nên p99 của lượt gọi bình thường không phụ thuộc RTT tới Redis. Đổi lại, giới hạn
+  chung có thể bị vượt tối đa bằng phần token các process khác đang giữ.
+- Circuit breaker: lỗi/timeout Redis liên tiếp mở mạch, backoff tăng gấp đôi tới
+  ``rate_limit_breaker_max_backoff_seconds``; trong lúc mở, mọi quyết định dùng bộ đếm cửa sổ
+  trượt in-memory (giới hạn ``rate_limit_fallback_max_entries`` khoá) và chỉ thử lại Redis một lần
+  khi hết backoff.
+"""
 from __future__ import annotations
 
-import threading
+import asyncio
+import logging
+import math
 import time
-from collections import defaultdict
+import uuid
+from dataclasses import dataclass
+from typing import Any, Literal
 
 import redis
+import redis.asyncio as aioredis
 from fastapi import HTTPException, status
 
 from app.core.config import settings
+from app.core.metrics import registry
+from app.utils.ttl_cache import MISSING, TtlLruCache
+from app.utils.window_counter import SlidingWindowCounter
+
+logger = logging.getLogger(__name__)
+
+Algorithm = Literal["gcra", "sliding_log"]
+
+# KEYS = khoá của từng limit; ARGV = (cost, request id, rồi mỗi limit 5 giá trị: thuật toán, rate,
+# period ms, burst, số lượt đã cho qua cục bộ chưa gửi). Lượt cục bộ luôn được cộng; ``cost`` chỉ
+# được cộng khi mọi limit còn đủ chỗ. Trả về (allowed, rồi mỗi limit: còn lại, ms tới lượt kế).
+POLICY_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local cost = tonumber(ARGV[1])
+local limits = {}
+local allowed = 1
+for i = 1, #KEYS do
+    local base = 2 + (i - 1) * 5
+    local limit = {
+        algorithm = ARGV[base + 1],
+        rate = tonumber(ARGV[base + 2]),
+        period = tonumber(ARGV[base + 3]),
+        burst = tonumber(ARGV[base + 4]),
+        pending = tonumber(ARGV[base + 5]),
+    }
+    if limit.algorithm == 'gcra' then
+        limit.interval = limit.period / limit.rate
+        limit.tolerance = limit.burst * limit.interval
+        local tat = math.max(tonumber(redis.call('GET', KEYS[i])) or now, now)
+        limit.tat = tat + limit.pending * limit.interval
+        limit.remaining = math.floor((now + limit.tolerance - limit.tat) / limit.interval)
+    else
+        redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now - limit.period)
+        limit.remaining = limit.rate - redis.call('ZCARD', KEYS[i]) - limit.pending
+    end
+    if limit.remaining < cost then
+        allowed = 0
+    end
+    limits[i] = limit
+end
+local result = {allowed}
+for i, limit in ipairs(limits) do
+    local charge = limit.pending
+    if allowed == 1 then
+        charge = charge + cost
+    end
+    local retry = 0
+    if limit.algorithm == 'gcra' then
+        local tat = limit.tat
+        if allowed == 1 then
+            tat = tat + cost * limit.interval
+        end
+        if tat > now then
+            redis.call('SET', KEYS[i], tat, 'PX', math.ceil(tat - now))
+        end
+        limit.remaining = math.floor((now + limit.tolerance - tat) / limit.interval)
+        retry = tat + limit.interval - limit.tolerance - now
+    else
+        for j = 1, charge do
+            redis.call('ZADD', KEYS[i], now, ARGV[2] .. ':' .. i .. ':' .. j)
+        end
+        if charge > 0 then
+            redis.call('PEXPIRE', KEYS[i], limit.period)
+        end
+        limit.remaining = limit.rate - redis.call('ZCARD', KEYS[i])
+        if limit.remaining < 1 then
+            -- lượt kế được qua khi entry thứ (-remaining) (tính từ 0) rời khỏi cửa sổ
+            local index = -limit.remaining
+            local oldest = redis.call('ZRANGE', KEYS[i], index, index, 'WITHSCORES')
+            retry = tonumber(oldest[2]) + limit.period - now
+        end
+    end
+    result[#result + 1] = limit.remaining
+    result[#result + 1] = math.max(0, math.ceil(retry))
+end
+return result
+"""
+
+RATE_LIMIT_DECISIONS = registry.counter(
+    "rate_limit_decisions_total",
+    "Số quyết định rate limit theo policy, nơi quyết định (local/redis/fallback) và kết quả",
+    labelnames=("policy", "source", "result"),
+)
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Tối đa ``rate`` lượt mỗi ``period`` giây cho mỗi bộ giá trị của ``dimensions``."""
+
+    dimensions: tuple[str, ...]
+    rate: int
+    period: float = 60.0
+    algorithm: Algorithm = "gcra"
+    # GCRA: số lượt được dồn liền nhau (mặc định bằng ``rate``); sliding log luôn là ``rate``
+    burst: int | None = None
+
+    @property
+    def name(self) -> str:
+        return "+".join(self.dimensions)
+
+    @property
+    def capacity(self) -> int:
+        if self.algorithm == "gcra" and self.burst is not None:
+            return self.burst
+        return self.rate
+
+    def key(self, policy_name: str, context: dict[str, Any]) -> str:
+        values = (str(context[dimension]) for dimension in self.dimensions)
+        return ":".join(["rate", policy_name, self.name, *values])
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    name: str
+    limits: tuple[Limit, ...]
+    detail: str = "Quá nhiều yêu cầu, vui lòng thử lại sau"
+
+    def keys(self, context: dict[str, Any]) -> list[tuple[Limit, str]]:
+        """(limit, khoá Redis) của các limit đang bật (``rate > 0``)."""
+        return [(limit, limit.key(self.name, context)) for limit in self.limits if limit.rate > 0]
+
+
+class CircuitBreaker:
+    """Mở sau ``failure_threshold`` lỗi liên tiếp; hết backoff thì cho một lượt thử (half-open)."""
+
+    def __init__(self, failure_threshold: int, base_backoff: float, max_backoff: float):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._failures = 0
+        self._opened = 0
+        self._retry_at = 0.0
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._failures >= self.failure_threshold
+
+    def allow(self) -> bool:
+        if not self.is_open:
+            return True
+        if self._probing or time.monotonic() < self._retry_at:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+        if self.is_open:
+            backoff = min(self.max_backoff, self.base_backoff * 2**self._opened)
+            self._opened += 1
+            self._retry_at = time.monotonic() + backoff
+
+
+# (limit, khoá Redis, số lượt cục bộ gửi kèm)
+LimitItem = tuple[Limit, str, int]
 
 
 class RateLimiter:
-    def __init__(self, redis_url: str, limit_per_minute: int):
+    def __init__(
+        self,
+        redis_url: str,
+        policies: dict[str, RatePolicy],
+        local_share: float = 0.0,
+        redis_timeout: float = 0.05,
+        breaker: CircuitBreaker | None = None,
+        local_max_entries: int = 100_000,
+        fallback_stripes: int = 16,
+    ):
         self.redis_url = redis_url
-        self.limit_per_minute = limit_per_minute
-        self._client: redis.Redis | None = None
-        self._fallback_counter: dict[str, tuple[int, float]] = defaultdict(lambda: (0, 0.0))
-        self._lock = threading.Lock()
+        self.policies = policies
+        self.local_share = local_share
+        self.redis_timeout = redis_timeout
+        self.breaker = breaker or CircuitBreaker(3, 1.0, 30.0)
+        self._client: aioredis.Redis | None = None
+        self._script = None
+        # khoá Redis -> số lượt còn được tự cho qua / mốc (monotonic) hết bị chặn
+        self._tokens = TtlLruCache(local_max_entries, ttl=60)
+        self._blocked = TtlLruCache(local_max_entries, ttl=60)
+        # khoá Redis -> (limit, số lượt đã cho qua cục bộ chưa gửi); giới hạn như ``_tokens``, bị
+        # đẩy ra thì chỉ mất vài lượt chưa tính lên Redis
+        self._pending = TtlLruCache(local_max_entries, ttl=60)
+        self._flush_task: asyncio.Task | None = None
+        periods = {limit.period for policy in policies.values() for limit in policy.limits}
+        self._fallback = {
+            period: SlidingWindowCounter(period, local_max_entries, stripes=fallback_stripes)
+            for period in periods
+        }
 
     @property
-    def client(self) -> redis.Redis | None:
+    def client(self) -> aioredis.Redis:
         if self._client is None:
-            try:
-                self._client = redis.Redis.from_url(self.redis_url, decode_responses=True)
-                self._client.ping()
-            except redis.RedisError:
-                self._client = None
+            self._client = aioredis.Redis.from_url(
+                self.redis_url,
+                decode_responses=True,
+                socket_timeout=self.redis_timeout,
+                socket_connect_timeout=self.redis_timeout,
+            )
+        if self._script is None:
+            self._script = self._client.register_script(POLICY_SCRIPT)
         return self._client
 
-    def check(self, key: str) -> None:
-        ttl = 60
-        now = time.time()
-        bucket_key = f"rate:{key}:{int(now // ttl)}"
-        client = self.client
-        if client is not None:
-            current = client.incr(bucket_key)
-            if current == 1:
-                client.expire(bucket_key, ttl)
-        else:
-            with self._lock:
-                count, bucket = self._fallback_counter[key]
-                if int(bucket) != int(now // ttl):
-                    count = 0
-                    bucket = now // ttl
-                count += 1
-                self._fallback_counter[key] = (count, now // ttl)
-            current = count
-        if current > self.limit_per_minute:
+    @client.setter
+    def client(self, client: aioredis.Redis) -> None:
+        self._client = client
+        self._script = None
+
+    async def check(self, policy_name: str, cost: int = 1, **context: Any) -> None:
+        """429 (kèm ``Retry-After``) nếu lượt gọi vượt bất kỳ limit nào của policy ``policy_name``.
+
+        ``context`` chứa giá trị của mọi chiều mà các limit của policy dùng (``ip=...``...);
+        ``cost`` là số lượt lượt gọi này chiếm (ví dụ số mã của một lô).
+        """
+        policy = self.policies[policy_name]
+        keys = policy.keys(context)
+        if not keys:
+            return
+        if not self.breaker.allow():
+            self._decide(policy, "fallback", self._fallback_retry(keys, cost))
+            return
+        # mạch vẫn mở nghĩa là lượt này là lượt thử lại Redis: phải hỏi Redis, không dùng token
+        if not self.breaker.is_open:
+            now = time.monotonic()
+            blocked_until = max(self._blocked_until(key) for _, key in keys)
+            if blocked_until > now:
+                # Redis đã báo hết lượt cho khoá này: từ chối luôn, không cần hỏi lại
+                self._decide(policy, "local", blocked_until - now)
+            tokens = [self._local_tokens(limit, key) for limit, key in keys]
+            if min(tokens) >= cost:
+                for (limit, key), left in zip(keys, tokens, strict=True):
+                    self._tokens.set(key, left - cost, ttl=limit.period)
+                    self._add_pending(limit, key, cost)
+                self._schedule_flush()
+                self._decide(policy, "local", 0)
+                return
+        # lượt cục bộ chưa gửi của các khoá này đi cùng lượt gọi hiện tại
+        items = [(limit, key, self._take_pending(key)) for limit, key in keys]
+        try:
+            (result,) = await self._eval_many([self._call(items, cost=cost)])
+        except (redis.RedisError, OSError, TimeoutError):
+            self._on_redis_failure()
+            self._restore_pending(items)
+            self._decide(policy, "fallback", self._fallback_retry(keys, cost))
+            return
+        self.breaker.record_success()
+        retry = self._apply(items, result)
+        self._decide(policy, "redis", 0 if result[0] else max(retry, 0.001))
+
+    def _fallback_retry(self, keys: list[tuple[Limit, str]], cost: int) -> float:
+        """Tính lượt vào bộ đếm in-memory; trả về số giây phải chờ (0 nếu được qua)."""
+        retry = 0.0
+        for limit, key in keys:
+            if self._fallback[limit.period].hit(key, count=cost) > limit.rate:
+                retry = max(retry, limit.period)
+        return retry
+
+    def _decide(self, policy: RatePolicy, source: str, retry_after: float) -> None:
+        allowed = retry_after <= 0
+        RATE_LIMIT_DECISIONS.inc(
+            policy=policy.name, source=source, result="allowed" if allowed else "limited"
+        )
+        if not allowed:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Quá nhiều lượt quét, vui lòng thử lại sau",
+                detail=policy.detail,
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
             )
 
+    def _blocked_until(self, key: str) -> float:
+        until = self._blocked.get(key)
+        return 0.0 if until is MISSING else until
+
+    def _local_tokens(self, limit: Limit, key: str) -> int:
+        tokens = self._tokens.get(key)
+        if tokens is MISSING:
+            # khoá chưa gặp: tạm coi như còn nguyên ``burst``
+            return int(limit.capacity * self.local_share)
+        return tokens
+
+    @staticmethod
+    def _call(items: list[LimitItem], cost: int) -> tuple[list[str], list[Any]]:
+        args: list[Any] = [cost, uuid.uuid4().hex]
+        for limit, _, pending in items:
+            args += [limit.algorithm, limit.rate, int(limit.period * 1000), limit.capacity, pending]
+        return [key for _, key, _ in items], args
+
+    def _apply(self, items: list[LimitItem], result: list[int]) -> float:
+        """Cập nhật token/khoá bị chặn từ kết quả script; trả về số giây phải chờ lâu nhất."""
+        longest = 0.0
+        now = time.monotonic()
+        for index, (limit, key, _) in enumerate(items):
+            remaining, retry_ms = result[1 + 2 * index], result[2 + 2 * index]
+            self._tokens.set(key, max(0, int(remaining * self.local_share)), ttl=limit.period)
+            if retry_ms > 0:
+                self._blocked.set(key, now + retry_ms / 1000, ttl=retry_ms / 1000)
+                longest = max(longest, retry_ms / 1000)
+        return longest
+
+    def _add_pending(self, limit: Limit, key: str, count: int) -> None:
+        entry = self._pending.get(key)
+        pending = 0 if entry is MISSING else entry[1]
+        self._pending.set(key, (limit, pending + count), ttl=limit.period)
+
+    def _take_pending(self, key: str) -> int:
+        entry = self._pending.pop(key)
+        return 0 if entry is MISSING else entry[1]
+
+    def _restore_pending(self, items: list[LimitItem]) -> None:
+        # các lượt này đã được cho qua; giữ lại để gửi khi Redis sống lại. Mạch đã mở thì bỏ:
+        # backoff có thể kéo dài hơn ``period`` nên gửi muộn cũng không còn tác dụng
+        if self.breaker.is_open:
+            return
+        for limit, key, sent in items:
+            if sent:
+                self._add_pending(limit, key, sent)
+
+    async def _eval_many(self, calls: list[tuple[list[str], list[Any]]]) -> list[list[int]]:
+        """Chạy script cho từng phần tử của ``calls`` trong một pipeline (một round-trip)."""
+        client = self.client
+        async with client.pipeline(transaction=False) as pipe:
+            for keys, args in calls:
+                await self._script(keys=keys, args=args, client=pipe)
+            return [[int(value) for value in result] for result in await pipe.execute()]
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self) -> None:
+        """Đẩy các lượt đã cho qua cục bộ lên Redis và cập nhật token theo số lượt còn lại."""
+        while len(self._pending) and not self.breaker.is_open:
+            batch = [(limit, key, pending) for key, (limit, pending) in self._pending.drain()]
+            if not batch:
+                return
+            try:
+                results = await self._eval_many([self._call([item], cost=0) for item in batch])
+            except (redis.RedisError, OSError, TimeoutError):
+                self._on_redis_failure()
+                self._restore_pending(batch)
+                return
+            self.breaker.record_success()
+            for item, result in zip(batch, results, strict=True):
+                self._apply([item], result)
+
+    def _on_redis_failure(self) -> None:
+        was_open = self.breaker.is_open
+        self.breaker.record_failure()
+        if self.breaker.is_open and not was_open:
+            logger.warning("rate_limit_redis_unavailable")
+            self._pending.clear()
+
+    def clear(self) -> None:
+        """Xoá mọi trạng thái trong process (token, khoá bị chặn, bộ đếm fallback)."""
+        self._tokens.clear()
+        self._blocked.clear()
+        self._pending.clear()
+        for counter in self._fallback.values():
+            counter.clear()
+
+    async def close(self) -> None:
+        # task đã xong có thể thuộc event loop cũ (đã đóng): chỉ chờ task còn chạy
+        task, self._flush_task = self._flush_task, None
+        if task is not None and not task.done():
+            await asyncio.gather(task, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._script = None
+
+
+POLICIES = {
+    "scan": RatePolicy(
+        "scan",
+        (
+            Limit(("ip", "code_id"), settings.rate_limit_scan_per_minute, algorithm="sliding_log"),
+            Limit(("ip",), settings.rate_limit_scan_ip_per_minute),
+            Limit(("code_id",), settings.rate_limit_scan_code_per_minute),
+        ),
+        detail="Quá nhiều lượt quét, vui lòng thử lại sau",
+    ),
+    "login": RatePolicy(
+        "login",
+        (
+            Limit(("ip",), settings.rate_limit_login_ip_per_minute, algorithm="sliding_log"),
+            Limit(("email",), settings.rate_limit_login_email_per_minute, algorithm="sliding_log"),
+        ),
+        detail="Đăng nhập quá nhiều lần, vui lòng thử lại sau",
+    ),
+    "generate_qrcode": RatePolicy(
+        "generate_qrcode",
+        (
+            Limit(
+                ("user",),
+                settings.rate_limit_generate_per_minute,
+                burst=settings.rate_limit_generate_burst,
+            ),
+        ),
+        detail="Tạo QR quá nhanh, vui lòng thử lại sau",
+    ),
+    "generate_qrcode_bulk": RatePolicy(
+        "generate_qrcode_bulk",
+        (
+            Limit(
+                ("user",),
+                settings.rate_limit_bulk_generate_per_hour,
+                period=3600,
+                burst=settings.bulk_generate_max_items,
+            ),
+        ),
+        detail="Tạo QR hàng loạt quá nhiều, vui lòng thử lại sau",
+    ),
+}
 
-rate_limiter = RateLimiter(settings.redis_url, settings.rate_limit_scan_per_minute)
+rate_limiter = RateLimiter(
+    str(settings.redis_url),
+    POLICIES,
+    local_share=settings.rate_limit_local_share,
+    redis_timeout=settings.rate_limit_redis_timeout_ms / 1000,
+    breaker=CircuitBreaker(
+        settings.rate_limit_breaker_failures,
+        settings.rate_limit_breaker_backoff_seconds,
+        settings.rate_limit_breaker_max_backoff_seconds,
+    ),
+    local_max_entries=settings.rate_limit_fallback_max_entries,
+    fallback_stripes=settings.rate_limit_fallback_stripes,
+)
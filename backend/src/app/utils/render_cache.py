@@ -0,0 +1,194 @@
+"""Cache render QR theo địa chỉ nội dung (content-addressed): LRU trong RAM + tầng đĩa."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from app.core.config import settings
+
+# Tăng khi thuật toán render hoặc định dạng entry đổi: mọi khoá đổi theo nên entry cũ trên đĩa
+# (dùng chung giữa các lần deploy) không bao giờ được đọc lại và bị dọn dần theo LRU
+RENDERER_VERSION = 1
+
+# Một entry gồm metadata JSON-serializable và các blob nhị phân có tên (png, svg, modules...)
+CacheEntry = tuple[dict[str, Any], dict[str, bytes]]
+
+
+def content_key(*parts: Any) -> str:
+    """SHA-256 của các thành phần; ``bytes`` được băm riêng để không phải serialize cả ảnh."""
+    normalized = [
+        {"sha256": hashlib.sha256(part).hexdigest()} if isinstance(part, bytes) else part
+        for part in parts
+    ]
+    document = json.dumps([RENDERER_VERSION, normalized], sort_keys=True)
+    return hashlib.sha256(document.encode("utf-8")).hexdigest()
+
+
+def _entry_size(entry: CacheEntry) -> int:
+    return sum(map(len, entry[1].values()))
+
+
+class RenderCache:
+    """Cache hai tầng cho kết quả render.
+
+    - Tầng RAM: ``OrderedDict`` LRU giới hạn cả ``max_entries`` lẫn ``max_bytes`` (tổng dung lượng
+      blob) - mỗi process worker có bản riêng.
+    - Tầng đĩa: ``<disk_dir>/<key[:2]>/<key>.*`` dùng chung giữa các worker. Blob được ghi trước,
+      file ``.json`` ghi sau cùng bằng ``os.replace`` nên entry chỉ xuất hiện khi đã đầy đủ.
+      Dung lượng đĩa được cộng dồn theo từng lần ghi (quét thư mục một lần khi bắt đầu); khi vượt
+      ``disk_max_bytes`` thì quét lại và xoá file ít dùng nhất (theo mtime) tới dưới
+      ``_PRUNE_TARGET`` giới hạn, nên mỗi lần quét ứng với ít nhất ~10% giới hạn đã được ghi.
+      Số đếm chỉ gồm phần process này ghi: nhiều worker thì đĩa có thể vượt giới hạn một chút
+      trước khi có worker quét lại.
+    """
+
+    _PRUNE_TARGET = 0.9
+
+    def __init__(
+        self,
+        disk_dir: Path | None,
+        max_entries: int,
+        disk_max_bytes: int,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.disk_dir = disk_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # dung lượng đĩa ước tính của disk_dir; None = chưa quét
+        self._disk_bytes: int | None = None
+        self._disk_bytes_dir: Path | None = None
+
+    def get(self, key: str) -> CacheEntry | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        entry = self._read_disk(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, meta: dict[str, Any], blobs: dict[str, bytes]) -> None:
+        entry = (meta, blobs)
+        self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._disk_bytes = None
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        size = _entry_size(entry)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= _entry_size(previous)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= _entry_size(evicted)
+
+    def _entry_dir(self, key: str) -> Path:
+        assert self.disk_dir is not None
+        return self.disk_dir / key[:2]
+
+    def _read_disk(self, key: str) -> CacheEntry | None:
+        if self.disk_dir is None:
+            return None
+        directory = self._entry_dir(key)
+        meta_path = directory / f"{key}.json"
+        try:
+            document = json.loads(meta_path.read_text("utf-8"))
+            blobs = {name: (directory / f"{key}.{name}").read_bytes() for name in document["blobs"]}
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(meta_path)  # đánh dấu vừa dùng cho việc dọn LRU trên đĩa
+        except OSError:
+            pass
+        return document["meta"], blobs
+
+    def _write_disk(self, key: str, entry: CacheEntry) -> None:
+        if self.disk_dir is None:
+            return
+        meta, blobs = entry
+        directory = self._entry_dir(key)
+        document = json.dumps({"meta": meta, "blobs": sorted(blobs)}).encode("utf-8")
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            for name, data in blobs.items():
+                self._atomic_write(directory / f"{key}.{name}", data)
+            self._atomic_write(directory / f"{key}.json", document)
+        except OSError:
+            return
+        written = _entry_size(entry) + len(document)
+        with self._lock:
+            if self._disk_bytes is None or self._disk_bytes_dir != self.disk_dir:
+                over = True  # chưa biết dung lượng thư mục: quét một lần
+            else:
+                self._disk_bytes += written
+                over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self.prune_disk()
+
+    @staticmethod
+    def _atomic_write(path: Path, data: bytes) -> None:
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+    def prune_disk(self) -> None:
+        """Quét đĩa; vượt ``disk_max_bytes`` thì xoá entry cũ nhất tới ``_PRUNE_TARGET``."""
+        disk_dir = self.disk_dir
+        if disk_dir is None or not disk_dir.exists():
+            return
+        entries: dict[str, tuple[float, int, list[Path]]] = {}
+        for path in disk_dir.glob("*/*"):
+            key = path.name.split(".", 1)[0]
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            mtime, size, files = entries.get(key, (0.0, 0, []))
+            entries[key] = (max(mtime, stat.st_mtime), size + stat.st_size, files + [path])
+        total = sum(size for _, size, _ in entries.values())
+        if total > self.disk_max_bytes:
+            limit = self.disk_max_bytes * self._PRUNE_TARGET
+            for _, size, files in sorted(entries.values(), key=lambda item: item[0]):
+                if total <= limit:
+                    break
+                for path in files:
+                    path.unlink(missing_ok=True)
+                total -= size
+        with self._lock:
+            self._disk_bytes = total
+            self._disk_bytes_dir = disk_dir
+
+
+render_cache = RenderCache(
+    settings.render_cache_dir if settings.render_cache_disk else None,
+    max_entries=settings.render_cache_max_entries,
+    disk_max_bytes=settings.render_cache_disk_max_mb * 1024 * 1024,
+    max_bytes=settings.render_cache_max_mb * 1024 * 1024,
+)
@@ -0,0 +1,72 @@
+"""LRU trong process có hạn sống (TTL) cho từng entry."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+MISSING = object()
+
+
+class TtlLruCache:
+    """``OrderedDict`` LRU giới hạn ``max_entries``; entry quá ``ttl`` giây bị coi như không có.
+
+    ``get`` trả về ``MISSING`` khi không có entry (để phân biệt với giá trị ``None`` được cache).
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Any) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any, ttl: float | None = None) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Any) -> Any:
+        """Lấy và xoá entry; ``MISSING`` nếu không có hoặc đã hết hạn."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None or entry[0] <= now:
+            return MISSING
+        return entry[1]
+
+    def drain(self) -> list[tuple[Any, Any]]:
+        """Lấy và xoá mọi entry còn hạn, cũ nhất trước."""
+        now = time.monotonic()
+        with self._lock:
+            entries, self._entries = self._entries, OrderedDict()
+        return [(key, value) for key, (expires_at, value) in entries.items() if expires_at > now]
+
+    def delete(self, key: Any) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,70 @@
+"""Bộ đếm cửa sổ trượt trong process, giới hạn số khoá và tự bỏ khoá đã hết hạn."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+
+
+class _Stripe:
+    __slots__ = ("lock", "entries")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # khoá -> [cửa sổ, đếm cửa sổ hiện tại, đếm cửa sổ trước]; thứ tự = lần truy cập gần nhất
+        self.entries: OrderedDict[Hashable, list[int]] = OrderedDict()
+
+
+class SlidingWindowCounter:
+    """Đếm số lượt của mỗi khoá trong ``window`` giây gần nhất (xấp xỉ cửa sổ trượt).
+
+    Mỗi khoá giữ số đếm của cửa sổ cố định hiện tại và cửa sổ ngay trước; ước lượng là
+    ``trước * (phần cửa sổ trước còn nằm trong khoảng trượt) + hiện tại``, nên không có đột biến
+    gấp đôi ở mép cửa sổ như bộ đếm cố định.
+
+    Khoá được chia vào ``stripes`` phần theo hash, mỗi phần một lock và một LRU tối đa
+    ``max_entries // stripes`` khoá. Khoá không được chạm quá hai cửa sổ luôn nằm ở đầu LRU nên
+    được bỏ ngay khi có lượt ghi mới vào phần đó (mỗi khoá bị bỏ đúng một lần: O(1) khấu hao);
+    khi phần đầy, khoá ít dùng nhất bị bỏ dù chưa hết hạn.
+    """
+
+    def __init__(self, window: float, max_entries: int, stripes: int = 16):
+        self.window = window
+        self.stripes = [_Stripe() for _ in range(max(1, stripes))]
+        self.stripe_capacity = max(1, max_entries // len(self.stripes))
+
+    def __len__(self) -> int:
+        return sum(len(stripe.entries) for stripe in self.stripes)
+
+    def hit(self, key: Hashable, now: float | None = None, count: int = 1) -> float:
+        """Ghi ``count`` lượt cho ``key``; trả về số lượt ước lượng trong cửa sổ, tính cả chúng."""
+        now = time.time() if now is None else now
+        index, offset = divmod(now, self.window)
+        current_window = int(index)
+        stripe = self.stripes[hash(key) % len(self.stripes)]
+        with stripe.lock:
+            entries = stripe.entries
+            entry = entries.get(key)
+            if entry is None:
+                entry = entries[key] = [current_window, 0, 0]
+            elif entry[0] != current_window:
+                previous = entry[1] if entry[0] == current_window - 1 else 0
+                entry[:] = [current_window, 0, previous]
+            entry[1] += count
+            entries.move_to_end(key)
+            self._evict(entries, current_window)
+            _, current, previous = entry
+        return previous * (1 - offset / self.window) + current
+
+    def _evict(self, entries: OrderedDict[Hashable, list[int]], current_window: int) -> None:
+        while entries:
+            oldest = next(iter(entries.values()))
+            if oldest[0] >= current_window - 1 and len(entries) <= self.stripe_capacity:
+                return
+            entries.popitem(last=False)
+
+    def clear(self) -> None:
+        for stripe in self.stripes:
+            with stripe.lock:
+                stripe.entries.clear()
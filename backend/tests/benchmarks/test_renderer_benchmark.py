@@ -0,0 +1,33 @@
+"""Benchmark renderer bằng pytest-benchmark (bỏ qua nếu chưa cài).
+
+Chạy: ``pytest tests/benchmarks --benchmark-json bench/pytest.json``. Bộ đầy đủ (tới 4096px, có
+peak RSS và so sánh baseline) nằm ở ``python -m app.utils.bench_renderer``.
+"""
+from __future__ import annotations
+
+import pytest
+
+from app.utils.bench_renderer import BenchCase, default_cases, renderer_params
+from app.utils.qr_renderer import ImageMaskQrRenderer
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.fixture(autouse=True)
+def no_render_cache(isolated_render_cache):
+    max_entries = isolated_render_cache.max_entries
+    isolated_render_cache.max_entries = 0
+    isolated_render_cache.disk_dir = None
+    yield
+    isolated_render_cache.max_entries = max_entries
+
+
+@pytest.mark.parametrize("case", default_cases(quick=True), ids=lambda case: case.name)
+def test_render_artifacts(benchmark, case: BenchCase):
+    params = renderer_params(case)
+    artifacts = benchmark(lambda: ImageMaskQrRenderer(**params).render_artifacts())
+    benchmark.extra_info.update(
+        version=artifacts.version,
+        png_bytes=len(artifacts.png_bytes),
+        svg_bytes=len(artifacts.svg_bytes),
+    )
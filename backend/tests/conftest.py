@@ -1,34 +1,67 @@
 from __future__ import annotations
 
-from collections.abc import Generator
-
 import pytest
 from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
 
 import app.models  # noqa: F401 - đảm bảo model được load
+from app.api.deps import get_session_factory
 from app.core.security import get_password_hash
 from app.db.base import Base
-from app.db.session import get_db
+from app.db.session import create_async_session_factory
 from app.main import create_app
+from app.models.blob import Blob
 from app.models.user import User
-from app.storage.local import storage
+from app.services.scan_lookup import scan_lookup
+from app.storage import storage
+from app.storage.blobs import blob_store
+from app.utils.rate_limit import rate_limiter
+from app.utils.render_cache import render_cache
 
-TEST_DATABASE_URL = "sqlite+pysqlite:///:memory:"
-engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+app = create_app()
 
 
-def override_get_db() -> Generator[Session, None, None]:
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@pytest.fixture(autouse=True)
+def isolated_render_cache(tmp_path):
+    """Mỗi test dùng cache render riêng để kết quả không phụ thuộc lần chạy trước."""
+    render_cache.clear()
+    render_cache.disk_dir = tmp_path / "render_cache"
+    yield render_cache
+    render_cache.clear()
 
 
-app = create_app()
-app.dependency_overrides[get_db] = override_get_db
+@pytest.fixture(autouse=True)
+def isolated_scan_lookup():
+    """Cache tra cứu khi quét không được mang dữ liệu từ test này sang test khác."""
+    scan_lookup.clear()
+    yield scan_lookup
+    scan_lookup.clear()
+
+
+@pytest.fixture(autouse=True)
+def isolated_blob_store(tmp_path):
+    """Blob mà test trước đã ghi nằm ở thư mục tmp khác: không được bỏ qua upload lại.
+
+    ``put`` chạm bảng ``blobs``: test không dùng ``client`` có một SQLite riêng chỉ có bảng này.
+    """
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'blobs.db'}")
+    Blob.__table__.create(bind=engine)
+    default_session_factory = blob_store.session_factory
+    blob_store.session_factory = sessionmaker(bind=engine)
+    blob_store.clear()
+    yield blob_store
+    blob_store.clear()
+    blob_store.session_factory = default_session_factory
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def isolated_rate_limiter():
+    """Lượt đăng nhập/quét của test trước không được tính vào giới hạn của test sau."""
+    rate_limiter.clear()
+    yield rate_limiter
+    rate_limiter.clear()
 
 
 @pytest.fixture
@@ -37,13 +70,32 @@ def client(tmp_path):
         from fastapi.testclient import TestClient
     except Exception:
         pytest.skip("httpx không khả dụng nên bỏ qua integration tests")
-    Base.metadata.drop_all(bind=engine)
+    # file SQLite dùng chung: engine sync tạo schema/seed và phục vụ blob_store, engine async
+    # (aiosqlite) phục vụ API
+    db_path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite+pysqlite:///{db_path}")
     Base.metadata.create_all(bind=engine)
-    db = TestingSessionLocal()
-    admin = User(email="admin@example.com", password_hash=get_password_hash("admin123"), role="admin")
-    db.add(admin)
-    db.commit()
-    db.close()
+    with sessionmaker(bind=engine)() as db:
+        admin = User(
+            email="admin@example.com", password_hash=get_password_hash("admin123"), role="admin"
+        )
+        db.add(admin)
+        db.commit()
+    blob_store.session_factory = sessionmaker(bind=engine)
+    session_factory: async_sessionmaker = create_async_session_factory(
+        f"sqlite+aiosqlite:///{db_path}"
+    )
+    app.dependency_overrides[get_session_factory] = lambda: session_factory
     storage.base_dir = tmp_path
     with TestClient(app) as c:
         yield c
+    app.dependency_overrides.clear()
+    engine.dispose()
+
+
+@pytest.fixture
+def auth_headers(client) -> dict[str, str]:
+    response = client.post(
+        "/api/auth/login", json={"email": "admin@example.com", "password": "admin123"}
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+from datetime import UTC, datetime
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from app.db.session import create_async_session_factory
+from app.models.blob import Blob
+from app.models.qrcode import QrCode
+from app.schemas.qrcode import QrOptions
+from app.services.blob_refs import collect_garbage, reconcile
+from app.storage import storage
+from app.storage.blobs import BlobStore
+
+pytest.importorskip("httpx")
+
+
+def _png(color: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", (48, 48), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _refcounts(db_path) -> dict[str, int]:
+    engine = create_engine(f"sqlite+pysqlite:///{db_path}")
+    with Session(engine) as db:
+        counts = dict(db.execute(select(Blob.path, Blob.refcount)).all())
+    engine.dispose()
+    return counts
+
+
+async def _collect(db_path, *, with_reconcile: bool = False) -> list[str]:
+    session_factory = create_async_session_factory(f"sqlite+aiosqlite:///{db_path}")
+    async with session_factory() as db:
+        if with_reconcile:
+            await reconcile(db)
+        removed = await collect_garbage(db, grace_seconds=0)
+    await session_factory.kw["bind"].dispose()
+    return removed
+
+
+def test_shared_logo_is_stored_once_and_collected_when_unreferenced(
+    client, auth_headers, tmp_path
+):
+    options = QrOptions(logo_enabled=True).json()
+    logo = _png(40)
+    for data in ("https://example.com/1", "https://example.com/2"):
+        response = client.post(
+            "/api/qrcodes/generate",
+            headers=auth_headers,
+            data={"data": data, "options": options},
+            files={"logo_image": ("logo.png", logo, "image/png")},
+        )
+        assert response.status_code == 200
+    bulk = client.post(
+        "/api/qrcodes/generate/bulk",
+        headers=auth_headers,
+        data={
+            "items": json.dumps([{"data": f"https://example.com/b{i}"} for i in range(3)]),
+            "options": options,
+        },
+        files={"logo_image": ("logo.png", logo, "image/png")},
+    )
+    assert json.loads(bulk.text.splitlines()[-1])["event"] == "done"
+    assert response.json()["image_url_png"].startswith("/static/blobs/")
+
+    db_path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite+pysqlite:///{db_path}")
+    with Session(engine) as db:
+        logo_paths = set(db.scalars(select(QrCode.logo_path)))
+    engine.dispose()
+    assert len(logo_paths) == 1
+    logo_path = logo_paths.pop()
+    assert (tmp_path / logo_path).read_bytes() == logo
+    assert len(list((tmp_path / "blobs").rglob("*.png"))) == 5 + 1  # 5 ảnh QR + 1 logo
+    refcounts = _refcounts(db_path)
+    assert refcounts[logo_path] == 5 and len(refcounts) == 11
+
+    mask = client.post(
+        "/api/masks/",
+        headers=auth_headers,
+        data={"name": "tròn"},
+        files={"image": ("mask.png", _png(0), "image/png")},
+    ).json()
+    mask_path = mask["url"].removeprefix("/static/")
+    assert _refcounts(db_path)[mask_path] == 1
+    assert client.delete(f"/api/masks/{mask['id']}", headers=auth_headers).status_code == 204
+    assert _refcounts(db_path)[mask_path] == 0
+
+    assert asyncio.run(_collect(db_path)) == [mask_path]
+    assert not (tmp_path / mask_path).exists()
+    assert (tmp_path / logo_path).exists()
+    assert asyncio.run(_collect(db_path, with_reconcile=True)) == []
+    assert _refcounts(db_path)[logo_path] == 5
+
+
+def _orphan(db_path, path: str) -> None:
+    """Dòng ``blobs`` hết tham chiếu từ lâu, GC đã được phép xoá."""
+    engine = create_engine(f"sqlite+pysqlite:///{db_path}")
+    with Session(engine) as db:
+        db.merge(Blob(path=path, refcount=0, updated_at=datetime(2000, 1, 1, tzinfo=UTC)))
+        db.commit()
+    engine.dispose()
+
+
+async def _collect_with(db_path, grace_seconds: float) -> list[str]:
+    session_factory = create_async_session_factory(f"sqlite+aiosqlite:///{db_path}")
+    async with session_factory() as db:
+        removed = await collect_garbage(db, grace_seconds=grace_seconds)
+    await session_factory.kw["bind"].dispose()
+    return removed
+
+
+def test_known_cache_never_outlives_half_the_gc_grace():
+    assert BlobStore(storage, 10, known_ttl=600, grace_seconds=60).known.ttl == 30
+    assert BlobStore(storage, 10, known_ttl=5, grace_seconds=60).known.ttl == 5
+
+
+async def test_put_after_gc_rewrites_the_file(tmp_path, isolated_blob_store):
+    storage.base_dir = tmp_path
+    data = _png(10)
+    path, _ = await isolated_blob_store.put(data, ".png")
+    _orphan(tmp_path / "blobs.db", path)
+    assert await _collect_with(tmp_path / "blobs.db", grace_seconds=3600) == [path]
+    assert not (tmp_path / path).exists()
+
+    assert await isolated_blob_store.put(data, ".png") == (path, True)
+    assert (tmp_path / path).read_bytes() == data
+
+
+async def test_put_before_gc_keeps_the_blob(tmp_path, isolated_blob_store):
+    storage.base_dir = tmp_path
+    data = _png(20)
+    path, _ = await isolated_blob_store.put(data, ".png")
+    _orphan(tmp_path / "blobs.db", path)
+    isolated_blob_store.clear()  # process khác: chưa từng thấy blob này
+
+    await isolated_blob_store.put(data, ".png")
+    assert await _collect_with(tmp_path / "blobs.db", grace_seconds=3600) == []
+    assert (tmp_path / path).exists()
+
+
+async def test_put_during_gc_waits_for_commit_then_rewrites(
+    tmp_path, isolated_blob_store, monkeypatch
+):
+    storage.base_dir = tmp_path
+    data = _png(30)
+    path, _ = await isolated_blob_store.put(data, ".png")
+    _orphan(tmp_path / "blobs.db", path)
+    isolated_blob_store.clear()
+    delete = storage.delete
+    racing: list[asyncio.Task] = []
+
+    async def delete_then_race(relative_path: str) -> None:
+        # GC đã xoá dòng nhưng chưa commit: put lúc này phải chờ rồi ghi lại file
+        racing.append(asyncio.create_task(isolated_blob_store.put(data, ".png")))
+        await asyncio.sleep(0.05)
+        await delete(relative_path)
+
+    monkeypatch.setattr(storage, "delete", delete_then_race)
+    assert await _collect_with(tmp_path / "blobs.db", grace_seconds=3600) == [path]
+    assert await racing[0] == (path, True)
+    assert (tmp_path / path).read_bytes() == data
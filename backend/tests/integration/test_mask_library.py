@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import io
+
+from PIL import Image
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from app.models.blob import Blob
+from app.services import mask_library
+
+
+def _png() -> bytes:
+    buffer = io.BytesIO()
+    image = Image.new("L", (64, 64), 255)
+    image.paste(0, (16, 16, 48, 48))
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_concurrent_upload_of_same_mask_reuses_the_winning_row(
+    client, auth_headers, tmp_path, monkeypatch
+):
+    def upload():
+        return client.post(
+            "/api/masks/",
+            headers=auth_headers,
+            data={"name": "logo"},
+            files={"image": ("mask.png", _png(), "image/png")},
+        )
+
+    first = upload()
+    assert first.status_code == 201
+
+    # request thứ hai kiểm tra trùng trước khi request đầu commit: không thấy bản ghi nào
+    lookup = mask_library._mask_by_sha256
+    calls = []
+
+    async def racing_lookup(db, sha256):
+        calls.append(sha256)
+        return None if len(calls) == 1 else await lookup(db, sha256)
+
+    monkeypatch.setattr(mask_library, "_mask_by_sha256", racing_lookup)
+    second = upload()
+    assert second.status_code == 201
+    assert second.json()["id"] == first.json()["id"]
+    assert len(calls) == 2
+
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'test.db'}")
+    with Session(engine) as db:
+        refcounts = dict(db.execute(select(Blob.path, Blob.refcount)).all())
+    engine.dispose()
+    assert list(refcounts.values()) == [1]
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+from datetime import UTC, datetime
+
+import pytest
+
+from app.services.qr_timeline import bucket_window
+
+pytest.importorskip("httpx")
+
+
+def _walk(client, url: str, headers: dict[str, str]) -> list[dict]:
+    entries, cursor = [], None
+    while True:
+        page = client.get(url, headers=headers, params={"cursor": cursor} if cursor else None)
+        assert page.status_code == 200
+        body = page.json()
+        assert len(body["timeline"]) <= 2
+        entries.extend(body["timeline"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return entries
+
+
+def test_timeline_pages_and_buckets(client, auth_headers):
+    qr_res = client.post(
+        "/api/qrcodes/generate",
+        headers=auth_headers,
+        data={"data": "https://example.com/t", "reuse_allowed": "true"},
+    )
+    code_id = qr_res.json()["code_id"]
+    for _ in range(4):
+        client.post(f"/api/scan?code_id={code_id}")
+    client.post(
+        f"/api/qrcodes/{code_id}/reuse/start", headers=auth_headers, json={"reason": "relabel"}
+    )
+    for _ in range(2):
+        client.post(f"/api/scan?code_id={code_id}")
+
+    base = f"/api/analytics/qr/{code_id}"
+    full = client.get(base, headers=auth_headers).json()
+    assert full["total_scans"] == 6 and full["next_cursor"] is None
+    assert [entry["event"] for entry in full["timeline"]].count("reuse_start") == 1
+    assert len(full["timeline"]) == 7
+
+    assert _walk(client, f"{base}?limit=2", auth_headers) == full["timeline"]
+    assert _walk(client, f"{base}?limit=2&order=desc", auth_headers) == full["timeline"][::-1]
+
+    for group_by in ("device", "geo"):
+        buckets = client.get(
+            base, headers=auth_headers, params={"bucket": "day", "group_by": group_by}
+        ).json()
+        assert buckets["timeline"] == []
+        assert sum(bucket["count"] for bucket in buckets["buckets"]) == 6
+
+    assert client.get(f"{base}?cursor=bogus", headers=auth_headers).status_code == 400
+    too_wide = client.get(
+        base,
+        headers=auth_headers,
+        params={"bucket": "hour", "start": "2024-01-01T00:00:00Z", "end": "2024-06-01T00:00:00Z"},
+    )
+    assert too_wide.status_code == 400
+
+
+def test_bucket_window_reads_naive_datetimes_as_utc(monkeypatch):
+    monkeypatch.setenv("TZ", "Asia/Ho_Chi_Minh")
+    time.tzset()
+    try:
+        naive = bucket_window("hour", datetime(2024, 5, 1, 10, 30), datetime(2024, 5, 1, 12))
+        aware = bucket_window(
+            "hour",
+            datetime(2024, 5, 1, 10, 30, tzinfo=UTC),
+            datetime(2024, 5, 1, 12, tzinfo=UTC),
+        )
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    expected = (datetime(2024, 5, 1, 10, tzinfo=UTC), datetime(2024, 5, 1, 12, tzinfo=UTC))
+    assert naive == aware == expected
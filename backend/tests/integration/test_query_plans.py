@@ -0,0 +1,147 @@
+"""Các truy vấn nóng phải đi qua index (không quét cả bảng, không sort thêm).
+
+Chạy trên SQLite; đặt ``TEST_POSTGRES_URL`` (ví dụ ``postgresql+psycopg2://postgres:postgres@
+localhost:5432/qr_test``) để chạy thêm trên Postgres, trong một schema tạm bị xoá sau test.
+"""
+from __future__ import annotations
+
+import json
+import os
+import uuid
+from collections.abc import Iterator
+from datetime import UTC, datetime
+
+import pytest
+from sqlalchemy import Engine, Select, create_engine, func, select, text
+
+import app.models  # noqa: F401 - đăng ký toàn bộ bảng
+from app.db.base import Base
+from app.models.qrcode import QrCode
+from app.models.scan_event import ScanEvent
+from app.models.scan_rollup import ScanRollupDaily
+from app.services.qr_timeline import TimelineCursor, reuse_branch, scan_branch
+from app.services.scan_export import export_query
+
+CODE_ID = uuid.UUID("00000000-0000-4000-8000-000000000001")
+START = datetime(2024, 1, 1, tzinfo=UTC)
+END = datetime(2024, 2, 1, tzinfo=UTC)
+
+# tên truy vấn -> (câu lệnh giống route, index phải dùng)
+HOT_QUERIES: dict[str, tuple[Select, str]] = {
+    "list_scans_by_code": (
+        select(ScanEvent)
+        .where(ScanEvent.code_id == CODE_ID, ScanEvent.ts >= START, ScanEvent.ts <= END)
+        .order_by(ScanEvent.ts.desc())
+        .limit(500),
+        "ix_scan_events_code_id_ts",
+    ),
+    "list_scans_latest": (
+        select(ScanEvent).order_by(ScanEvent.ts.desc()).limit(500),
+        "ix_scan_events_ts",
+    ),
+    "export_by_code": (export_query(CODE_ID, START, END), "ix_scan_events_code_id_ts"),
+    "export_all_resume": (export_query(after_id=1), "ix_scan_events_ts"),
+    "qr_timeline_scans": (scan_branch(CODE_ID, 101), "ix_scan_events_code_id_ts"),
+    "qr_timeline_scans_after_cursor": (
+        scan_branch(CODE_ID, 101, TimelineCursor(kind=1, id=7), order="desc"),
+        "ix_scan_events_code_id_ts",
+    ),
+    "qr_timeline_reuse": (reuse_branch(CODE_ID, 101), "ix_reuse_history_code_id_ts_id"),
+    "qr_timeline_reuse_after_cursor": (
+        reuse_branch(CODE_ID, 101, TimelineCursor(kind=1, id=7)),
+        "ix_reuse_history_code_id_ts_id",
+    ),
+    "qr_total_scans": (
+        select(func.sum(ScanRollupDaily.count)).where(ScanRollupDaily.code_id == CODE_ID),
+        "ix_scan_rollups_daily_code",
+    ),
+    "list_active_qrcodes": (
+        select(QrCode).where(QrCode.active.is_(True)).order_by(QrCode.created_at.desc()).limit(100),
+        "ix_qrcodes_active_created_at",
+    ),
+    "list_qrcodes": (
+        select(QrCode).order_by(QrCode.created_at.desc()).limit(100),
+        "ix_qrcodes_created_at",
+    ),
+}
+
+
+def _sqlite_engine(tmp_path) -> Iterator[Engine]:
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'plans.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def _postgres_engine() -> Iterator[Engine]:
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL chưa được đặt")
+    schema = f"plans_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        Base.metadata.create_all(engine)
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def engine(request, tmp_path) -> Iterator[Engine]:
+    if request.param == "sqlite":
+        yield from _sqlite_engine(tmp_path)
+    else:
+        yield from _postgres_engine()
+
+
+def _sql(engine: Engine, statement: Select) -> str:
+    return str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+
+
+def _sqlite_problems(engine: Engine, statement: Select, index: str) -> list[str]:
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {_sql(engine, statement)}")
+        details = [row[-1] for row in rows]
+    problems = [
+        detail
+        for detail in details
+        if (detail.startswith("SCAN ") and " USING " not in detail) or "TEMP B-TREE" in detail
+    ]
+    if not any(index in detail for detail in details):
+        problems.append(f"không dùng {index}: {details}")
+    return problems
+
+
+def _plan_nodes(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def _postgres_problems(engine: Engine, statement: Select, index: str) -> list[str]:
+    with engine.connect() as conn:
+        # bảng rỗng thì planner luôn chọn seq scan; tắt đi để kiểm tra index có dùng được không
+        conn.execute(text("SET enable_seqscan = off"))
+        raw = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {_sql(engine, statement)}").scalar()
+    plan = raw if isinstance(raw, list) else json.loads(raw)
+    nodes = list(_plan_nodes(plan[0]["Plan"]))
+    problems = [node["Node Type"] for node in nodes if node["Node Type"] in ("Seq Scan", "Sort")]
+    if not any(node.get("Index Name") == index for node in nodes):
+        problems.append(f"không dùng {index}")
+    return problems
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_index(engine: Engine, name: str):
+    statement, index = HOT_QUERIES[name]
+    if engine.dialect.name == "sqlite":
+        problems = _sqlite_problems(engine, statement, index)
+    else:
+        problems = _postgres_problems(engine, statement, index)
+    assert not problems, f"{name}: {problems}"
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import uuid
+
+import pytest
+
+from app.core.config import settings
+
+pytest.importorskip("httpx")
+
+
+def _rows(text: str) -> list[list[str]]:
+    return list(csv.reader(io.StringIO(text)))
+
+
+def test_export_streams_csv_and_resumes(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "export_fetch_size", 2)
+    headers = auth_headers
+    qr_res = client.post("/api/qrcodes/generate", headers=headers, data={"data": "https://example.com/x"})
+    code_id = qr_res.json()["code_id"]
+    for _ in range(5):
+        assert client.post(f"/api/scan?code_id={code_id}").status_code == 200
+
+    plain = client.get("/api/export/scans.csv", headers={**headers, "Accept-Encoding": "identity"})
+    assert plain.status_code == 200
+    assert "content-encoding" not in plain.headers
+    rows = _rows(plain.text)
+    assert rows[0] == ["id", "code_id", "ts", "ip", "device", "approx_geo"]
+    ids = [int(row[0]) for row in rows[1:]]
+    assert ids == sorted(ids, reverse=True) and len(ids) == 5
+
+    gzipped = client.get("/api/export/scans.csv", headers={**headers, "Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.text == plain.text
+
+    resumed = client.get(
+        f"/api/export/scans.csv?resume_after={ids[1]}",
+        headers={**headers, "Accept-Encoding": "identity"},
+    )
+    assert [int(row[0]) for row in _rows(resumed.text)] == ids[2:]
+
+    missing = client.get("/api/export/scans.csv?resume_after=999999", headers=headers)
+    assert missing.status_code == 404
+
+
+def test_export_columnar_formats(client, auth_headers):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    qr_res = client.post(
+        "/api/qrcodes/generate", headers=auth_headers, data={"data": "https://example.com/y"}
+    )
+    code_id = qr_res.json()["code_id"]
+    for _ in range(3):
+        client.post(f"/api/scan?code_id={code_id}")
+
+    ndjson = client.get("/api/export/scans.ndjson", headers=auth_headers)
+    records = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert [record["code_id"] for record in records] == [code_id] * 3
+
+    arrow = client.get("/api/export/scans.arrow", headers=auth_headers)
+    assert arrow.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(arrow.content).read_all()
+    assert table.num_rows == 3
+    assert table.schema.field("ts").type == pa.timestamp("us", tz="UTC")
+    assert {uuid.UUID(bytes=value) for value in table.column("code_id").to_pylist()} == {
+        uuid.UUID(code_id)
+    }
+
+    parquet = client.get("/api/export/scans.parquet", headers=auth_headers)
+    assert "content-encoding" not in parquet.headers
+    parquet_table = pq.read_table(io.BytesIO(parquet.content))
+    assert parquet_table.column("id").to_pylist() == table.column("id").to_pylist()
+
+    assert client.get("/api/export/scans.xlsx", headers=auth_headers).status_code == 404
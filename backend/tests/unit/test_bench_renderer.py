@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from app.utils.bench_renderer import BenchCase, compare, run_case
+
+
+def test_run_case_in_process_reports_metrics():
+    result = run_case(BenchCase(mask="dense"), repeat=2)
+    assert result["outcome"] == "ok"
+    assert result["wall_ms_median"] > 0
+    assert result["png_bytes"] > 0 and result["svg_bytes"] > 0
+    assert "version_search" in result["stages_ms_median"]
+
+
+def test_compare_flags_regressions_over_tolerance():
+    baseline = {"results": {"a": {"outcome": "ok", "wall_ms_median": 10.0, "png_bytes": 100}}}
+    current = {"results": {"a": {"outcome": "ok", "wall_ms_median": 11.0, "png_bytes": 150}}}
+    regressions = compare(baseline, current, tolerance=0.2)
+    assert len(regressions) == 1 and "png_bytes" in regressions[0]
+
+    current["results"]["a"]["outcome"] = "rejected"
+    assert compare(baseline, current) == ["a: outcome ok -> rejected"]
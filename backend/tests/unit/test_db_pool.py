@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app.api.deps import get_db_session
+from app.db.pool import (
+    POOL_CHECKED_OUT,
+    POOL_TIMEOUTS,
+    POOL_WAIT_SECONDS,
+    InstrumentedQueuePool,
+    pool_stats,
+)
+
+
+def test_pool_reports_checkout_wait_and_timeouts(tmp_path):
+    engine = create_engine(
+        f"sqlite+pysqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+        pool_logging_name="unit",
+    )
+    _, _, waits_before = POOL_WAIT_SECONDS.snapshot(pool="unit")
+    timeouts_before = POOL_TIMEOUTS.value(pool="unit")
+
+    conn = engine.connect()
+    conn.execute(text("SELECT 1"))
+    assert POOL_CHECKED_OUT.value(pool="unit") == 1
+    assert pool_stats(engine.pool) == {
+        "class": "InstrumentedQueuePool",
+        "size": 1,
+        "checked_out": 1,
+        "overflow": 0,
+    }
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    conn.close()
+
+    assert POOL_CHECKED_OUT.value(pool="unit") == 0
+    assert POOL_TIMEOUTS.value(pool="unit") == timeouts_before + 1
+    assert POOL_WAIT_SECONDS.snapshot(pool="unit")[2] == waits_before + 2
+    engine.dispose()
+
+
+class _FakeSession:
+    closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+
+async def test_db_session_is_closed_when_request_ends():
+    session = _FakeSession()
+    dependency = get_db_session(session_factory=lambda: session)
+    assert await dependency.__anext__() is session
+    assert not session.closed
+    with pytest.raises(StopAsyncIteration):
+        await dependency.__anext__()
+    assert session.closed
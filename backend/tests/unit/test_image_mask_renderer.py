@@ -6,7 +6,7 @@ from pathlib import Path
 import pytest
 from PIL import Image
 
-from app.storage.local import storage
+from app.storage import storage
 from app.utils.qr_renderer import ImageMaskQrRenderer, decode_qr_image
 
 
@@ -64,3 +64,231 @@ def test_renderer_raises_on_empty_mask(tmp_path: Path):
     )
     with pytest.raises(ValueError):
         renderer.render()
+
+
+def _circle_mask_bytes(size: int = 64) -> bytes:
+    img = Image.new("L", (size, size), 255)
+    radius = size // 2 - 2
+    pixels = img.load()
+    for y in range(size):
+        for x in range(size):
+            if (x - size // 2) ** 2 + (y - size // 2) ** 2 <= radius**2:
+                pixels[x, y] = 0
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_vectorized_fitting_matches_pure_python(monkeypatch):
+    from app.utils import qr_renderer
+
+    if qr_renderer.np is None:
+        pytest.skip("numpy không khả dụng")
+    renderer = ImageMaskQrRenderer(
+        data="https://example.com/p/123",
+        ecc="M",
+        fg_color="#000000",
+        bg_color="#FFFFFF",
+        margin=4,
+        size=256,
+        mask_bytes=_circle_mask_bytes(),
+        logo_bytes=None,
+        threshold=128,
+    )
+    mask_image = renderer._load_mask()
+    for version in (2, 7, 25):
+        matrix = renderer._build_matrix(version)
+
+        renderer.vectorized = True
+        mask_np = renderer._mask_for_matrix(mask_image, len(matrix))
+        renderer._ensure_finder_allowed(mask_np)
+
+        renderer.vectorized = False
+        mask_py = renderer._mask_for_matrix(mask_image, len(matrix))
+        renderer._ensure_finder_allowed(mask_py)
+
+        assert mask_np.tolist() == mask_py
+        for check in (renderer._count_conflicts, renderer._allowed_modules):
+            assert check(matrix, mask_np) == check(matrix, mask_py)
+
+
+def test_renderer_pure_python_fallback(tmp_path: Path, monkeypatch):
+    from app.utils import qr_renderer
+
+    monkeypatch.setattr(qr_renderer, "np", None)
+    storage.base_dir = tmp_path
+    img = Image.new("L", (32, 32), 0)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    renderer = ImageMaskQrRenderer(
+        data="hello",
+        ecc="H",
+        fg_color="#000000",
+        bg_color="#FFFFFF",
+        margin=4,
+        size=128,
+        mask_bytes=buf.getvalue(),
+        logo_bytes=None,
+        threshold=128,
+    )
+    assert renderer.vectorized is False
+    result = renderer.render()
+    assert (tmp_path / result.png_path).exists()
+
+
+def test_version_search_starts_at_capacity_lower_bound(tmp_path: Path):
+    import qrcode
+
+    storage.base_dir = tmp_path
+    data = "x" * 300
+    renderer = ImageMaskQrRenderer(
+        data=data,
+        ecc="H",
+        fg_color="#000000",
+        bg_color="#FFFFFF",
+        margin=4,
+        size=256,
+        mask_bytes=None,
+        logo_bytes=None,
+    )
+    result = renderer.render()
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_H)
+    qr.add_data(data)
+    assert result.version == qr.best_fit()
+    assert result.candidates_evaluated == 1
+
+
+def test_count_conflicts_early_exit_respects_limit():
+    matrix = [[1] * 10 for _ in range(10)]
+    mask_bool = [[False] * 10 for _ in range(10)]
+    assert ImageMaskQrRenderer._count_conflicts(matrix, mask_bool) == 100
+    assert ImageMaskQrRenderer._count_conflicts(matrix, mask_bool, limit=5) > 5
+
+
+@pytest.mark.parametrize("ecc", ["L", "M", "Q", "H"])
+def test_capacity_table_matches_qrcode_best_fit(ecc: str):
+    import qrcode
+
+    from app.utils.qr_capacity import encode_payload
+    from app.utils.qr_renderer import ECC_MAP
+
+    payloads = [
+        "1" * 41,
+        "HELLO WORLD " * 9,
+        "https://example.com/" + "a" * 150,
+        '{"sku": "0123456789012345678901"}',
+    ]
+    for data in payloads:
+        qr = qrcode.QRCode(error_correction=ECC_MAP[ecc])
+        qr.add_data(data)
+        assert encode_payload(data, ECC_MAP[ecc]).min_version() == qr.best_fit()
+
+
+def test_build_matrix_matches_qrcode(tmp_path: Path):
+    import qrcode
+
+    renderer = ImageMaskQrRenderer(
+        data='{"product": "A", "sku": "SKU-001"}',
+        ecc="Q",
+        fg_color="#000000",
+        bg_color="#FFFFFF",
+        margin=2,
+        size=256,
+        mask_bytes=None,
+        logo_bytes=None,
+    )
+    for version in (renderer._min_version(), 9, 12):
+        qr = qrcode.QRCode(
+            version=version, error_correction=qrcode.constants.ERROR_CORRECT_Q, border=2
+        )
+        qr.add_data(renderer.data)
+        qr.make(fit=False)
+        assert renderer._build_matrix(version) == qr.get_matrix()
+
+
+def test_render_cache_hit_skips_search_and_encode(tmp_path: Path, monkeypatch):
+    from app.utils.render_cache import render_cache
+
+    storage.base_dir = tmp_path
+    params = dict(
+        data="https://example.com/sku/42",
+        ecc="H",
+        fg_color="#000000",
+        bg_color="#FFFFFF",
+        margin=4,
+        size=256,
+        mask_bytes=None,
+        logo_bytes=None,
+    )
+    fresh = ImageMaskQrRenderer(**params).render_artifacts()
+    assert fresh.cache_hit is False
+
+    hit = ImageMaskQrRenderer(**params)
+    monkeypatch.setattr(hit, "_fit", lambda: pytest.fail("fit must come from cache"))
+    monkeypatch.setattr(hit, "_encode", lambda fit: pytest.fail("encode must come from cache"))
+    cached = hit.render_artifacts()
+    assert cached.cache_hit is True
+    assert cached.png_bytes == fresh.png_bytes
+    assert cached.svg_bytes == fresh.svg_bytes
+
+    # Chỉ đổi màu: dùng lại kết quả fit, mã hoá lại ảnh
+    render_cache.clear()  # buộc đọc từ tầng đĩa
+    recolored = ImageMaskQrRenderer(**{**params, "fg_color": "#FF0000"})
+    monkeypatch.setattr(recolored, "_fit", lambda: pytest.fail("fit must come from cache"))
+    artifacts = recolored.render_artifacts()
+    assert artifacts.cache_hit is False
+    assert artifacts.version == fresh.version
+    assert artifacts.png_bytes != fresh.png_bytes
+
+
+@pytest.mark.parametrize("size", [256, 333])
+def test_png_is_palette_at_exact_size(size: int):
+    renderer = ImageMaskQrRenderer(
+        data="https://example.com/png",
+        ecc="M",
+        fg_color="#123456",
+        bg_color="#FFFFFF",
+        margin=4,
+        size=size,
+        mask_bytes=None,
+        logo_bytes=None,
+    )
+    artifacts = renderer.render_artifacts()
+    image = Image.open(io.BytesIO(artifacts.png_bytes))
+    assert image.size == (size, size)
+    assert image.mode == "P"
+    assert sorted(color for _, color in image.convert("RGB").getcolors()) == [
+        (0x12, 0x34, 0x56),
+        (0xFF, 0xFF, 0xFF),
+    ]
+
+    fit = renderer._fit()
+    vectorized = renderer._render_png(fit.modules).tobytes()
+    renderer.vectorized = False
+    assert renderer._render_png(fit.modules).tobytes() == vectorized
+
+
+def test_svg_path_covers_exactly_the_dark_modules():
+    import re
+
+    renderer = ImageMaskQrRenderer(
+        data="https://example.com/svg",
+        ecc="Q",
+        fg_color="#000000",
+        bg_color="#FFFFFF",
+        margin=4,
+        size=256,
+        mask_bytes=None,
+        logo_bytes=None,
+    )
+    modules = renderer._fit().modules
+    svg = renderer._render_svg(modules).decode("utf-8")
+    assert svg.count("<path") == 1 and "<rect x=" not in svg
+
+    covered = set()
+    for left, top, width, height, back in re.findall(r"M(\d+) (\d+)h(\d+)v(\d+)H(\d+)z", svg):
+        assert height == "4" and back == left
+        for x in range(int(left), int(left) + int(width), 4):
+            covered.add((x // 4 - renderer.margin, int(top) // 4 - renderer.margin))
+    expected = {(x, y) for y, row in enumerate(modules) for x, value in enumerate(row) if value}
+    assert covered == expected
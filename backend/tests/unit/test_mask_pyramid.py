@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import io
+
+from PIL import Image
+
+from app.utils.mask_pyramid import (
+    MaskPyramidRegistry,
+    binarize,
+    load_binary_mask,
+    mask_to_bool,
+    reserve_finders,
+)
+from app.utils.qr_renderer import ImageMaskQrRenderer
+
+
+def _gradient_mask_bytes(size: int = 48) -> bytes:
+    img = Image.new("L", (size, size))
+    img.putdata([(x * 255) // (size - 1) for y in range(size) for x in range(size)])
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_binarize_lut_matches_lambda():
+    image = Image.open(io.BytesIO(_gradient_mask_bytes())).convert("L")
+    expected = image.point(lambda x: 0 if x < 100 else 255, mode="L")
+    assert list(binarize(image, 100).getdata()) == list(expected.getdata())
+
+
+def test_pyramid_fitted_matches_direct_fit():
+    data = _gradient_mask_bytes()
+    registry = MaskPyramidRegistry(max_entries=2)
+    pyramid = registry.get(data, 100)
+    assert registry.get(data, 100) is pyramid
+
+    for vectorized in (True, False):
+        direct = mask_to_bool(load_binary_mask(data, 100), 33, vectorized)
+        reserve_finders(direct)
+        fitted = pyramid.fitted(0, 33, vectorized)
+        assert pyramid.fitted(0, 33, vectorized) is fitted
+        as_list = fitted.tolist() if vectorized else fitted
+        assert as_list == (direct.tolist() if vectorized else direct)
+
+
+def test_prebinarized_mask_renders_like_raw_mask():
+    raw = _gradient_mask_bytes()
+    buf = io.BytesIO()
+    load_binary_mask(raw, 250).save(buf, format="PNG")
+    common = dict(
+        data="https://example.com/m",
+        ecc="M",
+        fg_color="#000000",
+        bg_color="#FFFFFF",
+        margin=4,
+        size=128,
+        logo_bytes=None,
+    )
+    from_raw = ImageMaskQrRenderer(**common, mask_bytes=raw, threshold=250).render_artifacts()
+    from_library = ImageMaskQrRenderer(
+        **common, mask_bytes=buf.getvalue(), mask_binarized=True
+    ).render_artifacts()
+    assert from_library.version == from_raw.version
+    assert from_library.png_bytes == from_raw.png_bytes
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+import redis
+from fastapi import HTTPException
+
+from app.utils.rate_limit import CircuitBreaker, Limit, RateLimiter, RatePolicy
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # fakeredis cần lupa để chạy script Lua
+
+SCAN = RatePolicy(
+    "scan",
+    (
+        Limit(("ip", "code_id"), 2, algorithm="sliding_log"),
+        Limit(("ip",), 3),
+    ),
+)
+GENERATE = RatePolicy("generate", (Limit(("user",), 60, burst=2),))
+
+
+class CountingLimiter(RateLimiter):
+    """Đếm số round-trip Redis; ``down = True`` giả lập Redis mất kết nối."""
+
+    def __init__(self, policies, **kwargs):
+        super().__init__("redis://unused", policies, **kwargs)
+        self.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        self.round_trips = 0
+        self.down = False
+
+    async def _eval_many(self, calls):
+        self.round_trips += 1
+        if self.down:
+            raise redis.ConnectionError("down")
+        return await super()._eval_many(calls)
+
+
+async def _allowed(limiter: RateLimiter, policy: str, attempts: int, **context) -> int:
+    allowed = 0
+    for _ in range(attempts):
+        try:
+            await limiter.check(policy, **context)
+            allowed += 1
+        except HTTPException as exc:
+            assert exc.status_code == 429 and int(exc.headers["Retry-After"]) >= 1
+    return allowed
+
+
+async def test_all_limits_checked_in_one_round_trip_and_charged_only_when_all_pass():
+    limiter = CountingLimiter({"scan": SCAN})
+    assert await _allowed(limiter, "scan", 3, ip="1.1.1.1", code_id="a") == 2
+    # Redis báo hết lượt ngay ở lượt thứ hai: lượt thứ ba bị chặn mà không cần round-trip
+    assert limiter.round_trips == 2
+    # lượt bị chặn theo ip+code không bị tính vào limit theo ip
+    assert await _allowed(limiter, "scan", 2, ip="1.1.1.1", code_id="b") == 1
+    assert await _allowed(limiter, "scan", 1, ip="2.2.2.2", code_id="b") == 1
+    assert await limiter.client.zcard("rate:scan:ip+code_id:1.1.1.1:a") == 2
+
+
+async def test_gcra_allows_burst_then_spaces_requests():
+    limiter = CountingLimiter({"generate": GENERATE})
+    assert await _allowed(limiter, "generate", 3, user=1) == 2
+    with pytest.raises(HTTPException) as exc_info:
+        await limiter.check("generate", user=1)
+    assert exc_info.value.headers["Retry-After"] == "1"
+    # bị chặn thì không cần hỏi lại Redis cho tới khi hết Retry-After
+    assert limiter.round_trips == 2
+
+
+async def test_cost_charges_several_hits_at_once():
+    limiter = CountingLimiter({"generate": GENERATE})
+    await limiter.check("generate", cost=2, user=1)
+    with pytest.raises(HTTPException):
+        await limiter.check("generate", cost=1, user=1)
+    limiter.down = True
+    limiter.clear()
+    assert await _allowed(limiter, "generate", 1, user=2) == 1
+    with pytest.raises(HTTPException):
+        await limiter.check("generate", cost=60, user=2)
+
+
+async def test_local_tokens_absorb_traffic_and_flush_in_background():
+    policy = RatePolicy("login", (Limit(("ip",), 10, algorithm="sliding_log"),))
+    limiter = CountingLimiter({"login": policy}, local_share=0.5)
+    assert await _allowed(limiter, "login", 5, ip="a") == 5
+    assert limiter.round_trips == 0
+    await limiter._flush_task
+    assert limiter.round_trips == 1
+    assert await limiter.client.zcard("rate:login:ip:a") == 5
+
+    # hết token: phải hỏi Redis, và vẫn giữ đúng giới hạn chung
+    assert await _allowed(limiter, "login", 10, ip="a") == 5
+    await asyncio.gather(limiter._flush_task)
+    assert await limiter.client.zcard("rate:login:ip:a") == 10
+
+
+async def test_breaker_falls_back_locally_and_probes_after_backoff():
+    policy = RatePolicy("login", (Limit(("ip",), 2, algorithm="sliding_log"),))
+    breaker = CircuitBreaker(2, base_backoff=0.05, max_backoff=1)
+    limiter = CountingLimiter({"login": policy}, breaker=breaker)
+    limiter.down = True
+    assert await _allowed(limiter, "login", 5, ip="k") == 2  # bộ đếm in-memory vẫn giữ giới hạn
+    assert limiter.round_trips == 2
+    assert limiter.breaker.is_open
+
+    limiter.down = False
+    await asyncio.sleep(0.06)
+    assert await _allowed(limiter, "login", 1, ip="other") == 1
+    assert not limiter.breaker.is_open
+    assert limiter.round_trips == 3
+
+
+@pytest.mark.parametrize("failures, expected", [(2, 1.0), (3, 2.0), (6, 10.0)])
+def test_breaker_backoff_doubles_up_to_max(monkeypatch, failures, expected):
+    monkeypatch.setattr("app.utils.rate_limit.time.monotonic", lambda: 100.0)
+    breaker = CircuitBreaker(2, base_backoff=1.0, max_backoff=10.0)
+    for _ in range(failures):
+        breaker.record_failure()
+    assert breaker._retry_at == 100.0 + expected
+
+
+async def test_pending_hits_stay_bounded_while_redis_is_down():
+    policy = RatePolicy("scan", (Limit(("ip",), 10, algorithm="sliding_log"),))
+    breaker = CircuitBreaker(2, base_backoff=60, max_backoff=60)
+    limiter = CountingLimiter(
+        {"scan": policy}, local_share=0.5, breaker=breaker, local_max_entries=10
+    )
+    limiter.down = True
+    for index in range(200):
+        await limiter.check("scan", ip=f"10.0.0.{index}")
+        await asyncio.sleep(0)
+    await asyncio.gather(limiter._flush_task)
+    assert limiter.breaker.is_open
+    assert len(limiter._pending) <= 10
+    assert len(limiter._tokens) <= 10
+
+
+async def test_open_breaker_decides_every_request_with_fallback_counter():
+    policy = RatePolicy("scan", (Limit(("ip", "code_id"), 30, algorithm="sliding_log"),))
+    breaker = CircuitBreaker(1, base_backoff=60, max_backoff=60)
+    limiter = CountingLimiter({"scan": policy}, local_share=0.5, breaker=breaker)
+    breaker.record_failure()
+    # token cục bộ không được dùng khi mạch mở: giới hạn giữ đúng 30 lượt
+    assert await _allowed(limiter, "scan", 36, ip="1.1.1.1", code_id="a") == 30
+    assert limiter.round_trips == 0
+    assert len(limiter._pending) == 0
+    assert len(limiter._fallback[60.0]) == 1
+
+    # hết backoff: lượt kế đi thẳng tới Redis (dù còn token cục bộ) và đóng mạch
+    breaker._retry_at = 0.0
+    assert await _allowed(limiter, "scan", 1, ip="2.2.2.2", code_id="a") == 1
+    assert limiter.round_trips == 1
+    assert not breaker.is_open
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from app.utils import render_cache as render_cache_module
+from app.utils.render_cache import RenderCache, content_key
+
+
+def test_keys_change_with_renderer_version(monkeypatch):
+    key = content_key("artifacts", "https://example.com", b"logo")
+    assert content_key("artifacts", "https://example.com", b"logo") == key
+    monkeypatch.setattr(render_cache_module, "RENDERER_VERSION", 10_000)
+    assert content_key("artifacts", "https://example.com", b"logo") != key
+
+
+def test_ram_tier_is_bounded_by_bytes():
+    cache = RenderCache(None, max_entries=100, disk_max_bytes=0, max_bytes=250)
+    for i in range(4):
+        cache.put(f"k{i}", {}, {"png": bytes(100)})
+    # 4 entry x 100 byte > 250: chỉ giữ 2 entry mới nhất
+    assert [cache.get(f"k{i}") is not None for i in range(4)] == [False, False, True, True]
+    cache.put("huge", {}, {"png": bytes(1000)})
+    assert cache.get("huge") is None
+    assert cache.get("k3") is not None
+
+
+def test_disk_is_scanned_only_when_tracked_size_exceeds_limit(tmp_path: Path, monkeypatch):
+    cache = RenderCache(tmp_path, max_entries=0, disk_max_bytes=100_000)
+    scans = []
+    prune_disk = cache.prune_disk
+
+    def counting_prune() -> None:
+        scans.append(1)
+        prune_disk()
+
+    monkeypatch.setattr(cache, "prune_disk", counting_prune)
+    for i in range(200):
+        cache.put(f"{i:03x}entry", {"i": i}, {"png": bytes(1000)})
+    # lần ghi đầu quét để biết dung lượng sẵn có; sau đó mỗi lần quét dọn ~10% giới hạn
+    assert len(scans) <= 15
+    total = sum(path.stat().st_size for path in tmp_path.glob("*/*"))
+    assert total <= 100_000
+    # entry mới nhất còn, entry cũ nhất đã bị dọn
+    assert cache.get(f"{199:03x}entry") is not None
+    assert cache.get("000entry") is None
+
+
+def test_disk_tier_is_not_served_from_upload_dir():
+    assert not render_cache_module.settings.render_cache_dir.is_relative_to(
+        render_cache_module.settings.upload_dir
+    )
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import json
+import logging
+from pathlib import Path
+
+from app.core.logging import JsonFormatter
+from app.core.metrics import Histogram
+from app.storage import storage
+from app.utils.qr_renderer import RENDER_STAGE_SECONDS, ImageMaskQrRenderer
+
+
+def _renderer(**overrides) -> ImageMaskQrRenderer:
+    params = dict(
+        data="https://example.com/metrics",
+        ecc="M",
+        fg_color="#000000",
+        bg_color="#FFFFFF",
+        margin=4,
+        size=256,
+        mask_bytes=None,
+        logo_bytes=None,
+    )
+    params.update(overrides)
+    return ImageMaskQrRenderer(**params)
+
+
+def test_render_result_carries_stage_timings_and_counters(tmp_path: Path, caplog):
+    storage.base_dir = tmp_path
+    _, _, before = RENDER_STAGE_SECONDS.snapshot(stage="png")
+
+    with caplog.at_level(logging.INFO, logger="app.utils.qr_renderer"):
+        result = _renderer().render()
+
+    stages = {"cache_lookup", "version_search", "png", "png_encode", "svg", "storage"}
+    assert stages <= set(result.timings)
+    assert result.counters["candidates_evaluated"] == result.candidates_evaluated >= 1
+    assert result.counters["cache_hit"] == 0
+    assert result.counters["files_written"] == 2
+    written = sum((tmp_path / path).stat().st_size for path in (result.png_path, result.svg_path))
+    assert result.counters["bytes_written"] == written
+    assert RENDER_STAGE_SECONDS.snapshot(stage="png")[2] == before + 1
+
+    record = next(r for r in caplog.records if r.getMessage() == "qr_render")
+    document = json.loads(JsonFormatter().format(record))
+    assert document["code_id"] == str(result.code_id)
+    assert document["counters"]["bytes_written"] == written
+    assert "png" in document["timings_ms"]
+
+    cached = _renderer().render()
+    assert cached.counters["cache_hit"] == 1
+    assert "version_search" not in cached.timings
+
+
+def test_profile_mode_attaches_cprofile_stats(tmp_path: Path):
+    storage.base_dir = tmp_path
+    artifacts = _renderer(profile=True, size=300).render_artifacts()
+    assert artifacts.profile and "_render_artifacts" in artifacts.profile
+
+
+def test_histogram_prometheus_text():
+    histogram = Histogram("demo_seconds", "demo", buckets=(0.1, 1.0), labelnames=("stage",))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5, stage="a")
+    lines = histogram.render()
+    assert 'demo_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'demo_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{stage="a"} 3' in lines
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from app.services import render_pool as render_pool_module
+from app.services.render_pool import RenderPool, RenderQueueFull
+from app.utils.qr_renderer import render_artifacts_job
+
+PARAMS = {
+    "data": "https://example.com",
+    "ecc": "M",
+    "fg_color": "#000000",
+    "bg_color": "#FFFFFF",
+    "margin": 4,
+    "size": 128,
+    "mask_bytes": None,
+    "logo_bytes": None,
+}
+
+
+async def test_render_pool_process_worker_returns_artifacts():
+    pool = RenderPool(workers=1, queue_size=0)
+    try:
+        artifacts = await pool.render(PARAMS)
+    finally:
+        pool.shutdown()
+    assert artifacts.png_bytes.startswith(b"\x89PNG")
+    assert artifacts.svg_bytes.startswith(b"<svg")
+    assert pool.pending == 0
+
+
+async def test_render_pool_rejects_when_queue_full():
+    pool = RenderPool(workers=0, queue_size=0)
+    try:
+        first = asyncio.create_task(pool.render(PARAMS))
+        await asyncio.sleep(0)
+        with pytest.raises(RenderQueueFull):
+            await pool.render(PARAMS)
+        await first
+    finally:
+        pool.shutdown()
+    assert pool.pending == 0
+
+
+async def test_render_many_yields_every_job():
+    pool = RenderPool(workers=0, queue_size=0)
+    params_list = [{**PARAMS, "data": f"https://example.com/{i}"} for i in range(5)]
+    try:
+        results = [item async for item in pool.render_many(params_list)]
+    finally:
+        pool.shutdown()
+    assert sorted(index for index, _ in results) == list(range(5))
+    assert pool.pending == 0
+
+
+async def test_render_many_waits_for_slots_instead_of_exceeding_capacity():
+    pool = RenderPool(workers=0, queue_size=0)
+    params_list = [{**PARAMS, "data": f"https://example.com/{i}"} for i in range(3)]
+    try:
+        single = asyncio.create_task(pool.render(PARAMS))
+        await asyncio.sleep(0)
+        assert pool.full
+        seen = []
+        async for index, _ in pool.render_many(params_list):
+            seen.append(index)
+            assert pool.pending <= pool.capacity
+        await single
+    finally:
+        pool.shutdown()
+    assert sorted(seen) == [0, 1, 2]
+    assert pool.pending == 0
+
+
+async def test_cancelled_request_keeps_slot_until_job_finishes(monkeypatch):
+    started, finish = threading.Event(), threading.Event()
+
+    def slow_job(params):
+        started.set()
+        finish.wait(5)
+        return render_artifacts_job(params)
+
+    monkeypatch.setattr(render_pool_module, "render_artifacts_job", slow_job)
+    pool = RenderPool(workers=0, queue_size=0)
+    try:
+        request = asyncio.create_task(pool.render(PARAMS))
+        await asyncio.to_thread(started.wait, 5)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        # worker vẫn đang render: request mới phải bị từ chối thay vì chồng thêm job
+        assert pool.pending == 1
+        with pytest.raises(RenderQueueFull):
+            await pool.render(PARAMS)
+        finish.set()
+        await asyncio.to_thread(pool.shutdown)
+    finally:
+        finish.set()
+        pool.shutdown()
+    assert pool.pending == 0
+
+
+async def test_executor_creation_failure_does_not_leak_a_slot(monkeypatch):
+    pool = RenderPool(workers=0, queue_size=0)
+
+    def broken_executor():
+        raise OSError("no processes")
+
+    monkeypatch.setattr(pool, "_get_executor", broken_executor)
+    for _ in range(2):
+        with pytest.raises(OSError):
+            await pool.render(PARAMS)
+    assert pool.pending == 0
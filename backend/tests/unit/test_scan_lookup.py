@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import uuid
+
+import pytest
+
+from app.services.scan_lookup import ScanLookupCache
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def first(self):
+        return self.value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeDb:
+    """Trả lời SELECT qrcodes/products từ dict và đếm số round-trip."""
+
+    def __init__(self):
+        self.codes: dict[uuid.UUID, tuple] = {}
+        self.products: dict[int, str] = {}
+        self.queries = 0
+        # chạy sau khi đã đọc xong, trước khi trả kết quả (giả lập lần ghi chen giữa lượt đọc)
+        self.after_read = None
+
+    async def execute(self, statement):
+        self.queries += 1
+        result = self._answer(statement)
+        if self.after_read is not None:
+            hook, self.after_read = self.after_read, None
+            await hook()
+        return result
+
+    def _answer(self, statement):
+        table = statement.get_final_froms()[0].name
+        value = statement.whereclause.right.value
+        if table == "qrcodes":
+            return _Result(self.codes.get(value))
+        return _Result(self.products.get(value))
+
+
+async def test_read_through_then_zero_round_trips_until_invalidated():
+    db = FakeDb()
+    code_id = uuid.uuid4()
+    db.codes[code_id] = (True, 0, 7, None)
+    db.products[7] = "Sản phẩm A"
+    cache = ScanLookupCache(ttl=60, max_entries=100)
+
+    target = await cache.get(db, code_id)
+    assert (target.active, target.reuse_cycle, target.product_name) == (True, 0, "Sản phẩm A")
+    assert db.queries == 2
+    assert await cache.get(db, code_id) == target
+    assert db.queries == 2
+
+    db.codes[code_id] = (True, 1, 7, None)
+    await cache.invalidate_code(code_id)
+    assert (await cache.get(db, code_id)).reuse_cycle == 1
+    assert db.queries == 3  # tên sản phẩm vẫn lấy từ cache
+
+    db.products[7] = "Sản phẩm B"
+    await cache.invalidate_product(7)
+    assert (await cache.get(db, code_id)).product_name == "Sản phẩm B"
+    assert db.queries == 4
+
+
+async def test_missing_codes_are_cached_and_lru_is_bounded():
+    db = FakeDb()
+    cache = ScanLookupCache(ttl=60, max_entries=2)
+    unknown = uuid.uuid4()
+    assert await cache.get(db, unknown) is None
+    assert await cache.get(db, unknown) is None
+    assert db.queries == 1
+
+    for _ in range(3):
+        code_id = uuid.uuid4()
+        db.codes[code_id] = (False, 0, None, None)
+        await cache.get(db, code_id)
+    assert len(cache.codes) == 2
+
+
+async def test_expired_entries_are_reloaded():
+    db = FakeDb()
+    code_id = uuid.uuid4()
+    db.codes[code_id] = (True, 0, None, None)
+    cache = ScanLookupCache(ttl=0, max_entries=10)
+    await cache.get(db, code_id)
+    await cache.get(db, code_id)
+    assert db.queries == 2
+
+
+async def test_write_committed_during_read_is_not_overwritten_by_stale_value():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # fakeredis cần lupa để chạy script Lua
+    redis_client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    db = FakeDb()
+    code_id = uuid.uuid4()
+    db.codes[code_id] = (True, 0, None, None)
+    cache = ScanLookupCache(ttl=60, max_entries=10, redis_url="redis://unused")
+    cache.client = redis_client
+
+    async def start_reuse_cycle():
+        db.codes[code_id] = (True, 1, None, None)
+        await cache.invalidate_code(code_id)
+
+    db.after_read = start_reuse_cycle
+    # lượt đọc này thấy dữ liệu trước khi ghi nhưng không được để lại nó trong cache
+    assert (await cache.get(db, code_id)).reuse_cycle == 0
+    assert await redis_client.get(f"scanlookup:code:{code_id}") is None
+    assert (await cache.get(db, code_id)).reuse_cycle == 1
+    assert db.queries == 2
+
+    # lượt đọc thường ghi vào Redis: worker khác không cần hỏi DB
+    fresh = ScanLookupCache(ttl=60, max_entries=10, redis_url="redis://unused")
+    fresh.client = redis_client
+    assert (await fresh.get(db, code_id)).reuse_cycle == 1
+    assert db.queries == 2
+
+
+async def test_redis_down_falls_back_to_database():
+    fakeredis = pytest.importorskip("fakeredis")
+    db = FakeDb()
+    code_id = uuid.uuid4()
+    db.codes[code_id] = (True, 0, None, None)
+    cache = ScanLookupCache(ttl=60, max_entries=10, redis_url="redis://unused")
+    cache.client = fakeredis.aioredis.FakeRedis(connected=False)
+    assert (await cache.get(db, code_id)).active
+    await cache.invalidate_code(code_id)
+    assert (await cache.get(db, code_id)).active
+    assert db.queries == 2
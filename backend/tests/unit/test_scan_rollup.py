@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import uuid
+from datetime import UTC, date, datetime
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+import app.models  # noqa: F401 - đăng ký toàn bộ bảng
+from app.db.base import Base
+from app.models.qrcode import QrCode
+from app.models.scan_event import ScanEvent
+from app.models.scan_rollup import ScanRollupDaily, ScanRollupHourly
+from app.services.scan_rollup import compact, rollup_writes
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'rollup.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def _utc(*args: int) -> datetime:
+    return datetime(*args, tzinfo=UTC)
+
+
+def _ingest(
+    db: Session,
+    code_id: uuid.UUID,
+    stamps: list[tuple[datetime, str | None]],
+    product_id: int | None = 7,
+) -> None:
+    events = [
+        {"code_id": code_id, "ts": ts, "device": device, "product_id": product_id, "customer_id": 3}
+        for ts, device in stamps
+    ]
+    db.execute(insert(ScanEvent), events)
+    for statement, params in rollup_writes("sqlite", events):
+        db.execute(statement, params)
+    db.commit()
+
+
+def _rollups(db: Session, model) -> dict[tuple, int]:
+    rows = db.execute(select(model.bucket, model.device, model.product_id, model.count))
+    return {(bucket, device, product_id): count for bucket, device, product_id, count in rows}
+
+
+def _add_code(db: Session) -> QrCode:
+    qrcode = QrCode(
+        id=uuid.uuid4(),
+        product_id=7,
+        customer_id=3,
+        version=1,
+        image_path_png="a.png",
+        image_path_svg="a.svg",
+    )
+    db.add(qrcode)
+    db.commit()
+    return qrcode
+
+
+def test_ingest_upserts_and_compact_rebuilds_the_same_rollups(db):
+    code_id = _add_code(db).id
+    _ingest(db, code_id, [(_utc(2024, 5, 1, 10, m), "mobile") for m in (5, 50)])
+    _ingest(db, code_id, [(_utc(2024, 5, 1, 10, 59), "mobile"), (_utc(2024, 5, 1, 23, 1), None)])
+    _ingest(db, code_id, [(_utc(2024, 5, 2, 0, 30), "desktop")])
+
+    hourly = _rollups(db, ScanRollupHourly)
+    daily = _rollups(db, ScanRollupDaily)
+    assert hourly[(datetime(2024, 5, 1, 10), "mobile", 7)] == 3
+    assert hourly[(datetime(2024, 5, 1, 23), "unknown", 7)] == 1
+    assert daily == {
+        (date(2024, 5, 1), "mobile", 7): 3,
+        (date(2024, 5, 1), "unknown", 7): 1,
+        (date(2024, 5, 2), "desktop", 7): 1,
+    }
+
+    # xoá rollup rồi tính lại từ scan_events: ngày 2/5 chưa trọn nên chỉ có rollup giờ
+    db.query(ScanRollupHourly).delete()
+    db.query(ScanRollupDaily).delete()
+    db.commit()
+    assert compact(db, _utc(2024, 5, 1), _utc(2024, 5, 2, 12)) == (3, 2)
+    assert _rollups(db, ScanRollupHourly) == hourly
+    assert _rollups(db, ScanRollupDaily) == {
+        key: count for key, count in daily.items() if key[0] == date(2024, 5, 1)
+    }
+    # chạy lại không nhân đôi số đếm
+    compact(db, _utc(2024, 5, 1), _utc(2024, 5, 2, 12))
+    assert _rollups(db, ScanRollupHourly) == hourly
+
+
+def test_reassigned_code_keeps_scans_with_the_owner_at_scan_time(db):
+    qrcode = _add_code(db)
+    _ingest(db, qrcode.id, [(_utc(2024, 5, 1, 10, 5), "mobile")])
+    # gán lại mã cho sản phẩm khác giữa giờ, rồi cho mã không gán
+    qrcode.product_id = 8
+    db.commit()
+    _ingest(db, qrcode.id, [(_utc(2024, 5, 1, 10, 20), "mobile")], product_id=8)
+    _ingest(db, qrcode.id, [(_utc(2024, 5, 1, 10, 40), "mobile")], product_id=None)
+
+    expected = {
+        (datetime(2024, 5, 1, 10), "mobile", 7): 1,
+        (datetime(2024, 5, 1, 10), "mobile", 8): 1,
+        (datetime(2024, 5, 1, 10), "mobile", 0): 1,
+    }
+    assert _rollups(db, ScanRollupHourly) == expected
+    # compact lấy chủ sở hữu từ scan_events, không phải chủ hiện tại của mã
+    compact(db, _utc(2024, 5, 1), _utc(2024, 5, 2))
+    assert _rollups(db, ScanRollupHourly) == expected
+    assert _rollups(db, ScanRollupDaily) == {
+        (date(2024, 5, 1), "mobile", product_id): 1 for product_id in (7, 8, 0)
+    }
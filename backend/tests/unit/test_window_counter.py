@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import threading
+
+from app.utils.window_counter import SlidingWindowCounter
+
+
+def test_sliding_estimate_carries_previous_window_without_edge_burst():
+    counter = SlidingWindowCounter(window=60, max_entries=100, stripes=1)
+    for _ in range(30):
+        counter.hit("k", now=59.0)
+    # ngay sau mép cửa sổ: gần như toàn bộ 30 lượt trước vẫn được tính
+    assert counter.hit("k", now=60.0) == 31
+    assert counter.hit("k", now=90.0) == 15 + 2
+    # bỏ qua hẳn một cửa sổ thì không còn gì từ quá khứ
+    assert counter.hit("k", now=181.0) == 1
+
+
+def test_entries_are_capped_and_stale_keys_evicted():
+    striped = SlidingWindowCounter(window=60, max_entries=8, stripes=2)
+    for i in range(1000):
+        striped.hit(f"ip-{i}", now=10.0)
+    assert len(striped) <= 8
+
+    counter = SlidingWindowCounter(window=60, max_entries=8, stripes=1)
+    for i in range(1000):
+        counter.hit(f"ip-{i}", now=10.0)
+    assert len(counter) == 8
+    counter.hit("fresh", now=75.0)
+    assert len(counter) == 8  # cửa sổ trước vẫn còn ảnh hưởng tới ước lượng: chưa bỏ
+    counter.hit("fresh", now=200.0)
+    assert len(counter) == 1
+
+
+def test_concurrent_hits_are_counted_exactly():
+    counter = SlidingWindowCounter(window=60, max_entries=1000, stripes=4)
+
+    def worker():
+        for i in range(500):
+            counter.hit(f"k{i % 10}", now=30.0)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.hit("k0", now=30.0) == 8 * 50 + 1